@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import shutil
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import AsyncIterator, BinaryIO, Callable, List, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.api.routes.measure import _record_failure, _render_options, _store_handles, _validate_points
+from app.services.annotate import RenderOptions
+from app.services.pipeline import ANNOTATE_MODES, MeasurementError, run_measurement
+from app.core.config import settings
+from app.core.executor import ExecutorBusyError, pipeline_executor
+from app.core.metrics import record_measurement
+from app.core.logging import get_logger
+
+router = APIRouter()
+log = get_logger("measure_batch")
+
+_IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+_MANIFEST = "manifest.json"
+
+
+class _ItemTooLargeError(Exception):
+    pass
+
+
+@dataclass
+class _BatchItem:
+    index: int
+    filename: str
+    read: Callable[[], bytes]  # blocking; called off the event loop
+    spec: dict = field(default_factory=dict)
+
+
+@router.post("/measure/batch")
+async def measure_batch(
+    images: List[UploadFile] = File(default_factory=list),
+    archive: Optional[UploadFile] = File(None),
+    items_json: str | None = Form(None),
+    mode: str = Form("auto"),
+    annotate: str = Form("none"),
+    annotate_max_dim: int | None = Form(None),
+    annotate_format: str | None = Form(None),
+    annotate_quality: int | None = Form(None),
+):
+    """
+    Measure many images in one request and stream one NDJSON line per image
+    as soon as it finishes (completion order, not upload order).
+
+    Images come as repeated `images` parts and/or a zip `archive`. Per-item
+    settings come from `items_json` (or manifest.json inside the archive): a
+    list of {"file"?, "mode"?, "points"?, "annotate"?} matched by file name,
+    else by position; `mode` and `annotate` are the defaults. Each line is
+    {"index", "filename", "status", "result" | "detail"}.
+
+    Up to GM_PIPELINE_WORKERS items run at once, so a batch never trips the
+    executor's queue bound; with GM_GAP_SCHEDULER the concurrent items share
+    model batches. Uploads are closed once this handler returns, so they are
+    first spooled to temp files owned by the response stream.
+    """
+    specs: Optional[list] = None
+    if items_json is not None:
+        try:
+            specs = json.loads(items_json)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid items_json")
+
+    if len(images) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_items} images per batch")
+    render = _render_options(annotate_max_dim, annotate_format, annotate_quality)
+
+    owned: list[BinaryIO] = []
+    try:
+        sources: list[tuple[str, Callable[[], bytes]]] = []
+        if archive is not None:
+            spooled = await _spool(archive)
+            owned.append(spooled)
+            archive_specs, archive_sources = _open_archive(spooled)
+            specs = specs if specs is not None else archive_specs
+            sources.extend(archive_sources)
+        for upload in images:
+            spooled = await _spool(upload)
+            owned.append(spooled)
+            sources.append((upload.filename or f"image-{len(sources)}", _file_reader(spooled)))
+
+        if not sources:
+            raise HTTPException(status_code=400, detail="No images supplied")
+        if len(sources) > settings.batch_max_items:
+            raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_items} images per batch")
+        if specs is not None and not isinstance(specs, list):
+            raise HTTPException(status_code=400, detail="items_json must be a JSON list")
+    except BaseException:
+        _close_all(owned)
+        raise
+
+    items = [
+        _BatchItem(index=i, filename=name, read=reader, spec=_match_spec(specs, i, name))
+        for i, (name, reader) in enumerate(sources)
+    ]
+    return StreamingResponse(
+        _stream_results(items, mode, annotate, render, owned),
+        media_type="application/x-ndjson",
+    )
+
+
+async def _stream_results(
+    items: List[_BatchItem],
+    default_mode: str,
+    default_annotate: str,
+    render: RenderOptions,
+    owned: List[BinaryIO],
+) -> AsyncIterator[bytes]:
+    slots = asyncio.Semaphore(max(1, settings.pipeline_workers))
+
+    async def run_one(item: _BatchItem) -> dict:
+        async with slots:
+            return await _measure_item(item, default_mode, default_annotate, render)
+
+    tasks = [asyncio.create_task(run_one(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            yield (json.dumps(line) + "\n").encode("utf-8")
+    finally:
+        # Client went away: items not yet handed to the executor never start.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        _close_all(owned)
+
+
+async def _measure_item(item: _BatchItem, default_mode: str, default_annotate: str, render: RenderOptions) -> dict:
+    line: dict = {"index": item.index, "filename": item.filename}
+    try:
+        mode = str(item.spec.get("mode", default_mode))
+        if mode not in ("2", "4", "auto"):
+            raise HTTPException(status_code=400, detail="mode must be '2', '4', or 'auto'")
+        points = _validate_points(mode, item.spec.get("points") or []) if mode in ("2", "4") else []
+        annotate = str(item.spec.get("annotate", default_annotate))
+        if annotate not in ANNOTATE_MODES:
+            raise HTTPException(status_code=400, detail="annotate must be 'none', 'inline' or 'deferred'")
+
+        data = await asyncio.to_thread(item.read)
+        output = await pipeline_executor.run(run_measurement, data, mode, points, render, True, annotate)
+    except HTTPException as exc:
+        return {**line, "status": exc.status_code, "detail": exc.detail}
+    except MeasurementError as exc:
+        _record_failure(mode, exc.status_code)
+        return {**line, "status": exc.status_code, "detail": exc.detail}
+    except _ItemTooLargeError as exc:
+        return {**line, "status": 413, "detail": str(exc)}
+    except ExecutorBusyError as exc:
+        return {**line, "status": 503, "detail": str(exc)}
+    except Exception:
+        log.exception("batch item %d (%s) failed", item.index, item.filename)
+        return {**line, "status": 500, "detail": "Measurement failed"}
+
+    _store_handles(output)
+    if settings.metrics_enabled:
+        record_measurement(mode, output.timings)
+    return {**line, "status": 200, "result": output.response.model_dump()}
+
+
+def _match_spec(specs: Optional[list], index: int, filename: str) -> dict:
+    if not specs:
+        return {}
+    for spec in specs:
+        if isinstance(spec, dict) and spec.get("file") == filename:
+            return spec
+    if index < len(specs) and isinstance(specs[index], dict) and "file" not in specs[index]:
+        return specs[index]
+    return {}
+
+
+async def _spool(upload: UploadFile) -> BinaryIO:
+    def copy() -> BinaryIO:
+        out = tempfile.TemporaryFile()
+        upload.file.seek(0)
+        shutil.copyfileobj(upload.file, out)
+        return out
+
+    return await asyncio.to_thread(copy)
+
+
+def _close_all(files: List[BinaryIO]) -> None:
+    for f in files:
+        f.close()
+
+
+def _file_reader(f: BinaryIO) -> Callable[[], bytes]:
+    def read() -> bytes:
+        # Each image has its own file, and an item is read by one task only.
+        f.seek(0)
+        return f.read()
+
+    return read
+
+
+def _open_archive(archive: BinaryIO) -> tuple[Optional[list], list[tuple[str, Callable[[], bytes]]]]:
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+
+    specs = None
+    members = [
+        info for info in zf.infolist()
+        if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+    ]
+    manifest = next((info for info in members if info.filename == _MANIFEST), None)
+    if manifest is not None:
+        try:
+            raw = json.loads(zf.read(manifest))
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid manifest.json in archive")
+        specs = raw.get("items") if isinstance(raw, dict) else raw
+
+    max_bytes = settings.batch_max_item_mb * 1024 * 1024
+    sources = []
+    for info in sorted(members, key=lambda i: i.filename):
+        if not info.filename.lower().endswith(_IMAGE_SUFFIXES):
+            continue
+
+        def read(info: zipfile.ZipInfo = info) -> bytes:
+            # Declared size is checked before inflating anything.
+            if info.file_size > max_bytes:
+                raise _ItemTooLargeError(f"{info.filename} exceeds {settings.batch_max_item_mb} MB")
+            return zf.read(info)
+
+        sources.append((info.filename, read))
+    return specs, sources
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+
+from fastapi import APIRouter, File, Form, Header, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.api.routes.measure import _annotate_mode, _parse_points, _record_failure, _render_options, _store_handles
+from app.schemas.jobs import JobStatus
+from app.services.jobs import Job, JobQueueFullError, job_manager
+from app.services.pipeline import MeasurementError, ProgressFn, run_measurement
+from app.core.config import settings
+from app.core.metrics import record_measurement
+from app.core.logging import get_logger
+
+router = APIRouter()
+log = get_logger("jobs")
+
+_KEEPALIVE_S = 15.0
+
+
+@router.post("/jobs/measure", response_model=JobStatus, status_code=202)
+async def submit_measure_job(
+    image: UploadFile = File(...),
+    mode: str = Form(...),
+    points_json: str | None = Form(None),
+    annotate_max_dim: int | None = Form(None),
+    annotate_format: str | None = Form(None),
+    annotate_quality: int | None = Form(None),
+    annotate: str | None = Form(None),
+    keep_prob_map: bool = Form(False),
+):
+    """
+    Same inputs as POST /measure, but returns a job immediately. Poll
+    GET /jobs/{id}, or follow GET /jobs/{id}/events (SSE) for stage progress.
+    Finished jobs are retained for a while, so annotation defaults to
+    deferred: the image waits in the byte-bounded annotation store
+    (GET /measure/{annotation_id}/annotation) rather than in the job.
+    """
+    points = _parse_points(mode, points_json)
+    render = _render_options(annotate_max_dim, annotate_format, annotate_quality)
+    if annotate is None and settings.annotate_mode == "inline":
+        annotate = "deferred"
+    annotate = _annotate_mode(annotate)
+    data = await image.read()
+
+    def work(progress: ProgressFn):
+        try:
+            output = run_measurement(data, mode, points, render, True, annotate, keep_prob_map, progress)
+        except MeasurementError as exc:
+            _record_failure(mode, exc.status_code)
+            raise
+        _store_handles(output)
+        if settings.metrics_enabled:
+            record_measurement(mode, output.timings)
+        return output.response
+
+    try:
+        job = job_manager.submit(work)
+    except JobQueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    return _status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    return _status(_get(job_id))
+
+
+@router.delete("/jobs/{job_id}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """Queued jobs are cancelled at once; running ones stop at their next stage or tile batch."""
+    _get(job_id)
+    return _status(job_manager.cancel(job_id))
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: str | None = Header(None)):
+    """
+    Server-sent events, one per stage (queued, running, decoded, markers,
+    homography, tiles, quads, measured, annotated) and a final succeeded /
+    failed / cancelled event, after which the stream ends. Reconnecting with
+    Last-Event-ID resumes after that event.
+    """
+    _get(job_id)
+    try:
+        start = int(last_event_id) + 1 if last_event_id is not None else 0
+    except ValueError:
+        start = 0
+    return StreamingResponse(
+        _event_stream(job_id, start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _event_stream(job_id: str, seq: int) -> AsyncIterator[bytes]:
+    poll_s = max(0.01, settings.jobs_event_poll_ms / 1000.0)
+    last_sent = time.monotonic()
+    while True:
+        job = job_manager.get(job_id)
+        if job is None:
+            return
+        finished = job.done
+        for event in job_manager.events_since(job, seq):
+            seq = event["seq"] + 1
+            last_sent = time.monotonic()
+            yield f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+        if finished:
+            return
+        if time.monotonic() - last_sent > _KEEPALIVE_S:
+            last_sent = time.monotonic()
+            yield b": keep-alive\n\n"
+        await asyncio.sleep(poll_s)
+
+
+def _get(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+    return job
+
+
+def _status(job: Job) -> JobStatus:
+    return JobStatus(
+        id=job.id,
+        status=job.status,
+        stage=job.stage,
+        tiles_done=job.tiles_done,
+        tiles_total=job.tiles_total,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        result=job.result,
+        error_status=job.error_status,
+        error=job.error,
+    )
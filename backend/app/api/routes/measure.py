@@ -1,151 +1,202 @@
 from __future__ import annotations
 
 import json
-from fastapi import APIRouter, File, Form, UploadFile, HTTPException
-from app.schemas.measure import MeasureResponse, Point, GapMeasurement
-from app.services.image_io import decode_image_upload
-from app.services.aruco_detect import detect_aruco_markers, select_best_marker, build_marker_detections
-from app.services.homography import compute_homography
-from app.services.measurement import measure_gap_mm
-from app.services.annotate import render_annotated_png_base64
-from app.services.gap_detection import detect_gaps
+import time
+import uuid
+from fastapi import APIRouter, File, Form, Query, UploadFile, HTTPException
+from fastapi.responses import Response
+from app.schemas.measure import MeasureResponse, Point, RethresholdRequest
+from app.services.annotate import MEDIA_TYPES, AnnotationInputs, RenderOptions
+from app.services.pipeline import (
+    ANNOTATE_MODES,
+    MeasurementError,
+    MeasureOutput,
+    ProbMapSnapshot,
+    render_deferred_annotation,
+    rethreshold_prob_map,
+    run_measurement,
+)
+from app.services.result_store import TTLStore
 from app.core.config import settings
+from app.core.executor import ExecutorBusyError, pipeline_executor
+from app.core.metrics import record_failure, record_measurement, server_timing
 from app.core.logging import get_logger
 
 router = APIRouter()
 log = get_logger("measure")
 
+# Lives in the API process so deferred annotations work with either executor backend.
+annotation_store: TTLStore[AnnotationInputs] = TTLStore(
+    max_items=settings.annotation_store_max_items,
+    ttl_s=settings.annotation_store_ttl_s,
+    max_bytes=settings.annotation_store_max_mb * 1024 * 1024,
+    sizeof=lambda inputs: inputs.nbytes,
+)
+prob_map_store: TTLStore[ProbMapSnapshot] = TTLStore(
+    max_items=settings.prob_map_store_max_items,
+    ttl_s=settings.prob_map_store_ttl_s,
+    max_bytes=settings.prob_map_store_max_mb * 1024 * 1024,
+    sizeof=lambda snapshot: snapshot.nbytes,
+)
+
 @router.post("/measure", response_model=MeasureResponse)
 async def measure(
+    response: Response,
     image: UploadFile = File(...),
     mode: str = Form(...),
     points_json: str | None = Form(None),
+    annotate_max_dim: int | None = Form(None),
+    annotate_format: str | None = Form(None),
+    annotate_quality: int | None = Form(None),
+    transport: str = Form("json"),
+    annotate: str | None = Form(None),
+    keep_prob_map: bool = Form(False),
+):
+    """
+    transport="json" returns MeasureResponse with the annotation base64-encoded;
+    transport="multipart" returns multipart/mixed with the JSON (image field
+    empty) followed by the raw encoded annotation, skipping base64 entirely.
+    annotate="none" skips the overlay; annotate="deferred" skips it as well and
+    returns an annotation_id to fetch it from GET /measure/{id}/annotation.
+    keep_prob_map (auto mode) returns a prob_map_id for POST /measure/{id}/rethreshold.
+    With GM_METRICS on, the Server-Timing header breaks the time down by stage.
+    """
+    points = _parse_points(mode, points_json)
+    render = _render_options(annotate_max_dim, annotate_format, annotate_quality)
+    if transport not in ("json", "multipart"):
+        raise HTTPException(status_code=400, detail="transport must be 'json' or 'multipart'")
+    annotate = _annotate_mode(annotate)
+
+    data = await image.read()
+    t0 = time.perf_counter()
+    try:
+        output = await pipeline_executor.run(
+            run_measurement, data, mode, points, render, transport == "json", annotate, keep_prob_map
+        )
+    except MeasurementError as exc:
+        _record_failure(mode, exc.status_code)
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    except ExecutorBusyError as exc:
+        _record_failure(mode, 503)
+        raise HTTPException(status_code=503, detail=str(exc))
+    wall_s = time.perf_counter() - t0
+
+    _store_handles(output)
+    if settings.metrics_enabled:
+        record_measurement(mode, output.timings, wall_s)
+    headers = {}
+    if output.timings is not None:
+        headers["Server-Timing"] = server_timing(output.timings, wall_s)
+    if transport == "multipart" and output.image:
+        return _multipart_response(output, headers)
+    response.headers.update(headers)
+    return output.response
+
+
+@router.get("/measure/{annotation_id}/annotation")
+async def measure_annotation(
+    annotation_id: str,
+    max_dim: int | None = Query(None),
+    format: str | None = Query(None),
+    quality: int | None = Query(None),
 ):
+    """Render a deferred annotation on demand; ids expire after GM_ANNOTATION_STORE_TTL_S."""
+    inputs = annotation_store.get(annotation_id)
+    if inputs is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired annotation id")
+    render = _render_options(max_dim, format, quality)
+    try:
+        image = await pipeline_executor.run(render_deferred_annotation, inputs, render)
+    except ExecutorBusyError as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
+    return Response(content=image, media_type=render.media_type)
+
+
+@router.post("/measure/{prob_map_id}/rethreshold", response_model=MeasureResponse)
+def measure_rethreshold(prob_map_id: str, params: RethresholdRequest):
+    """
+    Re-run threshold/morphology/quad extraction/measurement on a stored fused
+    probability map. Sync route: FastAPI runs it on its threadpool, and the
+    snapshot stays in this process instead of being shipped to a worker.
+    """
+    snapshot = prob_map_store.get(prob_map_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired prob_map_id")
+    try:
+        response = rethreshold_prob_map(snapshot, **params.model_dump())
+    except MeasurementError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    response.prob_map_id = prob_map_id
+    return response
+
+
+def _parse_points(mode: str, points_json: str | None) -> list[Point]:
     if mode not in ("2", "4", "auto"):
         raise HTTPException(status_code=400, detail="mode must be '2', '4', or 'auto'")
-
-    points: list[Point] = []
-    if mode in ("2", "4"):
-        if points_json is None:
-            raise HTTPException(status_code=400, detail="points_json is required for manual modes")
-        try:
-            pts_raw = json.loads(points_json)
-            points = [Point(**p) for p in pts_raw]
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid points_json")
-
-        needed = 2 if mode == "2" else 4
-        if len(points) != needed:
-            raise HTTPException(status_code=400, detail=f"Expected exactly {needed} points")
-
-    bgr = decode_image_upload(await image.read())
-    h_img, w_img = bgr.shape[:2]
-
-    gray, corners, ids = detect_aruco_markers(bgr, settings.aruco_dict)
-    dets = build_marker_detections(
-        gray=gray,
-        corners=corners,
-        ids=ids,
-        min_area=settings.min_marker_pixel_area,
-        min_laplacian=settings.min_laplacian_var,
-    )
-
-    if not dets:
-        raise HTTPException(status_code=422, detail="No usable ArUco markers detected (sharpness/size too low).")
-
-    hom = compute_homography(
-        detections=dets,
-        board_layout_path=settings.board_layout_path,
-        L_multi_mm=settings.marker_length_multi_mm,
-        L_single_mm=settings.marker_length_single_mm,
-        ransac_thresh_px=settings.ransac_reproj_thresh_px,
-        max_cond_number=settings.max_cond_number,
-        catastrophic_rms_mm=settings.catastrophic_rms_mm,
-        catastrophic_cond=settings.catastrophic_cond,
-        img_w=w_img,
-        img_h=h_img,
-    )
-
-    if not hom.qa_pass:
-        # Return annotated image + QA notes, but block measurement
-        annotated = render_annotated_png_base64(
-            bgr=bgr,
-            detections=dets,
-            hom=hom,
-            points_px=[(int(round(p.x)), int(round(p.y))) for p in points],
-            measurement_mm=None,
-            extra_notes=["Homography QA failed; measurement refused."]
-        )
-        return MeasureResponse(
-            measurement_mm=0.0,
-            confidence="LOW",
-            qa_notes=hom.qa_reasons + ["Homography QA failed; measurement refused."],
-            annotated_image_base64_png=annotated
-        )
-
     if mode == "auto":
-        detection = detect_gaps(bgr)
-        if not detection.quads:
-            raise HTTPException(status_code=422, detail="No gaps detected.")
-
-        measurements: list[GapMeasurement] = []
-        gap_quads_px: list[list[tuple[int, int]]] = []
-        for quad in detection.quads:
-            quad_points = [Point(x=float(p[0]), y=float(p[1])) for p in quad.points]
-            result = measure_gap_mm(hom.H_pix_to_mm, quad_points, mode="4", profile_step_mm=settings.profile_step_mm)
-            widths = result.widths_mm or []
-            gap_mm = float(max(widths)) if widths else float(result.gap_mm)
-            measurements.append(GapMeasurement(gap_mm=gap_mm, points_px=quad_points, widths_mm=widths))
-            gap_quads_px.append(quad.points)
-
-        measurement_mm = max(m.gap_mm for m in measurements)
-        qa_notes = []
-        qa_notes.extend(hom.qa_reasons)
-        qa_notes.append(f"Auto-detected gaps: {len(measurements)}")
-
-        annotated = render_annotated_png_base64(
-            bgr=bgr,
-            detections=dets,
-            hom=hom,
-            points_px=[],
-            measurement_mm=measurement_mm,
-            extra_notes=qa_notes,
-            gap_quads=gap_quads_px,
-        )
-
-        return MeasureResponse(
-            measurement_mm=float(measurement_mm),
-            confidence=hom.qa_confidence,
-            qa_notes=qa_notes,
-            annotated_image_base64_png=annotated,
-            measurements=measurements,
-        )
-
-    measurement = measure_gap_mm(hom.H_pix_to_mm, points, mode=mode, profile_step_mm=settings.profile_step_mm)
-
-    annotated = render_annotated_png_base64(
-        bgr=bgr,
-        detections=dets,
-        hom=hom,
-        points_px=[(int(round(p.x)), int(round(p.y))) for p in points],
-        measurement_mm=measurement.gap_mm,
-        extra_notes=measurement.qa_notes
+        return []
+    if points_json is None:
+        raise HTTPException(status_code=400, detail="points_json is required for manual modes")
+    try:
+        pts_raw = json.loads(points_json)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid points_json")
+    return _validate_points(mode, pts_raw)
+
+
+def _annotate_mode(annotate: str | None) -> str:
+    annotate = annotate or settings.annotate_mode
+    if annotate not in ANNOTATE_MODES:
+        raise HTTPException(status_code=400, detail="annotate must be 'none', 'inline' or 'deferred'")
+    return annotate
+
+
+def _record_failure(mode: str, status: int) -> None:
+    if settings.metrics_enabled:
+        record_failure(mode, status)
+
+
+def _store_handles(output: MeasureOutput) -> None:
+    """Keep deferred-annotation inputs and prob maps in this process and hand out their ids."""
+    if output.annotation is not None:
+        output.response.annotation_id = annotation_store.put(output.annotation)
+    if output.prob_map is not None:
+        output.response.prob_map_id = prob_map_store.put(output.prob_map)
+
+
+def _validate_points(mode: str, pts_raw) -> list[Point]:
+    try:
+        points = [Point(**p) for p in pts_raw]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid points_json")
+    needed = 2 if mode == "2" else 4
+    if len(points) != needed:
+        raise HTTPException(status_code=400, detail=f"Expected exactly {needed} points")
+    return points
+
+
+def _render_options(max_dim: int | None, codec: str | None, quality: int | None) -> RenderOptions:
+    codec = (codec or settings.annotate_format).lower()
+    if codec == "jpg":
+        codec = "jpeg"
+    if codec not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="annotate_format must be 'png', 'jpeg' or 'webp'")
+    return RenderOptions(
+        max_dim=max(0, settings.annotate_max_dim if max_dim is None else max_dim),
+        codec=codec,
+        quality=settings.annotate_quality if quality is None else quality,
     )
 
-    qa_notes = []
-    qa_notes.extend(hom.qa_reasons)
-    qa_notes.extend(measurement.qa_notes)
-
-    return MeasureResponse(
-        measurement_mm=float(measurement.gap_mm),
-        confidence=hom.qa_confidence,
-        qa_notes=qa_notes,
-        annotated_image_base64_png=annotated,
-        measurements=[
-            GapMeasurement(
-                gap_mm=float(measurement.gap_mm),
-                points_px=points,
-                widths_mm=measurement.widths_mm,
-            )
-        ],
-    )
+
+def _multipart_response(output: MeasureOutput, headers: dict[str, str] | None = None) -> Response:
+    boundary = uuid.uuid4().hex
+    ext = output.media_type.split("/")[-1]
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode("ascii"),
+        output.response.model_dump_json().encode("utf-8"),
+        f"\r\n--{boundary}\r\nContent-Type: {output.media_type}\r\n"
+        f"Content-Disposition: attachment; filename=\"annotated.{ext}\"\r\n\r\n".encode("ascii"),
+        output.image,
+        f"\r\n--{boundary}--\r\n".encode("ascii"),
+    ])
+    return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}", headers=headers)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import argparse
+import json
+import signal
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+log = get_logger("cli")
+
+MODEL_NAMES = ("unetpp", "deeplabv3plus")
+PRECISIONS = ("fp32", "bf16", "int8_dynamic", "int8_static")
+
+
+def _export_models(args: argparse.Namespace) -> int:
+    import torch
+
+    from app.services.gap_detection import artifact_source, calibration_tiles, load_eager_model
+    from app.services.model_backends import (
+        artifact_path,
+        export_onnx,
+        export_torchscript,
+        quantize_onnx,
+        quantized_artifact_path,
+        reusable_artifact,
+        write_source,
+    )
+
+    formats = ["onnx", "torchscript"] if args.format == "all" else [args.format]
+    out_dir = Path(args.out)
+    calibration = None
+    if args.precision == "int8_static":
+        if not args.calibration_dir:
+            print("--precision int8_static needs --calibration-dir (or GM_GAP_CALIBRATION_DIR)", file=sys.stderr)
+            return 2
+        calibration = calibration_tiles(Path(args.calibration_dir), args.tile_size, args.calibration_tiles)
+
+    for name in args.models:
+        model, ckpt = load_eager_model(name, torch.device("cpu"))
+        source = artifact_source(name)
+        for fmt in formats:
+            dst = artifact_path(out_dir, name, fmt)
+            if fmt == "onnx":
+                export_onnx(model, dst, args.tile_size, opset=args.opset)
+            else:
+                export_torchscript(model, dst, args.tile_size)
+            write_source(dst, source)
+            print(f"{name}: {ckpt} -> {dst}")
+        if args.precision.startswith("int8"):
+            src = artifact_path(out_dir, name, "onnx")
+            if not reusable_artifact(src, source, can_rebuild=True):
+                export_onnx(model, src, args.tile_size, opset=args.opset)
+                write_source(src, source)
+            dst = quantize_onnx(src, quantized_artifact_path(out_dir, name, args.precision), args.precision, calibration)
+            write_source(dst, source)
+            print(f"{name}: {src} -> {dst}")
+    return 0
+
+
+def _prefetch_models(args: argparse.Namespace) -> int:
+    from app.services.checkpoints import prefetch_checkpoints, sha256_file
+
+    for name, path in prefetch_checkpoints(tuple(args.models)).items():
+        print(f"{name}: {path} sha256={sha256_file(path)}")
+    return 0
+
+
+def _eval_quant(args: argparse.Namespace) -> int:
+    from app.services.quant_eval import evaluate_precision, list_images, summarize
+
+    images = list_images(Path(args.images))
+    if not images:
+        print(f"No images in {args.images}", file=sys.stderr)
+        return 2
+    precisions = {"unetpp": args.unetpp, "deeplabv3plus": args.dlv3}
+    rows = evaluate_precision(images, precisions)
+    summary = summarize(rows, args.min_iou, args.max_delta_mm, args.max_quad_mismatches)
+
+    print(f"{'image':40s} {'IoU':>6s} {'quads':>9s} {'gap_mm fp32':>12s} {'gap_mm test':>12s} {'delta':>7s}")
+    for r in rows:
+        ref = "-" if r.gap_mm_ref is None else f"{r.gap_mm_ref:.3f}"
+        test = "-" if r.gap_mm_test is None else f"{r.gap_mm_test:.3f}"
+        delta = "-" if r.gap_mm_delta is None else f"{r.gap_mm_delta:.3f}"
+        print(f"{Path(r.image).name:40s} {r.mask_iou:6.3f} {r.quads_ref:>4d}/{r.quads_test:<4d} {ref:>12s} {test:>12s} {delta:>7s}")
+    print(json.dumps(summary.to_dict(), indent=2))
+    return 0 if summary.passed else 1
+
+
+def _model_server(args: argparse.Namespace) -> int:
+    from app.services.gap_detection import configure_torch_threads, model_registry
+    from app.services.model_server import ModelServer
+
+    configure_torch_threads()
+    if not args.lazy:
+        model_registry.load_all()
+    server = ModelServer(args.socket, model_registry).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        model_registry.clear()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="GapMeasure backend utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export-models", help="Export the gap models for GM_GAP_BACKEND=onnx|torchscript")
+    export.add_argument("--format", choices=["onnx", "torchscript", "all"], default="onnx")
+    export.add_argument("--out", default=settings.gap_export_dir, help="output directory (default: GM_GAP_EXPORT_DIR)")
+    export.add_argument("--models", nargs="+", choices=MODEL_NAMES, default=list(MODEL_NAMES))
+    export.add_argument("--tile-size", type=int, default=settings.gap_tile_size)
+    export.add_argument("--opset", type=int, default=17)
+    export.add_argument(
+        "--precision",
+        choices=["fp32", "int8_dynamic", "int8_static"],
+        default="fp32",
+        help="also write <model>.<precision>.onnx for the int8 modes",
+    )
+    export.add_argument("--calibration-dir", default=settings.gap_calibration_dir, help="images for int8_static calibration")
+    export.add_argument("--calibration-tiles", type=int, default=settings.gap_calibration_tiles)
+    export.set_defaults(func=_export_models)
+
+    prefetch = sub.add_parser(
+        "prefetch-models",
+        help="Download and verify the gap model checkpoints into GM_GAP_MODEL_CACHE_DIR",
+    )
+    prefetch.add_argument("--models", nargs="+", choices=MODEL_NAMES, default=list(MODEL_NAMES))
+    prefetch.set_defaults(func=_prefetch_models)
+
+    quant = sub.add_parser(
+        "eval-quant",
+        help="Compare reduced-precision gap models against fp32 on a fixture folder (exit 1 if the gate fails)",
+    )
+    quant.add_argument("--images", required=True, help="folder of fixture images")
+    quant.add_argument("--unetpp", choices=PRECISIONS, default=settings.gap_unetpp_precision)
+    quant.add_argument("--dlv3", choices=PRECISIONS, default=settings.gap_dlv3_precision)
+    quant.add_argument("--min-iou", type=float, default=0.95)
+    quant.add_argument("--max-delta-mm", type=float, default=0.1)
+    quant.add_argument("--max-quad-mismatches", type=int, default=0, help="images allowed to gain or lose a gap")
+    quant.set_defaults(func=_eval_quant)
+
+    server = sub.add_parser("model-server", help="Serve the gap models to API workers over a Unix socket")
+    server.add_argument(
+        "--socket",
+        default=settings.gap_server_socket or "/tmp/gapmeasure-models.sock",
+        help="socket path; point the workers at it with GM_GAP_SERVER_SOCKET",
+    )
+    server.add_argument("--lazy", action="store_true", help="load the models on first use instead of at start-up")
+    server.set_defaults(func=_model_server)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return int(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,11 +10,18 @@ class Settings(BaseSettings):
     cors_allow_origins: List[str] = Field(default_factory=lambda: ["http://localhost:3000"])
 
     aruco_dict: str = Field(default="DICT_4X4_50", alias="GM_ARUCO_DICT")
+    aruco_adaptive_win_min: int = Field(default=3, alias="GM_ARUCO_ADAPTIVE_WIN_MIN")
+    aruco_adaptive_win_max: int = Field(default=23, alias="GM_ARUCO_ADAPTIVE_WIN_MAX")
+    aruco_adaptive_win_step: int = Field(default=10, alias="GM_ARUCO_ADAPTIVE_WIN_STEP")
+    aruco_corner_refinement: str = Field(default="none", alias="GM_ARUCO_CORNER_REFINEMENT")  # none | subpix | contour | apriltag
+    aruco_min_marker_perimeter_rate: float = Field(default=0.03, alias="GM_ARUCO_MIN_MARKER_PERIMETER_RATE")
 
     marker_length_multi_mm: float = Field(default=50.0, alias="GM_MARKER_LENGTH_MULTI_MM")
     marker_length_single_mm: float = Field(default=40.0, alias="GM_MARKER_LENGTH_SINGLE_MM")
 
     min_marker_pixel_area: float = Field(default=800.0, alias="GM_MIN_MARKER_PIXEL_AREA")
+    aruco_pyramid: bool = Field(default=False, alias="GM_ARUCO_PYRAMID")
+    aruco_pyramid_min_area_px: float = Field(default=256.0, alias="GM_ARUCO_PYRAMID_MIN_AREA_PX")
     min_laplacian_var: float = Field(default=40.0, alias="GM_MIN_LAPLACIAN_VAR")
     ransac_reproj_thresh_px: float = Field(default=3.0, alias="GM_RANSAC_REPROJ_THRESH_PX")
 
@@ -36,21 +43,98 @@ class Settings(BaseSettings):
         default="https://github.com/Niket93/gap_detection_cv_models/blob/main/deeplabv3.pt",
         alias="GM_DLV3_URL",
     )
+    # Expected SHA-256 of each checkpoint (hex); empty = not verified
+    gap_unetpp_sha256: str = Field(default="", alias="GM_UNETPP_SHA256")
+    gap_dlv3_sha256: str = Field(default="", alias="GM_DLV3_SHA256")
     gap_model_cache_dir: str = Field(default="/tmp/gap_models", alias="GM_GAP_MODEL_CACHE_DIR")
+    gap_download_timeout_s: float = Field(default=60.0, alias="GM_GAP_DOWNLOAD_TIMEOUT_S")
+    gap_prefetch_checkpoints: bool = Field(default=True, alias="GM_GAP_PREFETCH_CHECKPOINTS")  # at API start-up
     gap_encoder: str = Field(default="timm-efficientnet-b1", alias="GM_GAP_ENCODER")
     gap_tile_size: int = Field(default=1024, alias="GM_GAP_TILE_SIZE")
     gap_overlap: float = Field(default=0.25, alias="GM_GAP_OVERLAP")
+    gap_batch_tiles: int = Field(default=0, alias="GM_GAP_BATCH_TILES")  # 0 = derive from memory budget
+    gap_batch_mem_mb: float = Field(default=4096.0, alias="GM_GAP_BATCH_MEM_MB")
     gap_use_fusion: bool = Field(default=True, alias="GM_GAP_USE_FUSION")
     gap_unetpp_thr: float = Field(default=0.75, alias="GM_GAP_UNETPP_THR")
     gap_fusion_thr: float = Field(default=0.80, alias="GM_GAP_FUSION_THR")
     gap_fusion_unetpp_weight: float = Field(default=0.75, alias="GM_GAP_FUSION_UNETPP_WEIGHT")
     gap_fusion_dlv3_weight: float = Field(default=0.75, alias="GM_GAP_FUSION_DLV3_WEIGHT")
+    gap_fusion_parallel: bool = Field(default=False, alias="GM_GAP_FUSION_PARALLEL")
+    gap_streaming: bool = Field(default=False, alias="GM_GAP_STREAMING")
+    gap_coarse_enabled: bool = Field(default=False, alias="GM_GAP_COARSE")
+    gap_coarse_scale: float = Field(default=0.25, alias="GM_GAP_COARSE_SCALE")
+    gap_coarse_thr: float = Field(default=0.3, alias="GM_GAP_COARSE_THR")
+    # Inspection region in board mm (x0, y0, x1, y1); empty = whole image.
+    gap_roi_mm: List[float] = Field(default_factory=list, alias="GM_GAP_ROI_MM")
+    gap_roi_margin_px: int = Field(default=64, alias="GM_GAP_ROI_MARGIN_PX")
     gap_min_area_px: int = Field(default=400, alias="GM_GAP_MIN_AREA_PX")
     gap_min_length_px: float = Field(default=20.0, alias="GM_GAP_MIN_LENGTH_PX")
     gap_morph_kernel: int = Field(default=5, alias="GM_GAP_MORPH_KERNEL")
     gap_morph_iterations: int = Field(default=1, alias="GM_GAP_MORPH_ITERATIONS")
     gap_max_segments: int = Field(default=0, alias="GM_GAP_MAX_SEGMENTS")
     gap_device: str = Field(default="", alias="GM_GAP_DEVICE")
+    gap_backend: str = Field(default="torch", alias="GM_GAP_BACKEND")  # torch | onnx | torchscript
+    gap_export_dir: str = Field(default="/tmp/gap_models/export", alias="GM_GAP_EXPORT_DIR")
+    gap_auto_export: bool = Field(default=True, alias="GM_GAP_AUTO_EXPORT")  # export on first load if missing
+    gap_onnx_threads: int = Field(default=0, alias="GM_GAP_ONNX_THREADS")  # 0 = onnxruntime default
+    # Per-model precision: fp32 | bf16 (native-bf16 CPUs / GPUs) | int8_static | int8_dynamic.
+    # int8 runs on ONNX Runtime whatever GM_GAP_BACKEND is; int8_static needs calibration images
+    # and is the fast one on CPU (ORT's dynamic ConvInteger kernels are slower than fp32).
+    gap_unetpp_precision: str = Field(default="fp32", alias="GM_GAP_UNETPP_PRECISION")
+    gap_dlv3_precision: str = Field(default="fp32", alias="GM_GAP_DLV3_PRECISION")
+    gap_calibration_dir: str = Field(default="", alias="GM_GAP_CALIBRATION_DIR")
+    gap_calibration_tiles: int = Field(default=32, alias="GM_GAP_CALIBRATION_TILES")
+    gap_torch_threads: int = Field(default=0, alias="GM_GAP_TORCH_THREADS")  # 0 = torch default
+    gap_scheduler_enabled: bool = Field(default=False, alias="GM_GAP_SCHEDULER")
+    gap_scheduler_max_batch: int = Field(default=8, alias="GM_GAP_SCHEDULER_MAX_BATCH")
+    gap_scheduler_max_wait_ms: float = Field(default=10.0, alias="GM_GAP_SCHEDULER_MAX_WAIT_MS")
+    gap_preload_models: bool = Field(default=True, alias="GM_GAP_PRELOAD_MODELS")
+    # Unix socket of a shared model server (`python -m app.cli model-server`); when set,
+    # workers send tiles there through shared memory instead of loading the models.
+    gap_server_socket: str = Field(default="", alias="GM_GAP_SERVER_SOCKET")
+    gap_server_timeout_s: float = Field(default=120.0, alias="GM_GAP_SERVER_TIMEOUT_S")
+
+    # Measurement pipeline execution (off the event loop)
+    pipeline_backend: str = Field(default="thread", alias="GM_PIPELINE_BACKEND")  # thread | process
+    pipeline_workers: int = Field(default=2, alias="GM_PIPELINE_WORKERS")
+    pipeline_max_queue: int = Field(default=16, alias="GM_PIPELINE_MAX_QUEUE")
+
+    # POST /measure/batch
+    batch_max_items: int = Field(default=200, alias="GM_BATCH_MAX_ITEMS")
+    batch_max_item_mb: int = Field(default=64, alias="GM_BATCH_MAX_ITEM_MB")  # per zip member
+
+    # Asynchronous jobs (POST /jobs/measure); run on their own in-process pool
+    jobs_workers: int = Field(default=1, alias="GM_JOBS_WORKERS")
+    jobs_max_queue: int = Field(default=16, alias="GM_JOBS_MAX_QUEUE")
+    jobs_retain_s: float = Field(default=3600.0, alias="GM_JOBS_RETAIN_S")
+    jobs_max_retained: int = Field(default=256, alias="GM_JOBS_MAX_RETAINED")
+    jobs_event_poll_ms: float = Field(default=100.0, alias="GM_JOBS_EVENT_POLL_MS")
+
+    # Annotated image defaults (overridable per request)
+    annotate_max_dim: int = Field(default=0, alias="GM_ANNOTATE_MAX_DIM")  # 0 = full resolution
+    annotate_format: str = Field(default="png", alias="GM_ANNOTATE_FORMAT")  # png | jpeg | webp
+    annotate_quality: int = Field(default=90, alias="GM_ANNOTATE_QUALITY")
+    annotate_mode: str = Field(default="inline", alias="GM_ANNOTATE")  # none | inline | deferred
+    annotation_store_max_items: int = Field(default=64, alias="GM_ANNOTATION_STORE_MAX_ITEMS")
+    annotation_store_max_mb: int = Field(default=512, alias="GM_ANNOTATION_STORE_MAX_MB")
+    annotation_store_ttl_s: float = Field(default=600.0, alias="GM_ANNOTATION_STORE_TTL_S")
+
+    prob_map_store_max_items: int = Field(default=16, alias="GM_PROB_MAP_STORE_MAX_ITEMS")
+    prob_map_store_max_mb: int = Field(default=1024, alias="GM_PROB_MAP_STORE_MAX_MB")
+    prob_map_store_ttl_s: float = Field(default=1800.0, alias="GM_PROB_MAP_STORE_TTL_S")
+
+    image_decoder: str = Field(default="pil", alias="GM_IMAGE_DECODER")  # pil | fast
+    decode_max_dim: int = Field(default=0, alias="GM_DECODE_MAX_DIM")  # fast decoder only; 0 = full resolution
+    max_image_pixels: int = Field(default=100_000_000, alias="GM_MAX_IMAGE_PIXELS")  # 0 = only Pillow's bomb limit
+
+    # Content-addressed cache of markers/homography/gap probabilities; 0 disables
+    result_cache_mb: int = Field(default=512, alias="GM_RESULT_CACHE_MB")
+
+    # Per-stage timers: Server-Timing headers on /measure and Prometheus text at GET /metrics
+    metrics_enabled: bool = Field(default=True, alias="GM_METRICS")
+
+    report_peak_memory: bool = Field(default=True, alias="GM_REPORT_PEAK_MEMORY")
+    memory_sample_ms: float = Field(default=10.0, alias="GM_MEMORY_SAMPLE_MS")
 
     # Board layout file path
     board_layout_path: str = Field(default="app/core/assets/board_layout.json")
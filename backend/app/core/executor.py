@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+import asyncio
+import multiprocessing
+import threading
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+log = get_logger("executor")
+
+T = TypeVar("T")
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when the pipeline queue is full; the route turns this into a 503."""
+
+
+def _init_process_worker() -> None:
+    # Each process worker owns its own copy of the models (or a connection to the
+    # model server); load them up front so the first request routed to a fresh
+    # worker does not pay for it.
+    from app.services.gap_detection import configure_torch_threads, default_registry
+
+    configure_torch_threads()
+    if settings.gap_preload_models:
+        try:
+            default_registry().load_all()
+        except Exception:
+            log.exception("Gap model preload failed in pipeline worker.")
+
+
+class PipelineExecutor:
+    """
+    Runs the blocking measurement pipeline away from the event loop.
+
+    backend="thread": OpenCV and torch release the GIL in their hot loops, so
+    a thread pool gives real parallelism while sharing one set of models.
+    backend="process": spawn-based worker processes for deployments where the
+    Python-level parts (quad extraction, profiling, response building) dominate;
+    each worker loads its own models once via the initializer.
+
+    At most `workers` pipelines run at once and at most `max_queue` more may
+    wait for a slot; beyond that submissions fail fast with ExecutorBusyError.
+    """
+
+    def __init__(self, backend: str, workers: int, max_queue: int) -> None:
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown pipeline backend: {backend}")
+        self.backend = backend
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool: Optional[Executor] = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.backend == "process":
+                        self._pool = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                            initializer=_init_process_worker,
+                        )
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline")
+        return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        with self._lock:
+            if self._inflight >= self.workers + self.max_queue:
+                raise ExecutorBusyError("Measurement queue is full; retry shortly.")
+            self._inflight += 1
+        try:
+            future = self._get_pool().submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # Released when the work itself ends: a cancelled caller (client gone,
+        # request timeout) must not free the slot while the work still runs.
+        future.add_done_callback(lambda _f: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+pipeline_executor = PipelineExecutor(
+    backend=settings.pipeline_backend,
+    workers=settings.pipeline_workers,
+    max_queue=settings.pipeline_max_queue,
+)
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import Optional
+import os
+import resource
+import sys
+import threading
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process; falls back to the peak-to-date where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return int(usage if sys.platform == "darwin" else usage * 1024)
+
+
+class PeakRSSSampler:
+    """
+    Context manager that samples process RSS on a daemon thread and keeps the
+    maximum seen while it is active. RSS is process-wide, so with concurrent
+    requests the peak includes memory held by the others.
+    """
+
+    def __init__(self, interval_ms: float = 10.0) -> None:
+        self._interval_s = max(0.001, float(interval_ms) / 1000.0)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.peak_bytes = 0
+
+    def _sample(self) -> None:
+        rss = current_rss_bytes()
+        if rss > self.peak_bytes:
+            self.peak_bytes = rss
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._interval_s):
+            self._sample()
+
+    def __enter__(self) -> "PeakRSSSampler":
+        self._sample()
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+
+    @property
+    def peak_mb(self) -> float:
+        return self.peak_bytes / (1024.0 * 1024.0)
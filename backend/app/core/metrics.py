@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import threading
+import time
+
+# Progress events (see pipeline.ProgressFn) -> the stage that ends with them.
+_EVENT_STAGE = {
+    "decoded": "decode",
+    "markers": "markers",
+    "homography": "homography",
+    "tiles": "inference",
+    "quads": "quads",
+    "measured": "measure",
+    "annotated": "annotate",
+}
+STAGES = ("decode", "markers", "homography", "inference", "quads", "measure", "annotate")
+
+_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class StageTimings:
+    """Wall-clock seconds per pipeline stage of one run, plus what the run counted."""
+    stages: Dict[str, float] = field(default_factory=dict)
+    total_s: float = 0.0
+    tiles_run: int = 0
+    markers: int = 0
+    qa_failed: bool = False
+
+
+class StageTimer:
+    """
+    Progress-callback wrapper that charges the time since the previous event
+    to the stage the current event ends. Stages served from the result cache
+    emit no event of their own and fold into the next one.
+    """
+
+    def __init__(self) -> None:
+        self.timings = StageTimings()
+        self._t0 = self._last = time.perf_counter()
+
+    def wrap(self, progress: Callable[..., None]) -> Callable[..., None]:
+        def notify(stage: str, **details: Any) -> None:
+            self.mark(stage, details)
+            progress(stage, **details)
+
+        return notify
+
+    def mark(self, event: str, details: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        stage = _EVENT_STAGE.get(event)
+        if stage is not None:
+            stages = self.timings.stages
+            stages[stage] = stages.get(stage, 0.0) + (now - self._last)
+            self._last = now
+        if event == "tiles":
+            self.timings.tiles_run = int(details.get("run") or 0)
+
+    def finish(self) -> StageTimings:
+        self.timings.total_s = time.perf_counter() - self._t0
+        return self.timings
+
+
+def server_timing(timings: StageTimings, wall_s: Optional[float] = None) -> str:
+    """Server-Timing header value; `wall_s` (seen by the route) adds the executor queue wait."""
+    parts = [f"{name};dur={timings.stages[name] * 1000.0:.1f}" for name in STAGES if name in timings.stages]
+    parts.append(f"pipeline;dur={timings.total_s * 1000.0:.1f}")
+    if wall_s is not None:
+        parts.append(f"queue;dur={max(0.0, wall_s - timings.total_s) * 1000.0:.1f}")
+        parts.append(f"total;dur={wall_s * 1000.0:.1f}")
+    return ", ".join(parts)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0.0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_str(self.labelnames, k)} {v:g}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = _DURATION_BUCKETS) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts incl. +Inf, sum)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][idx] += 1
+            series[1][0] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("gm_stage_duration_seconds", "Measurement pipeline stage wall time.", ("stage", "mode"))
+requests_total = Counter("gm_measure_requests_total", "Measurements by mode and HTTP status.", ("mode", "status"))
+tiles_total = Counter("gm_tiles_run_total", "Segmentation tiles run through the models.")
+markers_total = Counter("gm_markers_found_total", "Usable ArUco markers found.")
+qa_failures_total = Counter("gm_homography_qa_failures_total", "Measurements refused by homography QA.")
+_ALL = (stage_seconds, requests_total, tiles_total, markers_total, qa_failures_total)
+
+
+def record_measurement(mode: str, timings: Optional[StageTimings], wall_s: Optional[float] = None) -> None:
+    """Record one successful run; the metrics live in the API process whatever the executor backend."""
+    requests_total.inc(mode=mode, status="200")
+    if timings is None:
+        return
+    for stage, seconds in timings.stages.items():
+        stage_seconds.observe(seconds, stage=stage, mode=mode)
+    stage_seconds.observe(timings.total_s, stage="pipeline", mode=mode)
+    if wall_s is not None:
+        stage_seconds.observe(max(0.0, wall_s - timings.total_s), stage="queue", mode=mode)
+    if timings.tiles_run:
+        tiles_total.inc(timings.tiles_run)
+    markers_total.inc(timings.markers)
+    if timings.qa_failed:
+        qa_failures_total.inc()
+
+
+def record_failure(mode: str, status: int) -> None:
+    requests_total.inc(mode=mode, status=str(status))
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _ALL:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
@@ -1,22 +1,66 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.routes.health import router as health_router
 from app.api.routes.measure import router as measure_router
+from app.api.routes.batch import router as batch_router
+from app.api.routes.jobs import router as jobs_router
+from app.api.routes.metrics import router as metrics_router
 from app.core.config import settings
+from app.core.executor import pipeline_executor
+from app.core.logging import get_logger
+from app.services.checkpoints import prefetch_checkpoints
+from app.services.gap_detection import configure_torch_threads, default_registry
+from app.services.jobs import job_manager
+
+log = get_logger("main")
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    configure_torch_threads()
+    # Fetch and verify checkpoints before serving so no request pays for the
+    # download; workers of a model server never load them.
+    if settings.gap_prefetch_checkpoints and not settings.gap_server_socket:
+        try:
+            prefetch_checkpoints()
+        except Exception:
+            log.exception("Checkpoint prefetch failed; models will be fetched on first use.")
+    # Jobs run in this process whatever the backend, so with the process backend
+    # this loads a copy next to the pipeline workers' own (a model server avoids
+    # the duplicate). With a model server, this asks it to load the models and
+    # keeps them warm.
+    if settings.gap_preload_models:
+        # Manual modes must keep working even if the models cannot be fetched;
+        # the registry retries lazily on the first auto request.
+        try:
+            default_registry().load_all()
+        except Exception:
+            log.exception("Gap model preload failed; models will load on first use.")
+    yield
+    job_manager.shutdown()
+    pipeline_executor.shutdown()
+    default_registry().clear()
+
 
-app = FastAPI(title="GapMeasure API", version="1.0.0")
+app = FastAPI(title="GapMeasure API", version="1.0.0", lifespan=lifespan)
 
 # In production: lock down allowed origins.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_allow_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 app.include_router(health_router)
 app.include_router(measure_router)
+app.include_router(batch_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
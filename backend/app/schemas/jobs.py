@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from pydantic import BaseModel
+from typing import Literal, Optional
+
+from app.schemas.measure import MeasureResponse
+
+class JobStatus(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"]
+    stage: Optional[str] = None
+    tiles_done: Optional[int] = None
+    tiles_total: Optional[int] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[MeasureResponse] = None
+    error_status: Optional[int] = None
+    error: Optional[str] = None
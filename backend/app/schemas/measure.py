@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import List, Literal, Optional
 
 class Point(BaseModel):
     x: float
@@ -12,9 +12,27 @@ class GapMeasurement(BaseModel):
     points_px: List[Point]
     widths_mm: List[float] = Field(default_factory=list)
 
+class GapDetectionStats(BaseModel):
+    tiles_total: int
+    tiles_skipped: int
+
 class MeasureResponse(BaseModel):
     measurement_mm: float
     confidence: Literal["HIGH", "MEDIUM", "LOW"]
     qa_notes: List[str] = Field(default_factory=list)
     annotated_image_base64_png: str
+    annotated_image_media_type: str = "image/png"
     measurements: List[GapMeasurement] = Field(default_factory=list)
+    detection_stats: Optional[GapDetectionStats] = None
+    process_peak_rss_mb: Optional[float] = None  # whole process, so includes concurrent requests
+    annotation_id: Optional[str] = None  # set with annotate="deferred"; GET /measure/{id}/annotation
+    prob_map_id: Optional[str] = None    # set with keep_prob_map; POST /measure/{id}/rethreshold
+
+class RethresholdRequest(BaseModel):
+    """Post-processing overrides; unset fields use the server settings."""
+    thr: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    morph_kernel: Optional[int] = Field(default=None, ge=1)
+    morph_iterations: Optional[int] = Field(default=None, ge=0)
+    min_area_px: Optional[int] = Field(default=None, ge=0)
+    min_length_px: Optional[float] = Field(default=None, ge=0.0)
+    max_segments: Optional[int] = Field(default=None, ge=0)
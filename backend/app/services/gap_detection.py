@@ -1,32 +1,83 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple
-import ssl
-import urllib.parse
-import urllib.request
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import threading
+import time
 
 import cv2
 import numpy as np
 import torch
 import segmentation_models_pytorch as smp
-import certifi
 
 from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.checkpoints import file_lock, model_checkpoint, sha256_file
+from app.services.inference_scheduler import BatchingScheduler
+from app.services.model_backends import (
+    BF16Autocast,
+    OnnxSegModel,
+    artifact_path,
+    cpu_supports_bf16,
+    ensure_artifact,
+    load_backend_model,
+    lock_path,
+    quantize_onnx,
+    quantized_artifact_path,
+    reusable_artifact,
+    write_source,
+)
+
+log = get_logger("gap_detection")
 
 NORMALIZE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
 NORMALIZE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
 
+# Rough peak activation footprint of one forward pass, per input pixel, for the
+# efficientnet-b1 UNet++ (the larger of the two); used to size automatic batches.
+_TILE_BYTES_PER_PIXEL = 1200.0
+
 @dataclass
 class GapQuad:
     points: List[Tuple[int, int]]
 
+@dataclass
+class TileStats:
+    tiles_total: int = 0
+    tiles_run: int = 0
+    tiles_skipped: int = 0
+
 @dataclass
 class GapDetectionResult:
     quads: List[GapQuad]
     prob_map: np.ndarray
     mask: np.ndarray
+    stats: TileStats = field(default_factory=TileStats)
+    # (x0, y0, x1, y1) of the inference crop; prob_map and mask are relative to
+    # (x0, y0) while quads are always in full-image coordinates.
+    roi: Optional[Tuple[int, int, int, int]] = None
+
+
+# Runs a list of normalized (3, tile, tile) tiles, returns probabilities (N, tile, tile).
+TileRunner = Callable[[Sequence[torch.Tensor]], np.ndarray]
+# Called as (tiles_done, tiles_total, tiles_run) while tiles are processed; tiles_run
+# excludes tiles the coarse pass skipped. May raise to abort.
+TileProgress = Callable[[int, int, int], None]
+
+
+@dataclass
+class LoadedModel:
+    name: str
+    model: torch.nn.Module  # or a call-compatible runtime wrapper (see model_backends)
+    device: torch.device
+    ckpt_path: Path         # checkpoint, or the exported artifact for non-torch backends
+    load_ms: float
+    warmup_ms: float
+    backend: str = "torch"
+    precision: str = "fp32"
 
 
 def build_model(model_name: str, encoder: str) -> torch.nn.Module:
@@ -51,7 +102,12 @@ def build_model(model_name: str, encoder: str) -> torch.nn.Module:
 
 
 def load_checkpoint(model: torch.nn.Module, ckpt_path: Path, device: torch.device) -> None:
-    ckpt = torch.load(ckpt_path, map_location=device)
+    # Memory-map the weights so load_state_dict copies straight from the page
+    # cache; checkpoints in the legacy (non-zip) format cannot be mapped.
+    try:
+        ckpt = torch.load(ckpt_path, map_location=device, mmap=True)
+    except RuntimeError:
+        ckpt = torch.load(ckpt_path, map_location=device)
     if isinstance(ckpt, dict) and "model" in ckpt:
         state = ckpt["model"]
     else:
@@ -66,19 +122,19 @@ def normalize_tile(tile_rgb: np.ndarray, mean: np.ndarray, std: np.ndarray) -> t
     return torch.from_numpy(tile).unsqueeze(0)
 
 
-def tile_inference(
-    model: torch.nn.Module,
-    img_rgb: np.ndarray,
-    tile_size: int,
-    overlap: float,
-    mean: np.ndarray,
-    std: np.ndarray,
-    device: torch.device,
-) -> np.ndarray:
-    h, w = img_rgb.shape[:2]
+def normalize_image(img_rgb: np.ndarray, mean: np.ndarray, std: np.ndarray) -> torch.Tensor:
+    """Normalize a full HxWx3 uint8 image once; returns a (3,H,W) float32 view."""
+    img = img_rgb.astype(np.float32)
+    img /= 255.0
+    img -= mean
+    img /= std
+    return torch.from_numpy(img).permute(2, 0, 1)
+
+
+def tile_grid(h: int, w: int, tile_size: int, overlap: float) -> Tuple[List[int], List[int], int, int]:
+    """Tile origins (ys, xs) plus the bottom/right padding needed to cover an h x w image."""
     tile_size = int(tile_size)
-    overlap = float(overlap)
-    stride = max(1, int(round(tile_size * (1.0 - overlap))))
+    stride = max(1, int(round(tile_size * (1.0 - float(overlap)))))
 
     if h <= tile_size:
         n_h = 1
@@ -91,6 +147,57 @@ def tile_inference(
 
     pad_h = max(0, (n_h - 1) * stride + tile_size - h)
     pad_w = max(0, (n_w - 1) * stride + tile_size - w)
+    ys = [i * stride for i in range(n_h)]
+    xs = [j * stride for j in range(n_w)]
+    return ys, xs, pad_h, pad_w
+
+
+def resolve_batch_tiles(tile_size: int) -> int:
+    """Tiles per forward pass: GM_GAP_BATCH_TILES if set, else derived from GM_GAP_BATCH_MEM_MB."""
+    if settings.gap_batch_tiles > 0:
+        return int(settings.gap_batch_tiles)
+    budget = float(settings.gap_batch_mem_mb) * 1024.0 * 1024.0
+    per_tile = float(tile_size) * float(tile_size) * _TILE_BYTES_PER_PIXEL
+    return max(1, int(budget // per_tile))
+
+
+def _forward_tiles(model: torch.nn.Module, device: torch.device, tiles: Sequence[torch.Tensor]) -> np.ndarray:
+    x = torch.stack(list(tiles)).to(device)
+    with torch.no_grad():
+        logits = model(x)
+    return torch.sigmoid(logits)[:, 0].cpu().numpy()
+
+
+@dataclass
+class TiledImage:
+    tensor: torch.Tensor  # (3, H, W) normalized, padded image shared by all models
+    ys: List[int]
+    xs: List[int]
+    tile_size: int
+    h: int
+    w: int
+
+    @property
+    def origins(self) -> List[Tuple[int, int]]:
+        return [(y0, x0) for y0 in self.ys for x0 in self.xs]
+
+    def tiles(self, origins: Sequence[Tuple[int, int]]) -> List[torch.Tensor]:
+        t = self.tile_size
+        return [self.tensor[:, y0 : y0 + t, x0 : x0 + t] for y0, x0 in origins]
+
+
+def prepare_tiles(
+    img_rgb: np.ndarray,
+    tile_size: int,
+    overlap: float,
+    mean: np.ndarray,
+    std: np.ndarray,
+) -> TiledImage:
+    """Pad and normalize once; every model then reads its tiles from the same tensor."""
+    h, w = img_rgb.shape[:2]
+    tile_size = int(tile_size)
+    ys, xs, pad_h, pad_w = tile_grid(h, w, tile_size, overlap)
+
     if pad_h > 0 or pad_w > 0:
         img_pad = cv2.copyMakeBorder(
             img_rgb,
@@ -103,42 +210,312 @@ def tile_inference(
     else:
         img_pad = img_rgb
 
-    H, W = img_pad.shape[:2]
+    return TiledImage(
+        tensor=normalize_image(img_pad, mean, std),
+        ys=ys,
+        xs=xs,
+        tile_size=tile_size,
+        h=h,
+        w=w,
+    )
+
+
+def _coverage(starts: Sequence[int], tile_size: int, n: int) -> np.ndarray:
+    """Number of tiles covering each row (or column). The tile grid is separable,
+    so the per-pixel overlap count is the outer product of the two."""
+    cov = np.zeros(n, dtype=np.float32)
+    for s0 in starts:
+        cov[s0 : s0 + tile_size] += 1.0
+    return cov
+
+
+def _divide_by_coverage(buf: np.ndarray, cov_y: np.ndarray, cov_x: np.ndarray, rows_per_chunk: int = 256) -> None:
+    for r0 in range(0, buf.shape[0], rows_per_chunk):
+        r1 = min(buf.shape[0], r0 + rows_per_chunk)
+        buf[r0:r1] /= cov_y[r0:r1, None] * cov_x[None, :]
+
+
+def _reflect101(indices: np.ndarray, n: int) -> np.ndarray:
+    """BORDER_REFLECT_101 source index for each (possibly out-of-range) index."""
+    out = indices.copy()
+    for i in np.nonzero(indices >= n)[0]:
+        out[i] = cv2.borderInterpolate(int(indices[i]), n, cv2.BORDER_REFLECT_101)
+    return out
+
+
+class CoarseFill:
+    """
+    Low-resolution probability map used to skip full-resolution tiles.
+    A tile runs only if the coarse map reaches `thr` anywhere inside it;
+    skipped tiles take the coarse map, bilinearly upsampled, instead.
+    """
+
+    def __init__(self, coarse: np.ndarray, h: int, w: int, tile_size: int, thr: float) -> None:
+        self.coarse = coarse.astype(np.float32, copy=False)
+        self.h = h
+        self.w = w
+        self.tile_size = int(tile_size)
+        self.thr = float(thr)
+        self.sy = coarse.shape[0] / float(h)
+        self.sx = coarse.shape[1] / float(w)
+
+    def needs_inference(self, y0: int, x0: int) -> bool:
+        t = self.tile_size
+        cy0 = int(np.floor(y0 * self.sy))
+        cx0 = int(np.floor(x0 * self.sx))
+        cy1 = max(cy0 + 1, int(np.ceil(min(y0 + t, self.h) * self.sy)))
+        cx1 = max(cx0 + 1, int(np.ceil(min(x0 + t, self.w) * self.sx)))
+        region = self.coarse[cy0:cy1, cx0:cx1]
+        return region.size == 0 or float(region.max()) >= self.thr
+
+    def tile(self, y0: int, x0: int) -> np.ndarray:
+        # Pixel-centre aligned map from tile pixels to coarse-map coordinates.
+        m = np.array(
+            [
+                [self.sx, 0.0, (x0 + 0.5) * self.sx - 0.5],
+                [0.0, self.sy, (y0 + 0.5) * self.sy - 0.5],
+            ],
+            dtype=np.float64,
+        )
+        t = self.tile_size
+        return cv2.warpAffine(
+            self.coarse,
+            m,
+            (t, t),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+
+
+_fusion_pool: Optional[ThreadPoolExecutor] = None
+_fusion_pool_lock = threading.Lock()
+
+
+def _get_fusion_pool() -> ThreadPoolExecutor:
+    # The calling thread runs one branch itself, so concurrent pipelines (and
+    # jobs) each need only one pool thread for the other.
+    global _fusion_pool
+    if _fusion_pool is None:
+        with _fusion_pool_lock:
+            if _fusion_pool is None:
+                workers = max(1, settings.pipeline_workers) + max(0, settings.jobs_workers)
+                _fusion_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gap-fusion")
+    return _fusion_pool
+
+
+def _blend_tiles(
+    accum: np.ndarray,
+    row0: int,
+    origins: Sequence[Tuple[int, int]],
+    tiles_fn: Callable[[Sequence[Tuple[int, int]]], List[torch.Tensor]],
+    branches: Sequence[Tuple[TileRunner, float]],
+    tile_size: int,
+    batch_tiles: int,
+    parallel: bool,
+    fill: Optional[CoarseFill],
+    stats: Optional[TileStats],
+    advance: Optional[Callable[[int, bool], None]] = None,
+) -> None:
+    """
+    Add the fused, pre-weighted probabilities of `origins` into `accum`, whose
+    first row is image row `row0`. Each branch's probabilities are added into
+    the one shared accumulator, so fusion never materialises a full-size map
+    per model. `advance(n, ran)` is told about every n tiles finished and
+    whether they went through the models.
+    """
+    t = tile_size
+    weight_sum = float(sum(wt for _runner, wt in branches))
+    if weight_sum <= 0:
+        weight_sum = 1.0
+    weights = [float(wt) / weight_sum for _runner, wt in branches]
+    runners = [runner for runner, _wt in branches]
+
+    run: List[Tuple[int, int]] = []
+    for y0, x0 in origins:
+        if fill is None or fill.needs_inference(y0, x0):
+            run.append((y0, x0))
+        else:
+            accum[y0 - row0 : y0 - row0 + t, x0 : x0 + t] += fill.tile(y0, x0)
+    if stats is not None:
+        stats.tiles_total += len(origins)
+        stats.tiles_run += len(run)
+        stats.tiles_skipped += len(origins) - len(run)
+    if advance is not None and len(origins) > len(run):
+        advance(len(origins) - len(run), False)
+
+    batch_tiles = int(batch_tiles) if batch_tiles > 0 else max(1, len(run))
+    pool = _get_fusion_pool() if parallel and len(runners) > 1 else None
+
+    for b0 in range(0, len(run), batch_tiles):
+        batch = run[b0 : b0 + batch_tiles]
+        tiles = tiles_fn(batch)
+        if pool is not None:
+            others = [pool.submit(r, tiles) for r in runners[1:]]
+            branch_probs = [runners[0](tiles)] + [f.result() for f in others]
+        else:
+            branch_probs = [r(tiles) for r in runners]
+        for i, (y0, x0) in enumerate(batch):
+            region = accum[y0 - row0 : y0 - row0 + t, x0 : x0 + t]
+            for probs, wt in zip(branch_probs, weights):
+                if wt == 1.0:
+                    region += probs[i]
+                else:
+                    region += probs[i] * wt
+        if advance is not None:
+            advance(len(batch), True)
+
+
+def _tile_counter(total: int, progress: Optional[TileProgress]) -> Optional[Callable[[int, bool], None]]:
+    if progress is None:
+        return None
+    done = [0, 0]  # finished, of which run
+
+    def advance(n: int, ran: bool) -> None:
+        done[0] += n
+        if ran:
+            done[1] += n
+        progress(done[0], total, done[1])
+
+    return advance
+
+
+def fused_tile_inference(
+    tiled: TiledImage,
+    branches: Sequence[Tuple[TileRunner, float]],
+    batch_tiles: int = 1,
+    parallel: bool = False,
+    fill: Optional[CoarseFill] = None,
+    stats: Optional[TileStats] = None,
+    progress: Optional[TileProgress] = None,
+) -> np.ndarray:
+    """
+    Run one or more models over the same tiles and blend them into a single
+    probability map. parallel=True runs the branches of each batch
+    concurrently; otherwise they are interleaved batch by batch.
+    batch_tiles <= 0 hands every tile to the runners in one call, which is how
+    the cross-request scheduler receives a whole image at once.
+    With `fill`, tiles the coarse map rules out are not run; the coarse
+    probabilities are blended in for them instead. Counts go into `stats`.
+    """
+    H, W = tiled.tensor.shape[1:]
+    t = tiled.tile_size
     accum = np.zeros((H, W), dtype=np.float32)
-    count = np.zeros((H, W), dtype=np.float32)
+    origins = tiled.origins
+    advance = _tile_counter(len(origins), progress)
+    _blend_tiles(accum, 0, origins, tiled.tiles, branches, t, batch_tiles, parallel, fill, stats, advance)
 
-    model.eval()
-    with torch.no_grad():
-        for y0 in range(0, H - tile_size + 1, stride):
-            for x0 in range(0, W - tile_size + 1, stride):
-                tile = img_pad[y0 : y0 + tile_size, x0 : x0 + tile_size]
-                x = normalize_tile(tile, mean, std).to(device)
-                logits = model(x)
-                probs = torch.sigmoid(logits).squeeze(0).squeeze(0).cpu().numpy()
-                accum[y0 : y0 + tile_size, x0 : x0 + tile_size] += probs
-                count[y0 : y0 + tile_size, x0 : x0 + tile_size] += 1.0
+    prob_map = accum[: tiled.h, : tiled.w]
+    _divide_by_coverage(prob_map, _coverage(tiled.ys, t, H)[: tiled.h], _coverage(tiled.xs, t, W)[: tiled.w])
+    return prob_map
+
+
+def stream_tile_inference(
+    img_bgr: np.ndarray,
+    branches: Sequence[Tuple[TileRunner, float]],
+    tile_size: int,
+    overlap: float,
+    mean: np.ndarray,
+    std: np.ndarray,
+    thr: float,
+    batch_tiles: int = 1,
+    parallel: bool = False,
+    fill: Optional[CoarseFill] = None,
+    stats: Optional[TileStats] = None,
+    progress: Optional[TileProgress] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Memory-bounded variant of fused_tile_inference that walks the image one
+    tile row (band) at a time. Only a tile-high band of the image is converted,
+    padded (edge bands/columns only) and normalized at once, and blending uses
+    a rolling tile-high accumulator. Rows no later band can touch are divided
+    by the analytic overlap count and written straight to the outputs.
+    Returns (mask, prob_map): a 0/255 uint8 mask thresholded at `thr`, and the
+    fused probabilities stored as float16.
+    """
+    h, w = img_bgr.shape[:2]
+    t = int(tile_size)
+    ys, xs, pad_h, pad_w = tile_grid(h, w, t, overlap)
+    H, W = h + pad_h, w + pad_w
+    cov_y = _coverage(ys, t, H)
+    cov_x = _coverage(xs, t, W)[:w]
+    col_idx = _reflect101(np.arange(W), w) if pad_w > 0 else None
+
+    mask = np.empty((h, w), dtype=np.uint8)
+    prob_map = np.empty((h, w), dtype=np.float16)
+    buf = np.zeros((t, W), dtype=np.float32)
+    advance = _tile_counter(len(ys) * len(xs), progress)
+
+    for r, y0 in enumerate(ys):
+        if y0 + t <= h:
+            band = img_bgr[y0 : y0 + t]
+        else:
+            band = img_bgr[_reflect101(np.arange(y0, y0 + t), h)]
+        if col_idx is not None:
+            band = band[:, col_idx]
+        band_t = normalize_image(band[:, :, ::-1], mean, std)
+        del band
+
+        _blend_tiles(
+            buf,
+            y0,
+            [(y0, x0) for x0 in xs],
+            lambda batch: [band_t[:, :, x0 : x0 + t] for _y0, x0 in batch],
+            branches,
+            t,
+            batch_tiles,
+            parallel,
+            fill,
+            stats,
+            advance,
+        )
+        del band_t
 
-    count = np.maximum(count, 1.0)
-    prob_map = accum / count
-    return prob_map[:h, :w]
+        n_done = ys[r + 1] - y0 if r + 1 < len(ys) else t
+        r1 = min(y0 + n_done, h)
+        if r1 > y0:
+            rows = buf[: r1 - y0, :w]
+            _divide_by_coverage(rows, cov_y[y0:r1], cov_x)
+            prob_map[y0:r1] = rows
+            mask[y0:r1] = rows >= float(thr)
+            mask[y0:r1] *= 255
+        buf[: t - n_done] = buf[n_done:]
+        buf[t - n_done :] = 0.0
+
+    return mask, prob_map
+
+
+def tile_inference(
+    model: torch.nn.Module,
+    img_rgb: np.ndarray,
+    tile_size: int,
+    overlap: float,
+    mean: np.ndarray,
+    std: np.ndarray,
+    device: torch.device,
+    batch_tiles: int = 1,
+    runner: Optional[TileRunner] = None,
+) -> np.ndarray:
+    """Sliding-window inference with overlap averaging for a single model."""
+    if runner is None:
+        model.eval()
+        runner = partial(_forward_tiles, model, device)
+    tiled = prepare_tiles(img_rgb, tile_size, overlap, mean, std)
+    return fused_tile_inference(tiled, [(runner, 1.0)], batch_tiles)
 
 
 def predict_prob_map(
-    name: str,
+    model: torch.nn.Module,
     img_bgr: np.ndarray,
-    encoder: str,
     tile_size: int,
     mean: np.ndarray,
     std: np.ndarray,
-    ckpt_path: Path,
     overlap: float,
     device: torch.device,
+    batch_tiles: int = 1,
+    runner: Optional[TileRunner] = None,
 ) -> np.ndarray:
-    model = build_model(str(name), str(encoder)).to(device)
-    load_checkpoint(model, ckpt_path, device)
-
     img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    prob_map = tile_inference(model, img_rgb, tile_size, overlap, mean, std, device)
+    prob_map = tile_inference(model, img_rgb, tile_size, overlap, mean, std, device, batch_tiles, runner)
     return prob_map
 
 
@@ -153,137 +530,400 @@ def _clean_mask(mask: np.ndarray, kernel_size: int, iterations: int) -> np.ndarr
     return out
 
 
-def _normalize_github_url(url: str) -> str:
-    if "github.com" in url and "/blob/" in url:
-        parts = url.split("github.com/", 1)[1]
-        parts = parts.replace("/blob/", "/", 1)
-        return "https://raw.githubusercontent.com/" + parts
-    return url
+def configure_torch_threads() -> None:
+    if settings.gap_torch_threads > 0:
+        torch.set_num_threads(int(settings.gap_torch_threads))
+
 
+def _resolve_device() -> torch.device:
+    if settings.gap_device:
+        return torch.device(settings.gap_device)
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-def _download_file(url: str, dst_path: Path) -> None:
-    dst_path.parent.mkdir(parents=True, exist_ok=True)
-    tmp_path = dst_path.with_suffix(dst_path.suffix + ".tmp")
-    # Use certifi CA bundle to avoid missing system certs in containers.
-    context = ssl.create_default_context(cafile=certifi.where())
-    with urllib.request.urlopen(url, context=context) as resp, open(tmp_path, "wb") as f:
-        f.write(resp.read())
-    tmp_path.replace(dst_path)
 
+def _model_checkpoint(name: str) -> Path:
+    return model_checkpoint(name)
+
+
+def load_eager_model(name: str, device: torch.device) -> Tuple[torch.nn.Module, Path]:
+    ckpt_path = _model_checkpoint(name)
+    model = build_model(name, settings.gap_encoder).to(device)
+    load_checkpoint(model, ckpt_path, device)
+    model.eval()
+    return model, ckpt_path
+
+
+def _eager_for_export(name: str) -> torch.nn.Module:
+    return load_eager_model(name, torch.device("cpu"))[0]
+
+
+def artifact_source(name: str) -> Dict[str, str]:
+    """What an exported or quantized artifact of `name` is built from; recorded next to it."""
+    ckpt = _model_checkpoint(name)
+    return {
+        "model": name,
+        "encoder": settings.gap_encoder,
+        "checkpoint_sha256": sha256_file(ckpt) if ckpt.exists() else "",
+    }
+
+
+def _model_precision(name: str) -> str:
+    return settings.gap_unetpp_precision if name == "unetpp" else settings.gap_dlv3_precision
+
+
+def calibration_tiles(folder: Path, tile_size: int, max_tiles: int, seed: int = 0) -> List[np.ndarray]:
+    """
+    Normalized (1, 3, t, t) tiles for static int8 calibration: every tile of
+    every image in `folder`, uniformly subsampled to max_tiles with a fixed seed.
+    """
+    from app.services.image_io import decode_image_upload
+
+    paths = sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if not paths:
+        raise FileNotFoundError(f"No calibration images in {folder}")
+    tiles: List[np.ndarray] = []
+    for path in paths:
+        bgr = decode_image_upload(path.read_bytes())
+        tiled = prepare_tiles(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), tile_size, settings.gap_overlap, NORMALIZE_MEAN, NORMALIZE_STD)
+        tiles.extend(t.unsqueeze(0).numpy().copy() for t in tiled.tiles(tiled.origins))
+    if len(tiles) > max_tiles > 0:
+        keep = np.random.default_rng(seed).choice(len(tiles), size=max_tiles, replace=False)
+        tiles = [tiles[i] for i in sorted(keep)]
+    return tiles
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of ready-to-run segmentation models.
+    Each model is built, loaded, switched to eval() and warmed up exactly once;
+    afterwards get() is a lock-free dict lookup. Eval-mode forward passes under
+    no_grad do not mutate module state, so one instance is shared by all threads.
+    `precisions` overrides the per-model GM_GAP_*_PRECISION settings (used to
+    compare precisions side by side).
+    """
+
+    def __init__(self, precisions: Optional[Dict[str, str]] = None) -> None:
+        self._precisions = dict(precisions or {})
+        self._models: Dict[str, LoadedModel] = {}
+        self._schedulers: Dict[str, BatchingScheduler] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> LoadedModel:
+        entry = self._models.get(name)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None:
+                entry = self._load(name)
+                self._models[name] = entry
+        return entry
+
+    def load_all(self) -> None:
+        names = ["unetpp", "deeplabv3plus"] if settings.gap_use_fusion else ["unetpp"]
+        for name in names:
+            self.get(name)
+
+    def scheduler(self, name: str) -> BatchingScheduler:
+        sched = self._schedulers.get(name)
+        if sched is not None:
+            return sched
+        entry = self.get(name)
+        with self._lock:
+            sched = self._schedulers.get(name)
+            if sched is None:
+                sched = BatchingScheduler(
+                    name,
+                    entry.model,
+                    entry.device,
+                    max_batch=settings.gap_scheduler_max_batch,
+                    max_wait_ms=settings.gap_scheduler_max_wait_ms,
+                )
+                self._schedulers[name] = sched
+        return sched
+
+    def runner(self, name: str) -> TileRunner:
+        """Shared micro-batching runner when GM_GAP_SCHEDULER is on, else inline forward passes."""
+        if settings.gap_scheduler_enabled:
+            return self.scheduler(name).run
+        entry = self.get(name)
+        return partial(_forward_tiles, entry.model, entry.device)
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"load_ms": entry.load_ms, "warmup_ms": entry.warmup_ms}
+            for name, entry in self._models.items()
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            for sched in self._schedulers.values():
+                sched.close()
+            self._schedulers.clear()
+            self._models.clear()
+
+    def _load(self, name: str) -> LoadedModel:
+        device = _resolve_device()
+        backend = settings.gap_backend
+        precision = self._precisions.get(name) or _model_precision(name)
+        t0 = time.perf_counter()
+        if precision.startswith("int8"):
+            backend = "onnx"
+            device = torch.device("cpu")
+            ckpt_path = self._int8_artifact(name, precision)
+            model = OnnxSegModel(ckpt_path, intra_op_threads=settings.gap_onnx_threads)
+        elif backend == "torch":
+            model, ckpt_path = load_eager_model(name, device)
+        else:
+            # Exported runtimes are CPU-oriented; the eager model is only built
+            # when the artifact has to be exported first.
+            ckpt_path = self._fp32_artifact(name, backend)
+            model = load_backend_model(backend, ckpt_path, device, settings.gap_onnx_threads)
+        if precision == "bf16":
+            if backend == "onnx":
+                log.warning("%s: bf16 is not used with the onnx backend; running fp32", name)
+                precision = "fp32"
+            elif device.type == "cpu" and not cpu_supports_bf16():
+                log.warning("%s: CPU has no native bf16; running fp32", name)
+                precision = "fp32"
+            else:
+                model = BF16Autocast(model)
+        t1 = time.perf_counter()
+
+        tile_size = int(settings.gap_tile_size)
+        with torch.no_grad():
+            model(torch.zeros((1, 3, tile_size, tile_size), dtype=torch.float32, device=device))
+        t2 = time.perf_counter()
+
+        entry = LoadedModel(
+            name=name,
+            model=model,
+            device=device,
+            ckpt_path=ckpt_path,
+            load_ms=(t1 - t0) * 1000.0,
+            warmup_ms=(t2 - t1) * 1000.0,
+            backend=backend,
+            precision=precision,
+        )
+        log.info(
+            "Loaded %s (%s, %s) from %s on %s (load %.0f ms, warm-up %.0f ms)",
+            name, backend, precision, ckpt_path, device, entry.load_ms, entry.warmup_ms,
+        )
+        return entry
+
+    def _fp32_artifact(self, name: str, backend: str) -> Path:
+        return ensure_artifact(
+            backend,
+            artifact_path(Path(settings.gap_export_dir), name, backend),
+            int(settings.gap_tile_size),
+            partial(_eager_for_export, name) if settings.gap_auto_export else None,
+            artifact_source(name),
+        )
 
-def _resolve_checkpoint(local_path: Path, url: str, cache_dir: Path) -> Path:
-    if url:
-        normalized = _normalize_github_url(url)
-        filename = Path(urllib.parse.urlparse(normalized).path).name
-        if not filename:
-            filename = local_path.name
-        cached = cache_dir / filename
-        if not cached.exists():
-            _download_file(normalized, cached)
-        return cached
-    return local_path
+    def _int8_artifact(self, name: str, precision: str) -> Path:
+        dst = quantized_artifact_path(Path(settings.gap_export_dir), name, precision)
+        source = artifact_source(name)
+        if reusable_artifact(dst, source, can_rebuild=settings.gap_auto_export):
+            return dst
+        if not settings.gap_auto_export:
+            raise FileNotFoundError(f"{dst} not found; run `python -m app.cli export-models --precision {precision}`")
+        with file_lock(lock_path(dst)):
+            if reusable_artifact(dst, source, can_rebuild=True):
+                return dst  # another worker quantized it meanwhile
+            calibration = None
+            if precision == "int8_static":
+                if not settings.gap_calibration_dir:
+                    raise ValueError("int8_static needs GM_GAP_CALIBRATION_DIR")
+                calibration = calibration_tiles(
+                    Path(settings.gap_calibration_dir), int(settings.gap_tile_size), settings.gap_calibration_tiles
+                )
+            log.info("Quantizing %s to %s", name, dst)
+            quantize_onnx(self._fp32_artifact(name, "onnx"), dst, precision, calibration)
+            write_source(dst, source)
+        return dst
+
+
+model_registry = ModelRegistry()
+
+
+def default_registry():
+    """model_registry, or the model-server client when GM_GAP_SERVER_SOCKET is set."""
+    if settings.gap_server_socket:
+        from app.services.model_server import model_server_client
+
+        return model_server_client()
+    return model_registry
+
+
+def _iter_by_area_desc(areas: np.ndarray, labels: np.ndarray, k: int):
+    """
+    Yield labels ordered by area (descending, ties by label) without sorting
+    everything when only the first few are needed: each round partitions out
+    the next ~k largest (all ties included), sorts just those, and doubles k.
+    """
+    remaining = np.arange(areas.shape[0])
+    chunk = 2 * k if k > 0 else areas.shape[0]
+    while remaining.size:
+        rem_areas = areas[remaining]
+        if chunk >= remaining.size:
+            sel = remaining
+            remaining = remaining[:0]
+        else:
+            kth = np.partition(rem_areas, rem_areas.size - chunk)[rem_areas.size - chunk]
+            sel = remaining[rem_areas >= kth]
+            remaining = remaining[rem_areas < kth]
+        order = np.lexsort((labels[sel], -areas[sel]))
+        yield from labels[sel[order]].tolist()
+        chunk *= 2
 
 
 def _quads_from_mask(mask: np.ndarray, min_area_px: int, min_len_px: float, max_quads: int) -> List[GapQuad]:
     bin_mask = (mask > 0).astype(np.uint8)
     num, labels, stats, _ = cv2.connectedComponentsWithStats(bin_mask, connectivity=8)
-    quads: List[GapQuad] = []
-
-    candidates = []
-    for label in range(1, num):
-        area = int(stats[label, cv2.CC_STAT_AREA])
-        if area < min_area_px:
-            continue
-
-        ys, xs = np.where(labels == label)
-        if xs.size < 4:
-            continue
+    if num <= 1:
+        return []
+
+    comp = stats[1:]
+    areas = comp[:, cv2.CC_STAT_AREA].astype(np.int64)
+    bw = comp[:, cv2.CC_STAT_WIDTH].astype(np.float64)
+    bh = comp[:, cv2.CC_STAT_HEIGHT].astype(np.float64)
+    # minAreaRect of the pixel centres never has more area than their axis-aligned
+    # box ((w-1) x (h-1)), so its short side is at most sqrt of that; components
+    # failing this bound cannot pass the min-side test and skip geometry entirely.
+    min_len = float(min_len_px)
+    keep = (areas >= max(int(min_area_px), 4)) & ((bw - 1.0) * (bh - 1.0) >= 0.99 * min_len * min_len)
+    cand = np.nonzero(keep)[0]
+    if cand.size == 0:
+        return []
 
-        pts = np.column_stack([xs, ys]).astype(np.float32)
+    quads: List[GapQuad] = []
+    for label in _iter_by_area_desc(areas[cand], cand + 1, max_quads):
+        x = int(stats[label, cv2.CC_STAT_LEFT])
+        y = int(stats[label, cv2.CC_STAT_TOP])
+        w = int(stats[label, cv2.CC_STAT_WIDTH])
+        h = int(stats[label, cv2.CC_STAT_HEIGHT])
+        ys, xs = np.nonzero(labels[y : y + h, x : x + w] == label)
+
+        pts = np.column_stack([xs + x, ys + y]).astype(np.float32)
         rect = cv2.minAreaRect(pts)
-        (w, h) = rect[1]
-        if min(w, h) < float(min_len_px):
+        (rw, rh) = rect[1]
+        if min(rw, rh) < min_len:
             continue
 
         box = cv2.boxPoints(rect)
-        quad_pts = [(int(round(p[0])), int(round(p[1]))) for p in box]
-        candidates.append((area, quad_pts))
-
-    candidates.sort(key=lambda x: -x[0])
-    for _area, quad_pts in candidates:
-        quads.append(GapQuad(points=quad_pts))
+        quads.append(GapQuad(points=[(int(round(p[0])), int(round(p[1]))) for p in box]))
         if max_quads > 0 and len(quads) >= max_quads:
             break
 
     return quads
 
 
-def detect_gaps(img_bgr: np.ndarray) -> GapDetectionResult:
-    device = torch.device(settings.gap_device) if settings.gap_device else torch.device(
-        "cuda" if torch.cuda.is_available() else "cpu"
-    )
+def _offset_quads(quads: List[GapQuad], dx: int, dy: int) -> List[GapQuad]:
+    if dx == 0 and dy == 0:
+        return quads
+    return [GapQuad(points=[(x + dx, y + dy) for x, y in q.points]) for q in quads]
+
+
+def quads_from_prob_map(
+    prob_map: np.ndarray,
+    thr: float,
+    morph_kernel: int,
+    morph_iterations: int,
+    min_area_px: int,
+    min_len_px: float,
+    max_quads: int,
+    roi: Optional[Tuple[int, int, int, int]] = None,
+) -> List[GapQuad]:
+    """Threshold -> morphology -> quads on an existing probability map; no inference."""
+    mask = (prob_map >= float(thr)).astype(np.uint8) * 255
+    mask = _clean_mask(mask, morph_kernel, morph_iterations)
+    quads = _quads_from_mask(mask, min_area_px, min_len_px, max_quads)
+    if roi is not None:
+        quads = _offset_quads(quads, roi[0], roi[1])
+    return quads
+
+
+def detect_gaps(
+    img_bgr: np.ndarray,
+    roi: Optional[Tuple[int, int, int, int]] = None,
+    progress: Optional[TileProgress] = None,
+    registry: Optional[ModelRegistry] = None,
+) -> GapDetectionResult:
+    """
+    Segment gaps and extract one quad per gap. With `roi` (x0, y0, x1, y1 in
+    pixels) only that crop reaches the networks; quads are mapped back to
+    full-image coordinates. `progress` follows the full-resolution tile pass.
+    `registry` defaults to default_registry().
+    """
+    registry = registry or default_registry()
+    if roi is not None:
+        rx0, ry0, rx1, ry1 = roi
+        img_bgr = img_bgr[ry0:ry1, rx0:rx1]
 
-    encoder = settings.gap_encoder
     tile_size = settings.gap_tile_size
     overlap = settings.gap_overlap
-
-    cache_dir = Path(settings.gap_model_cache_dir)
-    unet_ckpt = _resolve_checkpoint(
-        Path(settings.gap_unetpp_ckpt).resolve(),
-        settings.gap_unetpp_url,
-        cache_dir,
-    )
-    dlv3_ckpt = _resolve_checkpoint(
-        Path(settings.gap_dlv3_ckpt).resolve(),
-        settings.gap_dlv3_url,
-        cache_dir,
-    )
+    # With the scheduler on, each request hands over all of its tiles at once and
+    # the scheduler forms the batches across requests.
+    batch_tiles = 0 if settings.gap_scheduler_enabled else resolve_batch_tiles(tile_size)
 
     if settings.gap_use_fusion:
-        unet_prob = predict_prob_map(
-            "unetpp",
+        branches = [
+            (registry.runner("unetpp"), settings.gap_fusion_unetpp_weight),
+            (registry.runner("deeplabv3plus"), settings.gap_fusion_dlv3_weight),
+        ]
+        thr = settings.gap_fusion_thr
+    else:
+        branches = [(registry.runner("unetpp"), 1.0)]
+        thr = settings.gap_unetpp_thr
+
+    h, w = img_bgr.shape[:2]
+    parallel = settings.gap_fusion_parallel
+
+    fill: Optional[CoarseFill] = None
+    scale = float(settings.gap_coarse_scale)
+    if settings.gap_coarse_enabled and 0.0 < scale < 1.0:
+        small = cv2.resize(
             img_bgr,
-            encoder,
-            tile_size,
-            NORMALIZE_MEAN,
-            NORMALIZE_STD,
-            unet_ckpt,
-            overlap,
-            device,
+            (max(1, int(round(w * scale))), max(1, int(round(h * scale)))),
+            interpolation=cv2.INTER_AREA,
         )
-        dlv3_prob = predict_prob_map(
-            "deeplabv3plus",
+        coarse_tiled = prepare_tiles(cv2.cvtColor(small, cv2.COLOR_BGR2RGB), tile_size, overlap, NORMALIZE_MEAN, NORMALIZE_STD)
+        coarse = fused_tile_inference(coarse_tiled, branches, batch_tiles, parallel=parallel)
+        fill = CoarseFill(coarse, h, w, tile_size, settings.gap_coarse_thr)
+        del small, coarse_tiled
+
+    stats = TileStats()
+    if settings.gap_streaming:
+        mask, prob_map = stream_tile_inference(
             img_bgr,
-            encoder,
+            branches,
             tile_size,
+            overlap,
             NORMALIZE_MEAN,
             NORMALIZE_STD,
-            dlv3_ckpt,
-            overlap,
-            device,
+            thr,
+            batch_tiles,
+            parallel=parallel,
+            fill=fill,
+            stats=stats,
+            progress=progress,
         )
-        w_unet = settings.gap_fusion_unetpp_weight
-        w_dlv3 = settings.gap_fusion_dlv3_weight
-        weight_sum = w_unet + w_dlv3
-        if weight_sum <= 0:
-            weight_sum = 1.0
-        prob_map = (unet_prob * w_unet + dlv3_prob * w_dlv3) / weight_sum
-        thr = settings.gap_fusion_thr
     else:
-        prob_map = predict_prob_map(
-            "unetpp",
-            img_bgr,
-            encoder,
-            tile_size,
-            NORMALIZE_MEAN,
-            NORMALIZE_STD,
-            unet_ckpt,
-            overlap,
-            device,
+        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+        tiled = prepare_tiles(img_rgb, tile_size, overlap, NORMALIZE_MEAN, NORMALIZE_STD)
+        del img_rgb
+        prob_map = fused_tile_inference(
+            tiled,
+            branches,
+            batch_tiles,
+            parallel=parallel,
+            fill=fill,
+            stats=stats,
+            progress=progress,
         )
-        thr = settings.gap_unetpp_thr
+        del tiled
+        mask = (prob_map >= float(thr)).astype(np.uint8) * 255
 
-    mask = (prob_map >= float(thr)).astype(np.uint8) * 255
     mask = _clean_mask(mask, settings.gap_morph_kernel, settings.gap_morph_iterations)
     quads = _quads_from_mask(
         mask,
@@ -292,4 +932,7 @@ def detect_gaps(img_bgr: np.ndarray) -> GapDetectionResult:
         settings.gap_max_segments,
     )
 
-    return GapDetectionResult(quads=quads, prob_map=prob_map, mask=mask)
+    if roi is not None:
+        quads = _offset_quads(quads, roi[0], roi[1])
+
+    return GapDetectionResult(quads=quads, prob_map=prob_map, mask=mask, stats=stats, roi=roi)
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import json
+import os
+import threading
 import numpy as np
 import cv2
 
@@ -33,6 +35,38 @@ def _apply_homography_points(H: np.ndarray, pts: np.ndarray) -> np.ndarray:
         raise ValueError("Invalid homography projection")
     return out
 
+def inspection_roi_px(
+    H_mm_to_pix: np.ndarray,
+    rect_mm: Sequence[float],
+    margin_px: int,
+    img_w: int,
+    img_h: int,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Project an axis-aligned board-space rectangle (x0, y0, x1, y1 in mm) into
+    the image and return its pixel bounding box (x0, y0, x1, y1) grown by
+    margin_px and clipped to the image. None when the region cannot be
+    projected (e.g. it crosses the horizon) or falls outside the image.
+    """
+    x0, y0, x1, y1 = (float(v) for v in rect_mm)
+    corners = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float64)
+    pts_h = np.hstack([corners, np.ones((4, 1), dtype=np.float64)])
+    if np.any((H_mm_to_pix @ pts_h.T)[2] <= 0):
+        return None
+    try:
+        px = _apply_homography_points(H_mm_to_pix, corners)
+    except ValueError:
+        return None
+
+    m = max(0, int(margin_px))
+    rx0 = max(0, int(np.floor(px[:, 0].min())) - m)
+    ry0 = max(0, int(np.floor(px[:, 1].min())) - m)
+    rx1 = min(int(img_w), int(np.ceil(px[:, 0].max())) + m + 1)
+    ry1 = min(int(img_h), int(np.ceil(px[:, 1].max())) + m + 1)
+    if rx1 <= rx0 or ry1 <= ry0:
+        return None
+    return rx0, ry0, rx1, ry1
+
 def _load_board_layout(path: str) -> Dict[int, Dict[str, float]]:
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -56,6 +90,52 @@ def _marker_corners_mm(x_mm: float, y_mm: float, L_mm: float, rotation_deg: floa
     R = _rot2d(np.deg2rad(rotation_deg))
     return (local @ R.T) + np.array([x_mm, y_mm], dtype=np.float64)
 
+@dataclass(frozen=True)
+class BoardLayoutIndex:
+    marker_ids: np.ndarray   # (N,) int64, read-only
+    row_of_id: np.ndarray    # dense marker id -> row lookup, -1 where absent
+    corners_mm: np.ndarray   # (N,4,2) float64 board corners, read-only
+    marker_length_mm: float
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        """Row per marker id (vectorized); -1 for ids not on the board."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        out = np.full(ids.shape, -1, dtype=np.int64)
+        valid = (ids >= 0) & (ids < self.row_of_id.shape[0])
+        out[valid] = self.row_of_id[ids[valid]]
+        return out
+
+def _build_board_index(path: str, L_mm: float) -> BoardLayoutIndex:
+    board_map = _load_board_layout(path)
+    marker_ids = np.array(sorted(board_map.keys()), dtype=np.int64)
+    corners = np.empty((marker_ids.shape[0], 4, 2), dtype=np.float64)
+    for row, mid in enumerate(marker_ids.tolist()):
+        info = board_map[mid]
+        corners[row] = _marker_corners_mm(info["x_mm"], info["y_mm"], L_mm, info["rotation_deg"])
+    size = int(marker_ids.max()) + 1 if marker_ids.size else 0
+    row_of_id = np.full(size, -1, dtype=np.int64)
+    row_of_id[marker_ids] = np.arange(marker_ids.shape[0], dtype=np.int64)
+    for arr in (marker_ids, row_of_id, corners):
+        arr.setflags(write=False)
+    return BoardLayoutIndex(marker_ids=marker_ids, row_of_id=row_of_id, corners_mm=corners, marker_length_mm=float(L_mm))
+
+_board_index_cache: Dict[Tuple[str, float], Tuple[int, BoardLayoutIndex]] = {}
+_board_index_lock = threading.Lock()
+
+def load_board_index(path: str, L_mm: float) -> BoardLayoutIndex:
+    """Compiled board layout, rebuilt only when the file's mtime changes."""
+    key = (os.path.abspath(path), float(L_mm))
+    mtime = os.stat(key[0]).st_mtime_ns
+    cached = _board_index_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _board_index_lock:
+        cached = _board_index_cache.get(key)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, _build_board_index(key[0], L_mm))
+            _board_index_cache[key] = cached
+    return cached[1]
+
 def qa_homography(cond_number: float, reproj_rms_mm: float, reproj_max_mm: float,
                   max_cond_number: float, catastrophic_rms_mm: float, catastrophic_cond: float,
                   multi: bool) -> Tuple[bool, str, List[str]]:
@@ -100,27 +180,16 @@ def compute_homography(
     img_w: int,
     img_h: int,
 ) -> HomographyResult:
-    board_map = _load_board_layout(board_layout_path)
-    allowed_ids = set(board_map.keys())
-    dets = [d for d in detections if d.marker_id in allowed_ids] or detections
+    board = load_board_index(board_layout_path, L_multi_mm)
+    rows = board.rows(np.array([d.marker_id for d in detections], dtype=np.int64))
+    on_board = rows >= 0
+    dets = [d for d, ok in zip(detections, on_board) if ok] or detections
 
     # Prefer multi-marker with known board layout
-    multi_candidates = [d for d in dets if d.marker_id in allowed_ids]
+    multi_candidates = [d for d, ok in zip(detections, on_board) if ok]
     if len(multi_candidates) >= 2:
-        img_pts_all: List[np.ndarray] = []
-        mm_pts_all: List[np.ndarray] = []
-        used_candidates: List[MarkerDetection] = []
-
-        for d in multi_candidates:
-            info = board_map[d.marker_id]
-            mm_corners = _marker_corners_mm(info["x_mm"], info["y_mm"], L_multi_mm, info["rotation_deg"])
-            img_corners = d.corners_refined.astype(np.float64)
-            img_pts_all.append(img_corners)
-            mm_pts_all.append(mm_corners)
-            used_candidates.append(d)
-
-        img_pts = np.vstack(img_pts_all).reshape(-1, 2)
-        mm_pts = np.vstack(mm_pts_all).reshape(-1, 2)
+        img_pts = np.stack([d.corners_refined for d in multi_candidates]).astype(np.float64).reshape(-1, 2)
+        mm_pts = board.corners_mm[rows[on_board]].reshape(-1, 2)
         total_corr = int(img_pts.shape[0])
 
         H, mask = cv2.findHomography(
@@ -140,7 +209,7 @@ def compute_homography(
                 mx = float(np.max(err))
                 cond = float(np.linalg.cond(H)) if np.isfinite(H).all() else float("inf")
 
-                used_sorted = sorted(used_candidates, key=lambda d: -marker_score(d, img_w, img_h))
+                used_sorted = sorted(multi_candidates, key=lambda d: -marker_score(d, img_w, img_h))
                 used_marker_id = used_sorted[0].marker_id
 
                 qa_pass, qa_conf, qa_reasons = qa_homography(
@@ -1,10 +1,20 @@
 from __future__ import annotations
 
 import io
+from typing import Tuple
+import warnings
 import numpy as np
 import cv2
 from PIL import Image, ImageOps
 
+_EXIF_ORIENTATION = 0x0112
+_JPEG_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class ImageTooLargeError(ValueError):
+    """Upload exceeds the configured pixel budget; raised before any pixel buffer is allocated."""
+
+
 def decode_image_upload(data: bytes) -> np.ndarray:
     """
     Decode image bytes into BGR np.ndarray.
@@ -19,3 +29,92 @@ def decode_image_upload(data: bytes) -> np.ndarray:
     arr = np.array(im, dtype=np.uint8)  # RGB
     bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
     return bgr
+
+
+def read_image_header(data: bytes) -> Tuple[int, int, int, str]:
+    """
+    (width, height, exif_orientation, format) from the header only; Pillow
+    opens lazily, so no pixel data is decoded. Width/height are as stored,
+    i.e. before orientation is applied. Images past Pillow's decompression-bomb
+    limit (Image.MAX_IMAGE_PIXELS) raise ImageTooLargeError.
+    """
+    if not data:
+        raise ValueError("Empty image payload")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        try:
+            im = Image.open(io.BytesIO(data))
+        except (Image.DecompressionBombError, Image.DecompressionBombWarning) as exc:
+            raise ImageTooLargeError(str(exc)) from exc
+    with im:
+        try:
+            orientation = int(im.getexif().get(_EXIF_ORIENTATION, 1))
+        except Exception:
+            orientation = 1
+        return im.width, im.height, orientation if 1 <= orientation <= 8 else 1, (im.format or "").upper()
+
+
+def apply_exif_orientation(img: np.ndarray, orientation: int) -> np.ndarray:
+    """
+    Apply an EXIF orientation tag as strided views and materialize once, so
+    every case (including transpose + flip) costs a single copy.
+    """
+    if orientation == 1:
+        return img
+    if orientation == 2:
+        view = img[:, ::-1]
+    elif orientation == 3:
+        view = img[::-1, ::-1]
+    elif orientation == 4:
+        view = img[::-1]
+    else:
+        t = img.swapaxes(0, 1)
+        view = {5: t, 6: t[:, ::-1], 7: t[::-1, ::-1], 8: t[::-1]}[orientation]
+    return np.ascontiguousarray(view)
+
+
+def decode_image_fast(data: bytes, max_dim: int = 0, max_pixels: int = 0) -> Tuple[np.ndarray, float]:
+    """
+    Decode straight to BGR with OpenCV, ignoring embedded orientation and
+    applying it afterwards in one pass. For JPEGs with max_dim > 0 the
+    largest DCT reduction (1/2, 1/4, 1/8) that keeps the longest side at or
+    above max_dim is used, so the full-resolution image is never allocated.
+
+    Returns (bgr, scale) where scale is decoded px per original px.
+    Raises ImageTooLargeError if the decoded buffer would exceed max_pixels.
+    """
+    w, h, orientation, fmt = read_image_header(data)
+
+    reduction = 1
+    if max_dim > 0 and fmt in ("JPEG", "MPO"):
+        while reduction < 8 and max(w, h) / (reduction * 2) >= max_dim:
+            reduction *= 2
+    if max_pixels > 0 and (w // reduction) * (h // reduction) > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {w}x{h} ({w * h / 1e6:.1f} MP); the limit is {max_pixels / 1e6:.1f} MP"
+        )
+
+    flags = cv2.IMREAD_IGNORE_ORIENTATION | _JPEG_REDUCED_FLAGS.get(reduction, cv2.IMREAD_COLOR)
+    bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if bgr is None:
+        raise ValueError("Could not decode image payload")
+    scale = bgr.shape[1] / float(w)
+    return apply_exif_orientation(bgr, orientation), scale
+
+
+def decode_image(data: bytes, decoder: str = "pil", max_dim: int = 0, max_pixels: int = 0) -> Tuple[np.ndarray, float]:
+    """
+    Decoder selection for the pipeline. "pil" keeps decode_image_upload
+    (always full resolution, scale 1.0); "fast" uses decode_image_fast.
+    The pixel guard applies to both.
+    """
+    if decoder == "fast":
+        return decode_image_fast(data, max_dim=max_dim, max_pixels=max_pixels)
+    if decoder != "pil":
+        raise ValueError(f"Unknown image decoder: {decoder}")
+    w, h, _orientation, _fmt = read_image_header(data)  # also applies Pillow's bomb limit
+    if max_pixels > 0 and w * h > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {w}x{h} ({w * h / 1e6:.1f} MP); the limit is {max_pixels / 1e6:.1f} MP"
+        )
+    return decode_image_upload(data), 1.0
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+
+from app.core.logging import get_logger
+
+log = get_logger("inference_scheduler")
+
+
+class SchedulerClosedError(RuntimeError):
+    """The scheduler was closed (e.g. app shutdown) before this tile ran."""
+
+
+@dataclass
+class _PendingTile:
+    tile: torch.Tensor  # (3, tile, tile) float32
+    future: Future
+
+
+class BatchingScheduler:
+    """
+    Dynamic micro-batcher in front of one segmentation model.
+
+    Tiles submitted by any number of request threads are queued and a single
+    worker thread groups them into batches: a batch is dispatched as soon as it
+    holds max_batch tiles, or max_wait_ms after its first tile arrived. Only the
+    worker thread runs the model, so concurrent requests no longer compete for
+    torch's intra-op thread pool, and max_wait_ms bounds the queueing delay
+    added to any single tile.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: torch.nn.Module,
+        device: torch.device,
+        max_batch: int,
+        max_wait_ms: float,
+    ) -> None:
+        self.name = name
+        self._model = model
+        self._device = device
+        self._max_batch = max(1, int(max_batch))
+        self._max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[Optional[_PendingTile]]" = queue.Queue()
+        self.batches_run = 0
+        self.tiles_run = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name=f"infer-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, tile: torch.Tensor) -> Future:
+        fut: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise SchedulerClosedError(f"Inference scheduler for {self.name} is closed")
+            self._queue.put(_PendingTile(tile=tile, future=fut))
+        return fut
+
+    def run(self, tiles: Sequence[torch.Tensor]) -> np.ndarray:
+        """Blocking helper: probabilities (N, tile, tile) for the given tiles, in order."""
+        futures = [self.submit(t) for t in tiles]
+        return np.stack([f.result() for f in futures])
+
+    def close(self) -> None:
+        """Stop the worker after the tiles queued so far; later submits raise SchedulerClosedError."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        # Nothing should be left behind the sentinel, but never leave a caller waiting.
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item.future.set_running_or_notify_cancel():
+                item.future.set_exception(SchedulerClosedError(f"Inference scheduler for {self.name} is closed"))
+
+    def _loop(self) -> None:
+        closing = False
+        while not closing:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch: List[_PendingTile] = [first]
+            deadline = time.perf_counter() + self._max_wait_s
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[_PendingTile]) -> None:
+        batch = [p for p in batch if p.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            x = torch.stack([p.tile for p in batch]).to(self._device)
+            with torch.no_grad():
+                probs = torch.sigmoid(self._model(x))[:, 0].cpu().numpy()
+        except Exception as exc:
+            log.exception("Batch of %d tiles failed on %s", len(batch), self.name)
+            for p in batch:
+                p.future.set_exception(exc)
+            return
+        self.batches_run += 1
+        self.tiles_run += len(batch)
+        for p, prob in zip(batch, probs):
+            p.future.set_result(prob)
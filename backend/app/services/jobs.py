@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import threading
+import time
+import uuid
+
+from app.services.pipeline import MeasurementError, PipelineCancelled, ProgressFn
+from app.core.config import settings
+from app.core.logging import get_logger
+
+log = get_logger("jobs")
+
+_FINAL = ("succeeded", "failed", "cancelled")
+
+
+class JobQueueFullError(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = "queued"  # queued | running | succeeded | failed | cancelled
+    stage: Optional[str] = None
+    tiles_done: Optional[int] = None
+    tiles_total: Optional[int] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    result: Any = None
+    error_status: Optional[int] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event)
+    future: Optional[Future] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in _FINAL
+
+
+class JobManager:
+    """
+    In-memory job queue on a bounded local thread pool. Jobs run in this
+    process (whatever GM_PIPELINE_BACKEND is) so their progress callback can
+    record stage events and enforce cancellation: a cancelled job raises
+    PipelineCancelled at its next stage or tile batch. They are bounded by
+    GM_JOBS_WORKERS, not GM_PIPELINE_WORKERS, and with the process backend
+    they use the API process's own models (preloaded by the app lifespan).
+    Finished jobs are kept for retain_s, at most max_retained of them.
+    """
+
+    def __init__(self, workers: int, max_queue: int, retain_s: float, max_retained: int) -> None:
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.retain_s = float(retain_s)
+        self.max_retained = max(1, int(max_retained))
+        self._jobs: Dict[str, Job] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[ProgressFn], Any]) -> Job:
+        """Queue fn(progress); raises JobQueueFullError beyond workers + max_queue active jobs."""
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if not job.done)
+            if active >= self.workers + self.max_queue:
+                raise JobQueueFullError(f"Job queue is full ({active} active jobs); retry later.")
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            job = Job(id=uuid.uuid4().hex)
+            job.events.append({"seq": 0, "stage": "queued"})
+            self._jobs[job.id] = job
+            job.future = self._pool.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def events_since(self, job: Job, seq: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return job.events[seq:]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")  # never started
+        return job
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            pool, self._pool = self._pool, None
+        for job in jobs:
+            if not job.done:
+                self.cancel(job.id)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable[[ProgressFn], Any]) -> None:
+        if job.cancel_requested.is_set():
+            self._finish(job, "cancelled")
+            return
+        with self._lock:
+            job.status = "running"
+            job.started_at = time.time()
+        self._event(job, "running", {})
+
+        def progress(stage: str, **details: Any) -> None:
+            if job.cancel_requested.is_set():
+                raise PipelineCancelled()
+            self._event(job, stage, details)
+
+        try:
+            result = fn(progress)
+        except PipelineCancelled:
+            self._finish(job, "cancelled")
+        except MeasurementError as exc:
+            self._finish(job, "failed", error_status=exc.status_code, error=exc.detail)
+        except Exception:
+            log.exception("job %s failed", job.id)
+            self._finish(job, "failed", error_status=500, error="Measurement failed")
+        else:
+            self._finish(job, "succeeded", result=result)
+
+    def _event(self, job: Job, stage: str, details: Dict[str, Any]) -> None:
+        with self._lock:
+            job.stage = stage
+            if stage == "tiles":
+                job.tiles_done = details.get("done")
+                job.tiles_total = details.get("total")
+            job.events.append({"seq": len(job.events), "stage": stage, **details})
+
+    def _finish(self, job: Job, status: str, result: Any = None, error_status: Optional[int] = None, error: Optional[str] = None) -> None:
+        # Status and the final event change together, so a reader that sees
+        # a finished job has already got every event.
+        with self._lock:
+            if job.done:
+                return
+            job.result = result
+            job.error_status = error_status
+            job.error = error
+            job.finished_at = time.time()
+            job.events.append({"seq": len(job.events), "stage": status})
+            job.status = status
+
+    def _prune(self) -> None:
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.done]
+        expired = {job.id for job in finished if now - (job.finished_at or now) > self.retain_s}
+        overflow = len(finished) - len(expired) - self.max_retained
+        if overflow > 0:
+            kept = [job for job in finished if job.id not in expired]
+            expired.update(job.id for job in kept[:overflow])
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager(
+    workers=settings.jobs_workers,
+    max_queue=settings.jobs_max_queue,
+    retain_s=settings.jobs_retain_s,
+    max_retained=settings.jobs_max_retained,
+)
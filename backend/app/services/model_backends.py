@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+import json
+import os
+
+import numpy as np
+import torch
+
+from app.core.logging import get_logger
+from app.services.checkpoints import file_lock
+
+log = get_logger("model_backends")
+
+BACKENDS = ("torch", "onnx", "torchscript")
+ARTIFACT_SUFFIX = {"onnx": ".onnx", "torchscript": ".ts"}
+# int8 modes always run through ONNX Runtime; bf16 is autocast on the torch backends.
+PRECISIONS = ("fp32", "bf16", "int8_dynamic", "int8_static")
+
+_INPUT_NAME = "tiles"
+_OUTPUT_NAME = "logits"
+
+
+def artifact_path(export_dir: Path, name: str, backend: str) -> Path:
+    return Path(export_dir) / f"{name}{ARTIFACT_SUFFIX[backend]}"
+
+
+def quantized_artifact_path(export_dir: Path, name: str, precision: str) -> Path:
+    return Path(export_dir) / f"{name}.{precision}.onnx"
+
+
+def _tmp_path(dst: Path, suffix: str = ".tmp") -> Path:
+    # Per-process, so concurrent exporters never write into each other's file.
+    return dst.with_name(f"{dst.name}.{os.getpid()}{suffix}")
+
+
+def lock_path(artifact: Path) -> Path:
+    artifact = Path(artifact)
+    return artifact.with_name(artifact.name + ".lock")
+
+
+def source_path(artifact: Path) -> Path:
+    """Sidecar recording what `artifact` was exported from (model, encoder, checkpoint sha256)."""
+    artifact = Path(artifact)
+    return artifact.with_name(artifact.name + ".source.json")
+
+
+def read_source(artifact: Path) -> Optional[Dict[str, str]]:
+    try:
+        return json.loads(source_path(artifact).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def write_source(artifact: Path, source: Dict[str, str]) -> None:
+    dst = source_path(artifact)
+    tmp = _tmp_path(dst)
+    tmp.write_text(json.dumps(source, sort_keys=True), encoding="utf-8")
+    tmp.replace(dst)
+
+
+def reusable_artifact(dst: Path, source: Optional[Dict[str, str]], can_rebuild: bool) -> bool:
+    """
+    Whether an existing artifact may be served for `source`; empty source
+    values (e.g. no local checkpoint to hash) are not compared. A recorded
+    source that differs means the artifact is stale: False when it can be
+    rebuilt, else an error. Artifacts without a record predate them and are
+    rebuilt when possible, otherwise served with a warning.
+    """
+    dst = Path(dst)
+    if not dst.exists():
+        return False
+    if source is None:
+        return True
+    recorded = read_source(dst)
+    if recorded is None:
+        if can_rebuild:
+            log.info("%s has no source record; exporting again", dst)
+            return False
+        log.warning("%s has no source record; cannot check it against the configured checkpoint", dst)
+        return True
+    if all(not value or recorded.get(key) == value for key, value in source.items()):
+        return True
+    if can_rebuild:
+        log.warning("%s was exported from %s, not %s; exporting again", dst, recorded, source)
+        return False
+    raise RuntimeError(
+        f"{dst} was exported from {recorded}, not {source}; run `python -m app.cli export-models` again"
+    )
+
+
+def export_onnx(model: torch.nn.Module, dst: Path, tile_size: int, opset: int = 17) -> Path:
+    """
+    Export an eval-mode segmentation model to ONNX with dynamic batch and
+    spatial axes (tiles are always tile_size, but coarse passes and tests use
+    other sizes). Written to a temp file first so readers never see a partial file.
+    """
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(dst)
+    dummy = torch.zeros((1, 3, tile_size, tile_size), dtype=torch.float32)
+    axes = {0: "n", 2: "h", 3: "w"}
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                model.eval(),
+                dummy,
+                str(tmp),
+                input_names=[_INPUT_NAME],
+                output_names=[_OUTPUT_NAME],
+                dynamic_axes={_INPUT_NAME: axes, _OUTPUT_NAME: axes},
+                opset_version=opset,
+                dynamo=False,
+            )
+        tmp.replace(dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return dst
+
+
+def export_torchscript(model: torch.nn.Module, dst: Path, tile_size: int) -> Path:
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(dst)
+    dummy = torch.zeros((1, 3, tile_size, tile_size), dtype=torch.float32)
+    try:
+        with torch.no_grad():
+            traced = torch.jit.trace(model.eval(), dummy)
+        traced.save(str(tmp))
+        tmp.replace(dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return dst
+
+
+def load_torchscript(path: Path, device: torch.device) -> torch.nn.Module:
+    module = torch.jit.load(str(path), map_location=device)
+    module.eval()
+    return torch.jit.optimize_for_inference(module) if device.type == "cpu" else module
+
+
+class OnnxSegModel:
+    """
+    ONNX Runtime session behind the same call signature as the torch module
+    ((N, 3, H, W) float tensor -> (N, 1, H, W) logits tensor), so the inline
+    runner and the micro-batching scheduler use it unchanged.
+    """
+
+    def __init__(self, path: Path, intra_op_threads: int = 0, inter_op_threads: int = 1) -> None:
+        try:
+            import onnxruntime as ort
+        except ImportError as exc:
+            raise RuntimeError(
+                "GM_GAP_BACKEND=onnx needs onnxruntime; install the 'onnx' extra"
+            ) from exc
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = int(intra_op_threads)
+        opts.inter_op_num_threads = max(1, int(inter_op_threads))
+        self.path = Path(path)
+        self.session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self._input = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        arr = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        (logits,) = self.session.run(None, {self._input: arr})
+        return torch.from_numpy(logits)
+
+    def eval(self) -> "OnnxSegModel":
+        return self
+
+
+def load_backend_model(
+    backend: str,
+    path: Path,
+    device: torch.device,
+    onnx_threads: int = 0,
+) -> Any:
+    if backend == "onnx":
+        return OnnxSegModel(path, intra_op_threads=onnx_threads)
+    if backend == "torchscript":
+        return load_torchscript(path, device)
+    raise ValueError(f"Unknown gap backend: {backend}")
+
+
+def ensure_artifact(
+    backend: str,
+    dst: Path,
+    tile_size: int,
+    build_eager: Optional[Any] = None,
+    source: Optional[Dict[str, str]] = None,
+) -> Path:
+    """
+    Return dst, exporting it from the eager model (build_eager()) if it does
+    not exist yet or was exported from another `source` (see reusable_artifact).
+    Exports hold a lock next to dst, so concurrent workers export it once.
+    """
+    if reusable_artifact(dst, source, can_rebuild=build_eager is not None):
+        return dst
+    if build_eager is None:
+        raise FileNotFoundError(f"{dst} not found; run `python -m app.cli export-models` first")
+    with file_lock(lock_path(dst)):
+        if reusable_artifact(dst, source, can_rebuild=True):
+            return dst  # another worker exported it meanwhile
+        log.info("Exporting %s backend artifact to %s", backend, dst)
+        model = build_eager()
+        if backend == "onnx":
+            export_onnx(model, dst, tile_size)
+        else:
+            export_torchscript(model, dst, tile_size)
+        if source is not None:
+            write_source(dst, source)
+    return dst
+
+
+def quantize_onnx(
+    src: Path,
+    dst: Path,
+    precision: str,
+    calibration: Optional[Iterable[np.ndarray]] = None,
+) -> Path:
+    """
+    int8-quantize an fp32 ONNX export with ONNX Runtime.
+    int8_dynamic: int8 weights, activations quantized per call (ConvInteger);
+    needs no data, but ORT's CPU ConvInteger kernels are slow for conv nets.
+    int8_static: QDQ with per-channel weights and activation ranges calibrated
+    on `calibration`, an iterable of (1, 3, t, t) float32 normalized tiles.
+    """
+    try:
+        from onnxruntime.quantization import (
+            CalibrationDataReader,
+            QuantFormat,
+            QuantType,
+            quantize_dynamic,
+            quantize_static,
+        )
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as exc:
+        raise RuntimeError("int8 gap models need onnxruntime; install the 'onnx' extra") from exc
+
+    class _TileReader(CalibrationDataReader):
+        def __init__(self, tiles: Iterable[np.ndarray]) -> None:
+            self._it = iter(tiles)
+
+        def get_next(self):
+            tile = next(self._it, None)
+            return None if tile is None else {_INPUT_NAME: np.ascontiguousarray(tile, dtype=np.float32)}
+
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    pre = _tmp_path(dst, ".pre.onnx")
+    tmp = _tmp_path(dst)
+    try:
+        quant_pre_process(str(src), str(pre), skip_symbolic_shape=True)
+        if precision == "int8_dynamic":
+            quantize_dynamic(str(pre), str(tmp), weight_type=QuantType.QInt8)
+        elif precision == "int8_static":
+            if calibration is None:
+                raise ValueError("int8_static needs calibration tiles (GM_GAP_CALIBRATION_DIR)")
+            quantize_static(
+                str(pre),
+                str(tmp),
+                _TileReader(calibration),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+        else:
+            raise ValueError(f"Not an int8 precision: {precision}")
+        tmp.replace(dst)
+    finally:
+        pre.unlink(missing_ok=True)
+        tmp.unlink(missing_ok=True)
+    return dst
+
+
+def cpu_supports_bf16() -> bool:
+    """Native bf16 matmul/conv (AVX512-BF16 or AMX); emulated bf16 is slower than fp32."""
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return any(bool(getattr(torch.cpu, fn, lambda: False)()) for fn in checks)
+
+
+class BF16Autocast:
+    """Runs the wrapped module under bf16 autocast and hands fp32 logits back."""
+
+    def __init__(self, model: Any) -> None:
+        self.model = model
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        with torch.autocast(device_type=x.device.type, dtype=torch.bfloat16):
+            return self.model(x).float()
+
+    def eval(self) -> "BF16Autocast":
+        return self
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+import torch
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+log = get_logger("model_server")
+
+_HEADER = struct.Struct("!I")
+_MAX_MESSAGE = 1 << 20
+_MIN_SEGMENT = 16 << 20
+
+
+def _send(sock: socket.socket, msg: Dict[str, Any]) -> None:
+    body = json.dumps(msg).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("model server connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > _MAX_MESSAGE:
+        raise ConnectionError(f"model server message too large ({size} bytes)")
+    return json.loads(_recv_exact(sock, size))
+
+
+def _attach(name: str, owner_pid: int) -> shared_memory.SharedMemory:
+    # The client owns (and unlinks) its segments; an attaching process must not
+    # register them with its own resource tracker, or they get unlinked when it
+    # exits. A client in this same process shares our tracker entry, so leave it.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if owner_pid != os.getpid():
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _tile_views(buf: memoryview, n: int, h: int, w: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(n, 3, h, w) input tiles and (n, h, w) probability tiles, back to back in one segment."""
+    in_count = n * 3 * h * w
+    x = np.ndarray((n, 3, h, w), dtype=np.float32, buffer=buf)
+    out = np.ndarray((n, h, w), dtype=np.float32, buffer=buf, offset=in_count * 4)
+    return x, out
+
+
+def _segment_bytes(n: int, h: int, w: int) -> int:
+    return n * 4 * h * w * 4
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: "_UnixServer"
+
+    def handle(self) -> None:
+        segments: Dict[str, shared_memory.SharedMemory] = {}
+        try:
+            while True:
+                try:
+                    msg = _recv(self.request)
+                except ConnectionError:
+                    return
+                try:
+                    reply = self._dispatch(msg, segments)
+                except Exception as exc:
+                    log.exception("model server request %s failed", msg.get("op"))
+                    reply = {"error": f"{type(exc).__name__}: {exc}"}
+                _send(self.request, reply)
+        finally:
+            for shm in segments.values():
+                shm.close()
+
+    def _dispatch(self, msg: Dict[str, Any], segments: Dict[str, shared_memory.SharedMemory]) -> Dict[str, Any]:
+        registry = self.server.registry
+        op = msg.get("op")
+        if op == "run":
+            name, n, h, w = msg["shm"], int(msg["n"]), int(msg["h"]), int(msg["w"])
+            shm = segments.get(name)
+            if shm is None:
+                # A client replaces its segment when it outgrows it; drop the old one.
+                for old in segments.values():
+                    old.close()
+                segments.clear()
+                shm = segments[name] = _attach(name, int(msg.get("pid", 0)))
+            if _segment_bytes(n, h, w) > shm.size:
+                raise ValueError(f"{n} tiles of {h}x{w} do not fit segment {name}")
+            x, out = _tile_views(shm.buf, n, h, w)
+            tiles = torch.from_numpy(x).unbind(0)
+            out[...] = registry.runner(msg["model"])(tiles)
+            del x, out, tiles
+            return {"ok": True}
+        if op == "load":
+            for model in msg.get("models") or []:
+                registry.get(model)
+            return {"ok": True, "timings": registry.timings()}
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "timings": registry.timings()}
+        raise ValueError(f"Unknown op: {op}")
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, registry: Any) -> None:
+        self.registry = registry
+        super().__init__(path, _Handler)
+
+
+class ModelServer:
+    """
+    Local model server: owns the gap models (one `registry`, by default the
+    process-wide model_registry) and runs tile batches for API workers over a
+    Unix socket. Tile data travels through the client's shared-memory segment;
+    the socket only carries small JSON control messages. With GM_GAP_SCHEDULER
+    on, batches from different workers are micro-batched together.
+    """
+
+    def __init__(self, path: str, registry: Any = None) -> None:
+        if registry is None:
+            from app.services.gap_detection import model_registry
+
+            registry = model_registry
+        self.path = str(path)
+        self.registry = registry
+        self._server: Optional[_UnixServer] = None
+        self._serving = threading.Event()
+
+    def start(self) -> "ModelServer":
+        sock_path = Path(self.path)
+        if sock_path.exists():
+            if _is_listening(self.path):
+                raise RuntimeError(f"A model server is already listening on {self.path}")
+            sock_path.unlink()  # stale socket from a crashed server
+        sock_path.parent.mkdir(parents=True, exist_ok=True)
+        self._server = _UnixServer(self.path, self.registry)
+        os.chmod(self.path, 0o600)
+        return self
+
+    def serve_forever(self) -> None:
+        if self._server is None:
+            self.start()
+        log.info("Model server listening on %s", self.path)
+        self._serving.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._serving.clear()
+
+    def shutdown(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        if self._serving.is_set():
+            server.shutdown()  # blocks until serve_forever() returns
+        server.server_close()
+        Path(self.path).unlink(missing_ok=True)
+
+
+def _is_listening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class _Connection:
+    def __init__(self, path: str, timeout_s: float) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout_s)
+        self.sock.connect(path)
+        self.shm: Optional[shared_memory.SharedMemory] = None
+
+    def segment(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self.shm is None or self.shm.size < nbytes:
+            self._release_segment()
+            size = max(_MIN_SEGMENT, 1 << (nbytes - 1).bit_length())
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        return self.shm
+
+    def request(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        _send(self.sock, msg)
+        reply = _recv(self.sock)
+        if "error" in reply:
+            raise RuntimeError(f"model server: {reply['error']}")
+        return reply
+
+    def close(self) -> None:
+        self.sock.close()
+        self._release_segment()
+
+    def _release_segment(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class ModelServerClient:
+    """
+    Drop-in for ModelRegistry in detect_gaps (runner / load_all / timings /
+    clear) that forwards tile batches to a ModelServer, so API workers never
+    load the models. Each thread keeps one connection and one shared-memory
+    segment, grown on demand and reused across batches.
+    """
+
+    def __init__(self, path: str, timeout_s: float = 120.0) -> None:
+        self.path = str(path)
+        self.timeout_s = float(timeout_s)
+        self._local = threading.local()
+        self._conns: List[_Connection] = []
+        self._lock = threading.Lock()
+
+    def runner(self, name: str):
+        return partial(self._run, name)
+
+    def load_all(self) -> None:
+        names = ["unetpp", "deeplabv3plus"] if settings.gap_use_fusion else ["unetpp"]
+        self._request({"op": "load", "models": names})
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        return self._request({"op": "ping"})["timings"]
+
+    def clear(self) -> None:
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+    def _run(self, name: str, tiles: Sequence[torch.Tensor]) -> np.ndarray:
+        n = len(tiles)
+        _, h, w = tiles[0].shape
+        conn = self._conn()
+        shm = conn.segment(_segment_bytes(n, h, w))
+        x, out = _tile_views(shm.buf, n, h, w)
+        torch.stack(list(tiles), out=torch.from_numpy(x))
+        try:
+            conn.request({"op": "run", "model": name, "shm": shm.name, "pid": os.getpid(), "n": n, "h": h, "w": w})
+        except (OSError, ConnectionError):
+            self._drop(conn)
+            raise
+        result = out.copy()
+        del x, out
+        return result
+
+    def _request(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        conn = self._conn()
+        try:
+            return conn.request(msg)
+        except (OSError, ConnectionError):
+            self._drop(conn)
+            raise
+
+    def _conn(self) -> _Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _Connection(self.path, self.timeout_s)
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def _drop(self, conn: _Connection) -> None:
+        # Reconnect on the next call (e.g. after a model server restart).
+        self._local.conn = None
+        with self._lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+        conn.close()
+
+
+_client_lock = threading.Lock()
+_client: Optional[ModelServerClient] = None
+
+
+def model_server_client() -> ModelServerClient:
+    global _client
+    with _client_lock:
+        if _client is None or _client.path != settings.gap_server_socket:
+            _client = ModelServerClient(settings.gap_server_socket, settings.gap_server_timeout_s)
+        return _client
@@ -0,0 +1,459 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+import base64
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from app.schemas.measure import MeasureResponse, Point, GapMeasurement, GapDetectionStats
+from app.services.image_io import ImageTooLargeError, decode_image
+from app.services.aruco_detect import (
+    ArucoParams,
+    MarkerDetection,
+    build_marker_detections,
+    detect_aruco_markers,
+    detect_aruco_markers_pyramid,
+)
+from app.services.homography import HomographyResult, compute_homography, inspection_roi_px
+from app.services.measurement import measure_gap_mm
+from app.services.annotate import AnnotationInputs, RenderOptions, render_annotation
+from app.services.gap_detection import GapDetectionResult, GapQuad, detect_gaps, quads_from_prob_map
+from app.services.result_store import ByteLRUCache
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.memory import PeakRSSSampler
+from app.core.metrics import StageTimer, StageTimings
+
+log = get_logger("pipeline")
+
+# Settings that change the front stage (decode -> markers -> homography) or the
+# gap segmentation; they are part of the cache key so a config change never
+# serves stale intermediates.
+_FRONT_SETTINGS = (
+    "image_decoder", "decode_max_dim", "max_image_pixels", "aruco_", "min_marker_", "min_laplacian_",
+    "marker_length_", "ransac_", "max_cond_", "catastrophic_", "board_layout_path",
+)
+_GAP_SETTINGS = ("gap_",)
+
+
+class MeasurementError(Exception):
+    """Pipeline failure that maps to an HTTP status; picklable for process workers."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class PipelineCancelled(Exception):
+    """Raised from a progress callback to abort a run at the next stage or tile batch."""
+
+
+# progress(stage, **details); stages: decoded, markers, homography, tiles
+# (done/total/run), quads, measured, annotated. May raise PipelineCancelled.
+ProgressFn = Callable[..., None]
+
+ANNOTATE_MODES = ("none", "inline", "deferred")
+
+
+@dataclass
+class ProbMapSnapshot:
+    """Fused gap probabilities of an auto run plus what is needed to turn new quads into mm."""
+    prob_map: np.ndarray  # relative to roi origin
+    roi: Optional[Tuple[int, int, int, int]]
+    hom: HomographyResult
+    scale: float  # decoded px per original px
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.prob_map.nbytes)
+
+
+@dataclass
+class MeasureOutput:
+    response: MeasureResponse
+    image: bytes       # encoded annotation; empty when inlined as base64 or not rendered
+    media_type: str
+    annotation: Optional[AnnotationInputs] = None  # set for annotate="deferred"
+    prob_map: Optional[ProbMapSnapshot] = None     # set for auto runs with keep_prob_map
+    timings: Optional[StageTimings] = None         # set with GM_METRICS
+
+
+def run_measurement(
+    data: bytes,
+    mode: str,
+    points: List[Point],
+    render: RenderOptions = RenderOptions(),
+    inline_image: bool = True,
+    annotate: str = "inline",
+    keep_prob_map: bool = False,
+    progress: Optional[ProgressFn] = None,
+) -> MeasureOutput:
+    """
+    Synchronous measurement pipeline: decode -> markers -> homography ->
+    (auto: gap detection) -> measurement -> annotation.
+    Runs on a pipeline executor worker, never on the event loop.
+    With inline_image the annotation is base64-encoded into the response;
+    otherwise the raw encoded bytes are returned for a binary transport.
+    annotate="none" skips drawing entirely; "deferred" skips it too but
+    returns the render inputs so the caller can store them and render later.
+    keep_prob_map returns the fused probability map of an auto run for
+    rethreshold_prob_map. `progress` is called at each stage and tile batch
+    on the worker thread; it is not picklable, so it is for in-process runs.
+    """
+    if annotate not in ANNOTATE_MODES:
+        raise MeasurementError(400, "annotate must be 'none', 'inline' or 'deferred'")
+    notify = progress or _no_progress
+    timer = StageTimer() if settings.metrics_enabled else None
+    if timer is not None:
+        notify = timer.wrap(notify)
+
+    def run() -> Tuple[_PipelineResult, bytes]:
+        result = _run_measurement(data, mode, points, notify)
+        if annotate == "inline":
+            image = render_annotation(result.image.bgr, result.annotation, render)
+            notify("annotated")
+            return result, image
+        return result, b""
+
+    if settings.report_peak_memory:
+        with PeakRSSSampler(settings.memory_sample_ms) as mem:
+            result, image = run()
+        result.response.process_peak_rss_mb = round(mem.peak_mb, 1)
+        log.info("measure mode=%s process peak_rss=%.1f MB", mode, mem.peak_mb)
+    else:
+        result, image = run()
+
+    timings = None
+    if timer is not None:
+        timings = timer.finish()
+        timings.markers = len(result.annotation.detections)
+        timings.qa_failed = not result.annotation.hom.qa_pass
+
+    response = result.response
+    response.annotated_image_media_type = render.media_type
+    if inline_image and image:
+        response.annotated_image_base64_png = base64.b64encode(image).decode("ascii")
+        image = b""
+    return MeasureOutput(
+        response=response,
+        image=image,
+        media_type=render.media_type,
+        annotation=result.annotation if annotate == "deferred" else None,
+        prob_map=result.prob_map if keep_prob_map else None,
+        timings=timings,
+    )
+
+
+def rethreshold_prob_map(
+    snapshot: ProbMapSnapshot,
+    thr: Optional[float] = None,
+    morph_kernel: Optional[int] = None,
+    morph_iterations: Optional[int] = None,
+    min_area_px: Optional[int] = None,
+    min_length_px: Optional[float] = None,
+    max_segments: Optional[int] = None,
+) -> MeasureResponse:
+    """
+    Re-derive gaps from a stored probability map with new post-processing
+    parameters (unset ones fall back to settings). No decode, no inference.
+    """
+    if thr is None:
+        thr = settings.gap_fusion_thr if settings.gap_use_fusion else settings.gap_unetpp_thr
+    quads = quads_from_prob_map(
+        snapshot.prob_map,
+        thr,
+        settings.gap_morph_kernel if morph_kernel is None else morph_kernel,
+        settings.gap_morph_iterations if morph_iterations is None else morph_iterations,
+        settings.gap_min_area_px if min_area_px is None else min_area_px,
+        settings.gap_min_length_px if min_length_px is None else min_length_px,
+        settings.gap_max_segments if max_segments is None else max_segments,
+        roi=snapshot.roi,
+    )
+    if not quads:
+        raise MeasurementError(422, "No gaps detected.")
+    measurements = measure_quads(quads, snapshot.hom, snapshot.scale)
+    qa_notes = list(snapshot.hom.qa_reasons)
+    qa_notes.append(f"Auto-detected gaps: {len(measurements)}")
+    if snapshot.prob_map.dtype == np.float16:
+        # GM_GAP_STREAMING stores probabilities as float16 but thresholds the
+        # float32 ones, so gaps right at the threshold may differ from /measure.
+        qa_notes.append("Probabilities stored as float16; results near the threshold may differ from /measure.")
+    return MeasureResponse(
+        measurement_mm=float(max(m.gap_mm for m in measurements)),
+        confidence=snapshot.hom.qa_confidence,
+        qa_notes=qa_notes,
+        annotated_image_base64_png="",
+        measurements=measurements,
+    )
+
+
+@dataclass
+class _FrontResult:
+    detections: List[MarkerDetection]
+    hom: HomographyResult
+    w_img: int
+    h_img: int
+    scale: float  # decoded px per original px
+
+
+class _LazyImage:
+    """Decodes on first use, so fully cached requests that do not draw never decode."""
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._decoded: Optional[Tuple[np.ndarray, float]] = None
+
+    def decoded(self) -> Tuple[np.ndarray, float]:
+        if self._decoded is None:
+            self._decoded = _decode(self._data)
+        return self._decoded
+
+    @property
+    def bgr(self) -> np.ndarray:
+        return self.decoded()[0]
+
+
+def _no_progress(stage: str, **details: Any) -> None:
+    pass
+
+
+def _cache_sizeof(value: Any) -> int:
+    if isinstance(value, GapDetectionResult):
+        return int(value.prob_map.nbytes + value.mask.nbytes) + 1024
+    if isinstance(value, _FrontResult):
+        return 1024 + 256 * len(value.detections)
+    return 1024
+
+
+# Per process: with the process backend every worker keeps its own cache.
+# A cancelled run never poisons identical requests waiting on it; they recompute.
+result_cache = ByteLRUCache(settings.result_cache_mb * 1024 * 1024, _cache_sizeof, retry_on=(PipelineCancelled,))
+
+
+def _settings_fingerprint(prefixes: Sequence[str]) -> str:
+    values = {k: v for k, v in settings.model_dump().items() if k.startswith(tuple(prefixes))}
+    if "board_layout_path" in values:
+        try:
+            values["board_layout_mtime"] = os.path.getmtime(settings.board_layout_path)
+        except OSError:
+            pass
+    blob = json.dumps(values, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+
+def render_deferred_annotation(inputs: AnnotationInputs, render: RenderOptions) -> bytes:
+    """Decode the stored upload again and draw the overlay; runs on a pipeline worker."""
+    bgr, _scale = _decode(inputs.image)
+    return render_annotation(bgr, inputs, render)
+
+
+def _decode(data: bytes) -> Tuple[np.ndarray, float]:
+    try:
+        return decode_image(
+            data,
+            decoder=settings.image_decoder,
+            max_dim=settings.decode_max_dim,
+            max_pixels=settings.max_image_pixels,
+        )
+    except ImageTooLargeError as exc:
+        raise MeasurementError(413, str(exc))
+
+
+@dataclass
+class _PipelineResult:
+    response: MeasureResponse
+    image: _LazyImage
+    annotation: AnnotationInputs
+    prob_map: Optional[ProbMapSnapshot] = None
+
+
+def measure_quads(quads: List[GapQuad], hom: HomographyResult, scale: float) -> List[GapMeasurement]:
+    """Widest profile of each quad in mm; returned points are in original-image pixels."""
+    measurements: List[GapMeasurement] = []
+    for quad in quads:
+        quad_points = [Point(x=float(p[0]), y=float(p[1])) for p in quad.points]
+        result = measure_gap_mm(hom.H_pix_to_mm, quad_points, mode="4", profile_step_mm=settings.profile_step_mm)
+        widths = result.widths_mm or []
+        gap_mm = float(max(widths)) if widths else float(result.gap_mm)
+        if scale != 1.0:
+            quad_points = [_rescale_point(p, 1.0 / scale) for p in quad_points]
+        measurements.append(GapMeasurement(gap_mm=gap_mm, points_px=quad_points, widths_mm=widths))
+    return measurements
+
+
+def _rescale_point(p: Point, scale: float) -> Point:
+    # Pixel-centre convention, matching the ArUco pyramid mapping.
+    return Point(x=(p.x + 0.5) * scale - 0.5, y=(p.y + 0.5) * scale - 0.5)
+
+
+def _front_stage(image: _LazyImage, notify: ProgressFn) -> _FrontResult:
+    bgr, scale = image.decoded()
+    h_img, w_img = bgr.shape[:2]
+    notify("decoded", width=w_img, height=h_img)
+    dets, hom = locate_board(bgr, notify)
+    return _FrontResult(detections=dets, hom=hom, w_img=w_img, h_img=h_img, scale=scale)
+
+
+def locate_board(bgr: np.ndarray, notify: ProgressFn = _no_progress) -> Tuple[List[MarkerDetection], HomographyResult]:
+    """Markers -> homography with the configured detector and QA settings."""
+    h_img, w_img = bgr.shape[:2]
+    aruco_params = ArucoParams.from_settings()
+    if settings.aruco_pyramid:
+        gray, corners, ids = detect_aruco_markers_pyramid(
+            bgr,
+            settings.aruco_dict,
+            aruco_params,
+            min_marker_area_px=settings.min_marker_pixel_area,
+            coarse_min_area_px=settings.aruco_pyramid_min_area_px,
+        )
+    else:
+        gray, corners, ids = detect_aruco_markers(bgr, settings.aruco_dict, aruco_params)
+    dets = build_marker_detections(
+        gray=gray,
+        corners=corners,
+        ids=ids,
+        min_area=settings.min_marker_pixel_area,
+        min_laplacian=settings.min_laplacian_var,
+    )
+
+    if not dets:
+        raise MeasurementError(422, "No usable ArUco markers detected (sharpness/size too low).")
+    notify("markers", count=len(dets))
+
+    hom = compute_homography(
+        detections=dets,
+        board_layout_path=settings.board_layout_path,
+        L_multi_mm=settings.marker_length_multi_mm,
+        L_single_mm=settings.marker_length_single_mm,
+        ransac_thresh_px=settings.ransac_reproj_thresh_px,
+        max_cond_number=settings.max_cond_number,
+        catastrophic_rms_mm=settings.catastrophic_rms_mm,
+        catastrophic_cond=settings.catastrophic_cond,
+        img_w=w_img,
+        img_h=h_img,
+    )
+    return dets, hom
+
+
+def _run_measurement(
+    data: bytes,
+    mode: str,
+    points: List[Point],
+    notify: ProgressFn = _no_progress,
+) -> _PipelineResult:
+    """
+    Intermediates are cached by upload content hash + settings fingerprint, so
+    resubmitting the same photo (retry, new manual points, manual -> auto)
+    skips decode, marker detection, homography and segmentation.
+    """
+    image = _LazyImage(data)
+    digest = hashlib.sha256(data).hexdigest()
+    front_fp = _settings_fingerprint(_FRONT_SETTINGS)
+    front = result_cache.get_or_compute(("front", digest, front_fp), lambda: _front_stage(image, notify))
+    dets, hom, scale = front.detections, front.hom, front.scale
+    notify("homography", confidence=hom.qa_confidence, qa_pass=hom.qa_pass)
+    w_img, h_img = front.w_img, front.h_img
+    # Client coordinates refer to the original image; work in decoded pixels.
+    points_px = [_rescale_point(p, scale) for p in points] if scale != 1.0 else points
+
+    if not hom.qa_pass:
+        # Return annotated image + QA notes, but block measurement
+        annotation = AnnotationInputs(
+            image=data,
+            detections=dets,
+            hom=hom,
+            points_px=[(int(round(p.x)), int(round(p.y))) for p in points_px],
+            measurement_mm=None,
+            extra_notes=["Homography QA failed; measurement refused."],
+        )
+        response = MeasureResponse(
+            measurement_mm=0.0,
+            confidence="LOW",
+            qa_notes=hom.qa_reasons + ["Homography QA failed; measurement refused."],
+            annotated_image_base64_png=""
+        )
+        return _PipelineResult(response, image, annotation)
+
+    if mode == "auto":
+        roi = None
+        # A single-marker homography maps into that marker's own mm frame, not
+        # board-layout mm, so the ROI can't be placed; segment the whole image.
+        if len(settings.gap_roi_mm) == 4 and hom.mode_used == "multi_marker":
+            roi = inspection_roi_px(hom.H_mm_to_pix, settings.gap_roi_mm, settings.gap_roi_margin_px, w_img, h_img)
+        gap_key = ("gaps", digest, front_fp, _settings_fingerprint(_GAP_SETTINGS))
+        detection = result_cache.get_or_compute(
+            gap_key,
+            lambda: detect_gaps(image.bgr, roi=roi, progress=lambda done, total, run: notify("tiles", done=done, total=total, run=run)),
+        )
+        notify("quads", count=len(detection.quads))
+        if not detection.quads:
+            raise MeasurementError(422, "No gaps detected.")
+
+        measurements = measure_quads(detection.quads, hom, scale)
+        notify("measured")
+        gap_quads_px = [quad.points for quad in detection.quads]
+
+        measurement_mm = max(m.gap_mm for m in measurements)
+        qa_notes = []
+        qa_notes.extend(hom.qa_reasons)
+        qa_notes.append(f"Auto-detected gaps: {len(measurements)}")
+
+        annotation = AnnotationInputs(
+            image=data,
+            detections=dets,
+            hom=hom,
+            points_px=[],
+            measurement_mm=measurement_mm,
+            extra_notes=qa_notes,
+            gap_quads=gap_quads_px,
+        )
+
+        response = MeasureResponse(
+            measurement_mm=float(measurement_mm),
+            confidence=hom.qa_confidence,
+            qa_notes=qa_notes,
+            annotated_image_base64_png="",
+            measurements=measurements,
+            detection_stats=GapDetectionStats(
+                tiles_total=detection.stats.tiles_total,
+                tiles_skipped=detection.stats.tiles_skipped,
+            ),
+        )
+        snapshot = ProbMapSnapshot(prob_map=detection.prob_map, roi=detection.roi, hom=hom, scale=scale)
+        return _PipelineResult(response, image, annotation, snapshot)
+
+    measurement = measure_gap_mm(hom.H_pix_to_mm, points_px, mode=mode, profile_step_mm=settings.profile_step_mm)
+    notify("measured")
+
+    annotation = AnnotationInputs(
+        image=data,
+        detections=dets,
+        hom=hom,
+        points_px=[(int(round(p.x)), int(round(p.y))) for p in points_px],
+        measurement_mm=measurement.gap_mm,
+        extra_notes=measurement.qa_notes,
+    )
+
+    qa_notes = []
+    qa_notes.extend(hom.qa_reasons)
+    qa_notes.extend(measurement.qa_notes)
+
+    response = MeasureResponse(
+        measurement_mm=float(measurement.gap_mm),
+        confidence=hom.qa_confidence,
+        qa_notes=qa_notes,
+        annotated_image_base64_png="",
+        measurements=[
+            GapMeasurement(
+                gap_mm=float(measurement.gap_mm),
+                points_px=points,
+                widths_mm=measurement.widths_mm,
+            )
+        ],
+    )
+    return _PipelineResult(response, image, annotation)
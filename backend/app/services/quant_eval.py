@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.gap_detection import GapDetectionResult, ModelRegistry, detect_gaps
+from app.services.image_io import decode_image_upload
+from app.services.pipeline import MeasurementError, locate_board, measure_quads
+from app.core.logging import get_logger
+
+log = get_logger("quant_eval")
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+@dataclass
+class QuantEvalRow:
+    image: str
+    mask_iou: float
+    quads_ref: int
+    quads_test: int
+    gap_mm_ref: Optional[float]   # None without a usable board homography
+    gap_mm_test: Optional[float]
+
+    @property
+    def gap_mm_delta(self) -> Optional[float]:
+        if self.gap_mm_ref is None or self.gap_mm_test is None:
+            return None
+        return abs(self.gap_mm_test - self.gap_mm_ref)
+
+
+@dataclass
+class QuantEvalSummary:
+    images: int
+    mean_iou: float
+    min_iou: float
+    quad_count_mismatches: int
+    max_gap_mm_delta: Optional[float]
+    passed: bool
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def mask_iou(a: np.ndarray, b: np.ndarray) -> float:
+    a = a > 0
+    b = b > 0
+    union = np.count_nonzero(a | b)
+    return 1.0 if union == 0 else np.count_nonzero(a & b) / union
+
+
+def evaluate_precision(
+    images: Sequence[Path],
+    precisions: Dict[str, str],
+    reference: Optional[Dict[str, str]] = None,
+) -> List[QuantEvalRow]:
+    """
+    Run gap detection on each image with the fp32 reference models and with
+    `precisions` (per-model overrides, e.g. {"unetpp": "int8_static"}), and
+    compare masks, quad counts and the widest gap in mm. Images without a
+    usable board still get mask/quad comparisons.
+    """
+    ref_registry = ModelRegistry(reference or {"unetpp": "fp32", "deeplabv3plus": "fp32"})
+    test_registry = ModelRegistry(precisions)
+    rows: List[QuantEvalRow] = []
+    try:
+        for path in images:
+            bgr = decode_image_upload(Path(path).read_bytes())
+            ref = detect_gaps(bgr, registry=ref_registry)
+            test = detect_gaps(bgr, registry=test_registry)
+            hom = _board_homography(bgr, path)
+            rows.append(
+                QuantEvalRow(
+                    image=str(path),
+                    mask_iou=mask_iou(ref.mask, test.mask),
+                    quads_ref=len(ref.quads),
+                    quads_test=len(test.quads),
+                    gap_mm_ref=_widest_gap_mm(ref, hom),
+                    gap_mm_test=_widest_gap_mm(test, hom),
+                )
+            )
+    finally:
+        ref_registry.clear()
+        test_registry.clear()
+    return rows
+
+
+def summarize(
+    rows: Sequence[QuantEvalRow],
+    min_iou: float,
+    max_delta_mm: float,
+    max_quad_mismatches: int = 0,
+) -> QuantEvalSummary:
+    """
+    Gate: every mask IoU >= min_iou, the widest-gap delta <= max_delta_mm and
+    at most max_quad_mismatches images where the gap count changed.
+    """
+    ious = [r.mask_iou for r in rows] or [1.0]
+    deltas = [d for d in (r.gap_mm_delta for r in rows) if d is not None]
+    mismatches = sum(1 for r in rows if r.quads_ref != r.quads_test)
+    max_delta = max(deltas) if deltas else None
+    passed = (
+        min(ious) >= min_iou
+        and (max_delta is None or max_delta <= max_delta_mm)
+        and mismatches <= max_quad_mismatches
+    )
+    return QuantEvalSummary(
+        images=len(rows),
+        mean_iou=float(np.mean(ious)),
+        min_iou=float(min(ious)),
+        quad_count_mismatches=mismatches,
+        max_gap_mm_delta=max_delta,
+        passed=passed,
+    )
+
+
+def list_images(folder: Path) -> List[Path]:
+    return sorted(p for p in Path(folder).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def _board_homography(bgr: np.ndarray, path: Path):
+    try:
+        _dets, hom = locate_board(bgr)
+    except MeasurementError as exc:
+        log.info("%s: no board (%s); comparing masks only", path, exc.detail)
+        return None
+    return hom if hom.qa_pass else None
+
+
+def _widest_gap_mm(result: GapDetectionResult, hom) -> Optional[float]:
+    if hom is None or not result.quads:
+        return None
+    return max(m.gap_mm for m in measure_quads(result.quads, hom, 1.0))
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+import threading
+import time
+import uuid
+
+T = TypeVar("T")
+
+
+class TTLStore(Generic[T]):
+    """
+    Thread-safe in-memory store handing out opaque ids. Entries expire ttl_s
+    after they were last read or written; beyond max_items (or max_bytes, as
+    measured by `sizeof`) the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        max_items: int,
+        ttl_s: float,
+        max_bytes: int = 0,
+        sizeof: Optional[Callable[[T], int]] = None,
+    ) -> None:
+        self.max_items = max(1, int(max_items))
+        self.ttl_s = float(ttl_s)
+        self.max_bytes = max(0, int(max_bytes))
+        self._sizeof = sizeof or (lambda _v: 0)
+        self._items: "OrderedDict[str, Tuple[float, int, T]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, value: T) -> str:
+        key = uuid.uuid4().hex
+        size = int(self._sizeof(value))
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_s, size, value)
+            self._bytes += size
+            self._evict()
+        return key
+
+    def get(self, key: str) -> Optional[T]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires, size, value = entry
+            if expires <= now:
+                self._drop(key)
+                return None
+            self._items[key] = (now + self.ttl_s, size, value)
+            self._items.move_to_end(key)
+            return value
+
+    def pop(self, key: str) -> Optional[T]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            self._drop(key)
+            return entry[2]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def _drop(self, key: str) -> None:
+        _expires, size, _value = self._items.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (expires, _s, _v) in self._items.items() if expires <= now]:
+            self._drop(key)
+        while self._items and (
+            len(self._items) > self.max_items or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            self._drop(next(iter(self._items)))
+
+
+class _OwnerAborted(Exception):
+    pass
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU keyed by arbitrary hashables and bounded by the total
+    `sizeof` of its values. get_or_compute is single-flight: concurrent
+    callers with the same key wait for the first caller's result instead of
+    recomputing it. Failures are propagated to every waiter and not cached,
+    except `retry_on` exceptions (e.g. the owner was cancelled), after which
+    waiters try again themselves. max_bytes=0 disables caching.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[Any], int],
+        retry_on: Tuple[type, ...] = (),
+    ) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self.retry_on = retry_on
+        self._sizeof = sizeof
+        self._items: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], T]) -> T:
+        if self.max_bytes == 0:
+            return compute()
+        while True:
+            try:
+                return self._get_or_compute(key, compute)
+            except _OwnerAborted:
+                continue
+
+    def _get_or_compute(self, key: Hashable, compute: Callable[[], T]) -> T:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            waiting = self._inflight.get(key)
+            if waiting is None:
+                owner: Future = Future()
+                self._inflight[key] = owner
+                self.misses += 1
+            else:
+                self.hits += 1
+        if waiting is not None:
+            try:
+                return waiting.result()
+            except self.retry_on:
+                raise _OwnerAborted()
+
+        try:
+            value = compute()
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[key]
+            owner.set_exception(exc)
+            raise
+        size = int(self._sizeof(value))
+        with self._lock:
+            del self._inflight[key]
+            if size <= self.max_bytes:
+                self._items[key] = (size, value)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _key, (old_size, _old) = self._items.popitem(last=False)
+                    self._bytes -= old_size
+        owner.set_result(value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
@@ -0,0 +1,290 @@
+"""
+Per-stage benchmarks of the measurement pipeline on synthetic scenes.
+
+    python -m benchmarks.run                                  # 2, 12 and 48 MP
+    python -m benchmarks.run --sizes 2 12 --out result.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json   # exit 1 on regressions
+
+Each stage is timed on its own inputs (prepared once per scene) for --repeat
+runs after --warmup, then run once more under tracemalloc and the RSS sampler
+for peak memory. tile_inference uses a small random-weight model, so it
+measures tiling, normalization and blending rather than the real networks.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import torch
+
+from app.core.config import settings
+from app.core.memory import PeakRSSSampler, current_rss_bytes
+from app.schemas.measure import Point
+from app.services.annotate import render_annotated_png_base64
+from app.services.aruco_detect import ArucoParams, build_marker_detections, detect_aruco_markers
+from app.services.gap_detection import NORMALIZE_MEAN, NORMALIZE_STD, _quads_from_mask, resolve_batch_tiles, tile_inference
+from app.services.homography import compute_homography
+from app.services.image_io import decode_image_upload
+from app.services.measurement import measure_gap_mm
+from benchmarks.scenes import Scene, render_scene
+
+STAGES = (
+    "decode_image_upload",
+    "detect_aruco_markers",
+    "build_marker_detections",
+    "compute_homography",
+    "tile_inference",
+    "quads_from_mask",
+    "measure_gap_mm",
+    "render_annotated_png_base64",
+)
+
+
+@dataclass
+class StageResult:
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    mean_ms: float
+    peak_alloc_mb: float      # numpy/Python allocations (tracemalloc)
+    peak_rss_delta_mb: float  # process RSS growth while the stage ran
+
+    def to_dict(self) -> Dict[str, float]:
+        return {k: round(v, 3) for k, v in self.__dict__.items()}
+
+
+def bench_model() -> torch.nn.Module:
+    torch.manual_seed(0)
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(3, 4, kernel_size=3, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.Conv2d(4, 1, kernel_size=1),
+    ).eval()
+
+
+def stage_calls(scene: Scene) -> Dict[str, Callable[[], Any]]:
+    """Zero-argument callables per stage, each fed the previous stage's real output."""
+    bgr = scene.bgr
+    h_img, w_img = bgr.shape[:2]
+    params = ArucoParams.from_settings()
+    gray, corners, ids = detect_aruco_markers(bgr, settings.aruco_dict, params)
+    dets = build_marker_detections(gray, corners, ids, settings.min_marker_pixel_area, settings.min_laplacian_var)
+    hom_args = dict(
+        detections=dets,
+        board_layout_path=settings.board_layout_path,
+        L_multi_mm=settings.marker_length_multi_mm,
+        L_single_mm=settings.marker_length_single_mm,
+        ransac_thresh_px=settings.ransac_reproj_thresh_px,
+        max_cond_number=settings.max_cond_number,
+        catastrophic_rms_mm=settings.catastrophic_rms_mm,
+        catastrophic_cond=settings.catastrophic_cond,
+        img_w=w_img,
+        img_h=h_img,
+    )
+    hom = compute_homography(**hom_args)
+    quads = _quads_from_mask(scene.gap_mask, settings.gap_min_area_px, settings.gap_min_length_px, settings.gap_max_segments)
+    quad_points = [[Point(x=float(x), y=float(y)) for x, y in q.points] for q in quads]
+    model = bench_model()
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    tile_size = int(settings.gap_tile_size)
+    cpu = torch.device("cpu")
+
+    def measure_all():
+        return [measure_gap_mm(hom.H_pix_to_mm, pts, "4", settings.profile_step_mm) for pts in quad_points]
+
+    return {
+        "decode_image_upload": lambda: decode_image_upload(scene.jpeg),
+        "detect_aruco_markers": lambda: detect_aruco_markers(bgr, settings.aruco_dict, params),
+        "build_marker_detections": lambda: build_marker_detections(
+            gray, corners, ids, settings.min_marker_pixel_area, settings.min_laplacian_var
+        ),
+        "compute_homography": lambda: compute_homography(**hom_args),
+        "tile_inference": lambda: tile_inference(
+            model, rgb, tile_size, settings.gap_overlap, NORMALIZE_MEAN, NORMALIZE_STD, cpu,
+            batch_tiles=resolve_batch_tiles(tile_size),
+        ),
+        "quads_from_mask": lambda: _quads_from_mask(
+            scene.gap_mask, settings.gap_min_area_px, settings.gap_min_length_px, settings.gap_max_segments
+        ),
+        "measure_gap_mm": measure_all,
+        "render_annotated_png_base64": lambda: render_annotated_png_base64(
+            bgr, dets, hom, [], None, [], gap_quads=[q.points for q in quads]
+        ),
+    }
+
+
+def accuracy(scene: Scene) -> Dict[str, Any]:
+    """Board QA and mean profile width per painted gap against its true width."""
+    gray, corners, ids = detect_aruco_markers(scene.bgr, settings.aruco_dict, ArucoParams.from_settings())
+    dets = build_marker_detections(gray, corners, ids, settings.min_marker_pixel_area, settings.min_laplacian_var)
+    h_img, w_img = scene.bgr.shape[:2]
+    hom = compute_homography(
+        dets, settings.board_layout_path, settings.marker_length_multi_mm, settings.marker_length_single_mm,
+        settings.ransac_reproj_thresh_px, settings.max_cond_number, settings.catastrophic_rms_mm,
+        settings.catastrophic_cond, w_img, h_img,
+    )
+    quads = _quads_from_mask(scene.gap_mask, settings.gap_min_area_px, settings.gap_min_length_px, 0)
+    measured = sorted(
+        measure_gap_mm(hom.H_pix_to_mm, [Point(x=float(x), y=float(y)) for x, y in q.points], "4", settings.profile_step_mm).gap_mm
+        for q in quads
+    )
+    expected = sorted(scene.gap_widths_mm)
+    errors = [abs(m - e) for m, e in zip(measured, expected)] if len(measured) == len(expected) else []
+    return {
+        "markers": len(dets),
+        "qa_pass": bool(hom.qa_pass),
+        "gap_widths_mm": expected,
+        "measured_mm": [round(m, 3) for m in measured],
+        "max_abs_error_mm": round(max(errors), 3) if errors else None,
+    }
+
+
+def time_stage(fn: Callable[[], Any], repeat: int, warmup: int) -> StageResult:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+
+    rss_before = current_rss_bytes()
+    tracemalloc.start()
+    try:
+        with PeakRSSSampler(1.0) as mem:
+            fn()
+        _, peak_alloc = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+    return StageResult(
+        p50_ms=float(p50),
+        p90_ms=float(p90),
+        p99_ms=float(p99),
+        mean_ms=float(np.mean(samples)),
+        peak_alloc_mb=peak_alloc / (1024.0 * 1024.0),
+        peak_rss_delta_mb=max(0, mem.peak_bytes - rss_before) / (1024.0 * 1024.0),
+    )
+
+
+def run(sizes: Sequence[float], repeat: int, warmup: int, stages: Sequence[str] = STAGES, seed: int = 0) -> Dict[str, Any]:
+    scenes: Dict[str, Any] = {}
+    for mp in sizes:
+        scene = render_scene(mp, seed=seed)
+        h, w = scene.bgr.shape[:2]
+        calls = stage_calls(scene)
+        results = {}
+        for name in stages:
+            results[name] = time_stage(calls[name], repeat, warmup).to_dict()
+            print(f"  {_scene_key(mp):>6s} {name:28s} p50 {results[name]['p50_ms']:9.2f} ms", file=sys.stderr)
+        scenes[_scene_key(mp)] = {"width": w, "height": h, "stages": results, "accuracy": accuracy(scene)}
+        del scene, calls
+    return {"meta": _meta(repeat, warmup, seed), "scenes": scenes}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[Dict[str, Any]]:
+    """p50 per scene and stage against the baseline; a regression is both > threshold slower and > min_delta_ms."""
+    rows = []
+    for key, scene in current["scenes"].items():
+        base_scene = baseline.get("scenes", {}).get(key)
+        if base_scene is None:
+            continue
+        for name, cur in scene["stages"].items():
+            base = base_scene["stages"].get(name)
+            if base is None:
+                continue
+            ratio = cur["p50_ms"] / base["p50_ms"] if base["p50_ms"] > 0 else float("inf")
+            regressed = ratio > 1.0 + threshold and cur["p50_ms"] - base["p50_ms"] > min_delta_ms
+            rows.append(
+                {
+                    "scene": key,
+                    "stage": name,
+                    "baseline_p50_ms": base["p50_ms"],
+                    "p50_ms": cur["p50_ms"],
+                    "ratio": round(ratio, 3),
+                    "regressed": regressed,
+                }
+            )
+    return rows
+
+
+def print_report(result: Dict[str, Any], rows: Optional[List[Dict[str, Any]]] = None) -> None:
+    ratios = {(r["scene"], r["stage"]): r for r in rows or []}
+    header = f"{'scene':>6s} {'stage':28s} {'p50 ms':>10s} {'p90 ms':>10s} {'p99 ms':>10s} {'alloc MB':>9s} {'rss MB':>8s}"
+    if rows is not None:
+        header += f" {'vs base':>8s}"
+    print(header)
+    for key, scene in result["scenes"].items():
+        for name, s in scene["stages"].items():
+            line = (
+                f"{key:>6s} {name:28s} {s['p50_ms']:10.2f} {s['p90_ms']:10.2f} {s['p99_ms']:10.2f}"
+                f" {s['peak_alloc_mb']:9.1f} {s['peak_rss_delta_mb']:8.1f}"
+            )
+            row = ratios.get((key, name))
+            if row is not None:
+                line += f" {row['ratio']:7.2f}x" + ("  REGRESSION" if row["regressed"] else "")
+            print(line)
+        acc = scene["accuracy"]
+        print(
+            f"{key:>6s} accuracy: {acc['markers']} markers, qa_pass={acc['qa_pass']}, "
+            f"gaps {acc['gap_widths_mm']} mm -> {acc['measured_mm']} mm (max error {acc['max_abs_error_mm']} mm)"
+        )
+
+
+def _scene_key(mp: float) -> str:
+    return f"{mp:g}MP"
+
+
+def _meta(repeat: int, warmup: int, seed: int) -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "tile_size": int(settings.gap_tile_size),
+        "repeat": repeat,
+        "warmup": warmup,
+        "seed": seed,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[2.0, 12.0, 48.0], help="scene sizes in megapixels")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--out", help="write the results as JSON (e.g. a new baseline)")
+    parser.add_argument("--baseline", help="baseline JSON to compare p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed p50 slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    result = run(args.sizes, args.repeat, args.warmup, args.stages, args.seed)
+    rows = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        rows = compare(result, baseline, args.threshold, args.min_delta_ms)
+    print_report(result, rows)
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+    return 1 if rows and any(r["regressed"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Tuple
+import json
+import math
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+# Painted gaps in board mm: (x0, y0, width, length). They sit in the left
+# margin of the A4 layout, clear of the markers, and are wide enough to pass
+# GM_GAP_MIN_LENGTH_PX even at 2 MP (~3.3 px/mm).
+GAPS_MM: Tuple[Tuple[float, float, float, float], ...] = (
+    (2.0, 60.0, 7.0, 140.0),
+    (14.0, 60.0, 10.0, 140.0),
+    (28.0, 60.0, 14.0, 140.0),
+)
+
+
+@dataclass
+class Scene:
+    megapixels: float
+    bgr: np.ndarray
+    gap_mask: np.ndarray          # uint8 0/255, ground-truth gaps in image pixels
+    H_mm_to_px: np.ndarray        # board mm -> image px
+    gap_widths_mm: List[float]
+    jpeg: bytes
+
+    @property
+    def H_px_to_mm(self) -> np.ndarray:
+        return np.linalg.inv(self.H_mm_to_px)
+
+
+def render_scene(megapixels: float, seed: int = 0, jpeg_quality: int = 92) -> Scene:
+    """
+    A 4:3 photo of the board_layout.json page under a mild random perspective:
+    the markers are drawn at their layout positions and GAPS_MM painted as dark
+    bars, so the board homography and every gap width are known exactly.
+    """
+    rng = np.random.default_rng(seed)
+    w = int(round(math.sqrt(megapixels * 1e6 * 4.0 / 3.0)))
+    h = int(round(w * 3.0 / 4.0))
+
+    with open(settings.board_layout_path, "r", encoding="utf-8") as f:
+        layout = json.load(f)
+    page_w_mm, page_h_mm = layout["page"]["w_mm"], layout["page"]["h_mm"]
+    px_per_mm = 0.8 * h / page_h_mm
+
+    page, page_mask = _render_page(layout, px_per_mm)
+
+    # Page corners (mm) -> a jittered quadrilateral centred in the image.
+    cx, cy = w / 2.0, h / 2.0
+    half_w, half_h = page_w_mm * px_per_mm / 2.0, page_h_mm * px_per_mm / 2.0
+    dst = np.array(
+        [[cx - half_w, cy - half_h], [cx + half_w, cy - half_h], [cx + half_w, cy + half_h], [cx - half_w, cy + half_h]],
+        dtype=np.float64,
+    )
+    dst += rng.uniform(-0.04, 0.04, size=(4, 2)) * np.array([half_w, half_h])
+    src_mm = np.array([[0, 0], [page_w_mm, 0], [page_w_mm, page_h_mm], [0, page_h_mm]], dtype=np.float64)
+    H_mm_to_px = cv2.getPerspectiveTransform(src_mm.astype(np.float32), dst.astype(np.float32)).astype(np.float64)
+    # The page raster has half-pixel-centred mm coordinates: px = mm * s - 0.5.
+    page_px_to_mm = np.array([[1.0 / px_per_mm, 0, 0.5 / px_per_mm], [0, 1.0 / px_per_mm, 0.5 / px_per_mm], [0, 0, 1]])
+    H_page = H_mm_to_px @ page_px_to_mm
+
+    bgr = cv2.warpPerspective(page, H_page, (w, h), flags=cv2.INTER_LINEAR, borderValue=(70, 70, 70))
+    gap_mask = cv2.warpPerspective(page_mask, H_page, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+    noise = rng.normal(0.0, 2.0, size=(h, w, 1)).astype(np.float32)
+    bgr = np.clip(bgr.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+    ok, buf = cv2.imencode(".jpg", bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(jpeg_quality)])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return Scene(
+        megapixels=megapixels,
+        bgr=bgr,
+        gap_mask=gap_mask,
+        H_mm_to_px=H_mm_to_px,
+        gap_widths_mm=[g[2] for g in GAPS_MM],
+        jpeg=buf.tobytes(),
+    )
+
+
+def _render_page(layout: dict, px_per_mm: float) -> Tuple[np.ndarray, np.ndarray]:
+    page = layout["page"]
+    ph = int(round(page["h_mm"] * px_per_mm))
+    pw = int(round(page["w_mm"] * px_per_mm))
+    img = np.full((ph, pw), 245, dtype=np.uint8)
+    mask = np.zeros((ph, pw), dtype=np.uint8)
+
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    side = int(round(settings.marker_length_multi_mm * px_per_mm))
+    for k, v in layout["markers"].items():
+        x0 = int(round(v["x_mm"] * px_per_mm))
+        y0 = int(round(v["y_mm"] * px_per_mm))
+        marker = cv2.aruco.generateImageMarker(aruco_dict, int(k), side)
+        img[y0 : y0 + side, x0 : x0 + side] = np.rot90(marker, -int(round(v.get("rotation_deg", 0.0) / 90.0)) % 4)
+
+    for x_mm, y_mm, width_mm, length_mm in GAPS_MM:
+        x0, x1 = int(round(x_mm * px_per_mm)), int(round((x_mm + width_mm) * px_per_mm))
+        y0, y1 = int(round(y_mm * px_per_mm)), int(round((y_mm + length_mm) * px_per_mm))
+        img[y0:y1, x0:x1] = 25
+        mask[y0:y1, x0:x1] = 255
+
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), mask
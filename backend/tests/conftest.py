@@ -0,0 +1,67 @@
+import io
+import json
+import struct
+import zlib
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services.pipeline import result_cache
+
+
+def render_board(px_per_mm: float = 4.0, marker_mm: float = 50.0) -> np.ndarray:
+    """White page with the board_layout.json markers drawn fronto-parallel (mm -> px is a pure scale)."""
+    with open(settings.board_layout_path, "r", encoding="utf-8") as f:
+        layout = json.load(f)
+    page = layout["page"]
+    h = int(round(page["h_mm"] * px_per_mm))
+    w = int(round(page["w_mm"] * px_per_mm))
+    img = np.full((h, w), 255, dtype=np.uint8)
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    side = int(round(marker_mm * px_per_mm))
+    for k, v in layout["markers"].items():
+        x0 = int(round(v["x_mm"] * px_per_mm))
+        y0 = int(round(v["y_mm"] * px_per_mm))
+        img[y0 : y0 + side, x0 : x0 + side] = cv2.aruco.generateImageMarker(aruco_dict, int(k), side)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+
+@pytest.fixture(autouse=True)
+def _empty_result_cache():
+    # Tests patch models and settings freely; never serve another test's intermediates.
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def _no_checkpoint_prefetch(monkeypatch):
+    # App start-up would otherwise download the real checkpoints.
+    monkeypatch.setattr(settings, "gap_prefetch_checkpoints", False)
+
+
+@pytest.fixture
+def board_bgr() -> np.ndarray:
+    return render_board()
+
+
+@pytest.fixture
+def board_png(board_bgr) -> bytes:
+    ok, buf = cv2.imencode(".png", board_bgr)
+    assert ok
+    return buf.tobytes()
+
+
+@pytest.fixture
+def huge_png() -> bytes:
+    """A 1x1 PNG whose header claims 14000x14000 (196 MP, past Pillow's own ~179 MP cap)."""
+    buf = io.BytesIO()
+    Image.new("RGB", (1, 1)).save(buf, "PNG")
+    data = bytearray(buf.getvalue())
+    ihdr = b"IHDR" + struct.pack(">II", 14000, 14000) + bytes(data[24:29])
+    data[12:29] = ihdr
+    data[29:33] = struct.pack(">I", zlib.crc32(ihdr))
+    return bytes(data)
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from app.services.aruco_detect import (
+    ArucoParams,
+    build_marker_detections,
+    detect_aruco_markers,
+    detect_aruco_markers_pyramid,
+    get_aruco_detector,
+)
+
+
+def test_detectors_cached_per_thread_and_params():
+    params = ArucoParams(corner_refinement="subpix", min_marker_perimeter_rate=0.05)
+    det = get_aruco_detector("DICT_4X4_50", params)
+    assert get_aruco_detector("DICT_4X4_50", params) is det
+    assert get_aruco_detector("DICT_4X4_50", ArucoParams()) is not det
+    assert det.getDetectorParameters().cornerRefinementMethod == cv2.aruco.CORNER_REFINE_SUBPIX
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        other = pool.submit(get_aruco_detector, "DICT_4X4_50", params).result()
+    assert other is not det
+
+
+def test_detect_aruco_markers_finds_board(board_bgr):
+    _gray, corners, ids = detect_aruco_markers(board_bgr, "DICT_4X4_50", ArucoParams())
+    assert sorted(ids.flatten().tolist()) == list(range(8))
+
+
+def test_pyramid_detection_matches_full_resolution(board_bgr):
+    warp = np.array([[1.9, 0.15, 300.0], [-0.1, 2.0, 200.0], [1e-5, 2e-5, 1.0]])
+    big = cv2.warpPerspective(board_bgr, warp, (2200, 2800), borderValue=(200, 200, 200))
+
+    full = build_marker_detections(*detect_aruco_markers(big, "DICT_4X4_50"), min_area=800.0, min_laplacian=40.0)
+    coarse = build_marker_detections(
+        *detect_aruco_markers_pyramid(big, "DICT_4X4_50", None, min_marker_area_px=800.0, coarse_min_area_px=128.0),
+        min_area=800.0,
+        min_laplacian=40.0,
+    )
+
+    full_by_id = {d.marker_id: d.corners_refined for d in full}
+    coarse_by_id = {d.marker_id: d.corners_refined for d in coarse}
+    assert sorted(coarse_by_id) == sorted(full_by_id) == list(range(8))
+    for mid, pts in full_by_id.items():
+        assert np.abs(coarse_by_id[mid] - pts).max() < 0.25
+
+
+def test_pyramid_falls_back_to_full_resolution():
+    blank = np.full((400, 400, 3), 255, dtype=np.uint8)
+    gray, corners, ids = detect_aruco_markers_pyramid(blank, "DICT_4X4_50", None, 800.0, 128.0)
+    assert gray.shape == (400, 400)
+    assert ids is None and len(corners) == 0
@@ -0,0 +1,21 @@
+from benchmarks.run import compare, run
+
+
+def test_synthetic_scene_measures_its_painted_gaps():
+    result = run([2.0], repeat=1, warmup=0, stages=["decode_image_upload", "quads_from_mask", "measure_gap_mm"])
+
+    scene = result["scenes"]["2MP"]
+    assert (scene["width"], scene["height"]) == (1633, 1225)
+    acc = scene["accuracy"]
+    assert acc["markers"] == 8 and acc["qa_pass"]
+    assert acc["max_abs_error_mm"] < 0.75
+    assert set(scene["stages"]) == {"decode_image_upload", "quads_from_mask", "measure_gap_mm"}
+
+
+def test_compare_flags_only_real_slowdowns():
+    def result(**p50):
+        return {"scenes": {"2MP": {"stages": {k: {"p50_ms": v} for k, v in p50.items()}}}}
+
+    rows = compare(result(a=20.0, b=0.5, c=10.0), result(a=10.0, b=0.1, c=9.0, d=1.0), threshold=0.25, min_delta_ms=2.0)
+
+    assert {r["stage"]: r["regressed"] for r in rows} == {"a": True, "b": False, "c": False}
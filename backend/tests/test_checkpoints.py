@@ -0,0 +1,81 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import torch
+
+from app.services.checkpoints import ChecksumMismatchError, resolve_checkpoint
+from app.services.gap_detection import load_checkpoint
+
+
+@pytest.fixture
+def served_dir(tmp_path):
+    root = tmp_path / "www"
+    root.mkdir()
+    requests = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield root, f"http://127.0.0.1:{server.server_address[1]}", requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_download_is_verified_cached_and_single_flight(tmp_path, served_dir):
+    root, base, requests = served_dir
+    payload = bytes(range(256)) * 10_000  # several chunks
+    (root / "unetpp.pt").write_bytes(payload)
+    digest = hashlib.sha256(payload).hexdigest()
+    cache = tmp_path / "cache"
+
+    fetch = partial(resolve_checkpoint, tmp_path / "missing.pt", f"{base}/unetpp.pt", cache, digest)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(pool.map(lambda _: fetch(), range(4)))
+
+    assert set(paths) == {cache / "unetpp.pt"}
+    assert paths[0].read_bytes() == payload
+    assert requests == ["/unetpp.pt"]
+    assert sorted(p.name for p in cache.iterdir()) == ["unetpp.pt", "unetpp.pt.lock"]
+
+    # A corrupted cache entry is fetched again.
+    paths[0].write_bytes(b"truncated")
+    assert fetch().read_bytes() == payload
+    assert len(requests) == 2
+
+
+def test_checksum_mismatch_leaves_nothing_behind(tmp_path, served_dir):
+    root, base, _requests = served_dir
+    (root / "dlv3.pt").write_bytes(b"not the weights you are looking for")
+    cache = tmp_path / "cache"
+
+    with pytest.raises(ChecksumMismatchError):
+        resolve_checkpoint(tmp_path / "missing.pt", f"{base}/dlv3.pt", cache, "0" * 64)
+
+    assert not (cache / "dlv3.pt").exists()
+    assert not list(cache.glob("*.tmp"))
+
+
+def test_load_checkpoint_memory_maps_zip_checkpoints(tmp_path):
+    torch.manual_seed(0)
+    src = torch.nn.Conv2d(3, 1, kernel_size=3)
+    dst = torch.nn.Conv2d(3, 1, kernel_size=3)
+    torch.save({"model": src.state_dict()}, tmp_path / "zip.pt")
+    torch.save(src.state_dict(), tmp_path / "legacy.pt", _use_new_zipfile_serialization=False)
+
+    for name in ("zip.pt", "legacy.pt"):
+        load_checkpoint(dst, tmp_path / name, torch.device("cpu"))
+        assert torch.equal(dst.weight, src.weight)
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.executor import ExecutorBusyError, PipelineExecutor
+
+
+def test_executor_rejects_beyond_queue_limit():
+    executor = PipelineExecutor(backend="thread", workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorBusyError):
+            await executor.run(lambda: None)
+        release.set()
+        return await first
+
+    try:
+        assert asyncio.run(scenario()) is True
+    finally:
+        executor.shutdown()
+
+
+def test_cancelled_caller_keeps_slot_until_work_ends():
+    executor = PipelineExecutor(backend="thread", workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        first.cancel()  # e.g. the client disconnected
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorBusyError):
+            await asyncio.wait_for(executor.run(lambda: None), 1.0)
+        release.set()
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if executor._inflight == 0:
+                break
+        return await executor.run(lambda: "ran")
+
+    try:
+        assert asyncio.run(scenario()) == "ran"
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,216 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+from app.core.config import settings
+from app.services import gap_detection
+from app.services.gap_detection import (
+    NORMALIZE_MEAN,
+    NORMALIZE_STD,
+    CoarseFill,
+    ModelRegistry,
+    TileStats,
+    _forward_tiles,
+    _quads_from_mask,
+    fused_tile_inference,
+    prepare_tiles,
+    stream_tile_inference,
+    tile_inference,
+)
+
+
+class _TinySeg(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 1, kernel_size=3, padding=1)
+
+    def forward(self, x):
+        return self.conv(x)
+
+
+def _patch_models(monkeypatch, builds):
+    def fake_build(name, encoder):
+        builds.append(name)
+        return _TinySeg()
+
+    monkeypatch.setattr(gap_detection, "build_model", fake_build)
+    monkeypatch.setattr(gap_detection, "load_checkpoint", lambda model, path, device: None)
+    monkeypatch.setattr(gap_detection, "_model_checkpoint", lambda name: Path(f"/tmp/{name}.pt"))
+    monkeypatch.setattr(settings, "gap_tile_size", 32)
+    monkeypatch.setattr(settings, "gap_device", "cpu")
+
+
+def test_registry_loads_each_model_once(monkeypatch):
+    builds = []
+    _patch_models(monkeypatch, builds)
+    registry = ModelRegistry()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        entries = list(pool.map(lambda _: registry.get("unetpp"), range(16)))
+
+    assert builds == ["unetpp"]
+    assert all(e is entries[0] for e in entries)
+    assert not entries[0].model.training
+    assert set(registry.timings()["unetpp"]) == {"load_ms", "warmup_ms"}
+
+
+def test_batched_tile_inference_matches_single_tile():
+    torch.manual_seed(0)
+    model = _TinySeg().eval()
+    img = np.random.default_rng(0).integers(0, 256, size=(70, 90, 3), dtype=np.uint8)
+    args = (img, 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD, torch.device("cpu"))
+
+    single = tile_inference(model, *args, batch_tiles=1)
+    batched = tile_inference(model, *args, batch_tiles=5)
+
+    assert single.shape == (70, 90)
+    np.testing.assert_allclose(batched, single, atol=1e-6)
+
+
+def test_fused_inference_matches_weighted_average():
+    torch.manual_seed(0)
+    model_a, model_b = _TinySeg().eval(), _TinySeg().eval()
+    device = torch.device("cpu")
+    img = np.random.default_rng(1).integers(0, 256, size=(50, 70, 3), dtype=np.uint8)
+    args = (img, 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD, device)
+    expected = (tile_inference(model_a, *args) * 0.75 + tile_inference(model_b, *args) * 0.25) / 1.0
+
+    tiled = prepare_tiles(img, 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD)
+    branches = [(partial(_forward_tiles, model_a, device), 0.75), (partial(_forward_tiles, model_b, device), 0.25)]
+    for parallel in (False, True):
+        fused = fused_tile_inference(tiled, branches, batch_tiles=4, parallel=parallel)
+        np.testing.assert_allclose(fused, expected, atol=1e-6)
+
+
+def test_parallel_fusion_overlaps_across_requests(monkeypatch):
+    monkeypatch.setattr(settings, "pipeline_workers", 3)
+    monkeypatch.setattr(settings, "jobs_workers", 0)
+    monkeypatch.setattr(gap_detection, "_fusion_pool", None)
+    # Every branch of three concurrent requests must be running at once.
+    barrier = threading.Barrier(6, timeout=5.0)
+
+    def runner(tiles):
+        barrier.wait()
+        return np.ones((len(tiles), 32, 32), dtype=np.float32)
+
+    tiled = prepare_tiles(np.zeros((32, 32, 3), dtype=np.uint8), 32, 0.0, NORMALIZE_MEAN, NORMALIZE_STD)
+    branches = [(runner, 0.5), (runner, 0.5)]
+    try:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            maps = list(pool.map(lambda _: fused_tile_inference(tiled, branches, batch_tiles=1, parallel=True), range(3)))
+    finally:
+        gap_detection._fusion_pool.shutdown()
+    assert all(np.allclose(m, 1.0) for m in maps)
+
+
+def test_detect_gaps_runs_fusion_with_registry_models(monkeypatch):
+    _patch_models(monkeypatch, [])
+    monkeypatch.setattr(gap_detection, "model_registry", ModelRegistry())
+    monkeypatch.setattr(settings, "gap_use_fusion", True)
+    monkeypatch.setattr(settings, "gap_fusion_thr", 0.0)
+    monkeypatch.setattr(settings, "gap_min_length_px", 1.0)
+    img = np.random.default_rng(2).integers(0, 256, size=(40, 60, 3), dtype=np.uint8)
+
+    result = gap_detection.detect_gaps(img)
+
+    assert result.prob_map.shape == result.mask.shape == (40, 60)
+    assert len(result.quads) == 1
+
+
+def test_coarse_fill_skips_tiles_without_coarse_signal():
+    img = np.zeros((100, 100, 3), dtype=np.uint8)
+    tiled = prepare_tiles(img, 32, 0.0, NORMALIZE_MEAN, NORMALIZE_STD)
+    coarse = np.zeros((25, 25), dtype=np.float32)
+    coarse[2, 2] = 0.9
+    fill = CoarseFill(coarse, 100, 100, 32, thr=0.3)
+    seen = []
+
+    def runner(tiles):
+        seen.append(len(tiles))
+        return np.ones((len(tiles), 32, 32), dtype=np.float32)
+
+    stats = TileStats()
+    events = []
+    prob = fused_tile_inference(
+        tiled, [(runner, 1.0)], batch_tiles=0, fill=fill, stats=stats, progress=lambda *e: events.append(e)
+    )
+
+    assert (stats.tiles_total, stats.tiles_run, stats.tiles_skipped) == (16, 1, 15)
+    assert events == [(15, 16, 0), (16, 16, 1)]
+    assert seen == [1]
+    assert prob[5, 5] == 1.0 and prob[90, 90] == 0.0
+
+
+def test_detect_gaps_roi_maps_quads_to_full_image(monkeypatch):
+    _patch_models(monkeypatch, [])
+    monkeypatch.setattr(gap_detection, "model_registry", ModelRegistry())
+    monkeypatch.setattr(settings, "gap_use_fusion", False)
+    monkeypatch.setattr(settings, "gap_unetpp_thr", 0.0)
+    monkeypatch.setattr(settings, "gap_min_length_px", 1.0)
+    img = np.zeros((100, 120, 3), dtype=np.uint8)
+
+    result = gap_detection.detect_gaps(img, roi=(40, 30, 80, 70))
+
+    assert result.prob_map.shape == (40, 40)
+    xs = [p[0] for p in result.quads[0].points]
+    ys = [p[1] for p in result.quads[0].points]
+    assert 39 <= min(xs) and max(xs) <= 80 and 29 <= min(ys) and max(ys) <= 70
+
+
+def test_streaming_inference_matches_full_buffer():
+    torch.manual_seed(0)
+    model_a, model_b = _TinySeg().eval(), _TinySeg().eval()
+    device = torch.device("cpu")
+    branches = [(partial(_forward_tiles, model_a, device), 0.75), (partial(_forward_tiles, model_b, device), 0.75)]
+    img_bgr = np.random.default_rng(3).integers(0, 256, size=(75, 101, 3), dtype=np.uint8)
+
+    tiled = prepare_tiles(img_bgr[:, :, ::-1], 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD)
+    expected = fused_tile_inference(tiled, branches, batch_tiles=3)
+    thr = float(np.median(expected))
+
+    stats = TileStats()
+    mask, prob = stream_tile_inference(
+        img_bgr, branches, 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD, thr, batch_tiles=3, stats=stats
+    )
+
+    assert stats.tiles_total == len(tiled.origins)
+    np.testing.assert_allclose(prob.astype(np.float32), expected, atol=1e-3)
+    np.testing.assert_array_equal(mask, (expected >= thr).astype(np.uint8) * 255)
+
+
+def _reference_quads(mask, min_area_px, min_len_px, max_quads):
+    # Straightforward per-label implementation the optimized version must match.
+    num, labels, stats, _ = cv2.connectedComponentsWithStats((mask > 0).astype(np.uint8), connectivity=8)
+    candidates = []
+    for label in range(1, num):
+        area = int(stats[label, cv2.CC_STAT_AREA])
+        if area < min_area_px:
+            continue
+        ys, xs = np.where(labels == label)
+        if xs.size < 4:
+            continue
+        rect = cv2.minAreaRect(np.column_stack([xs, ys]).astype(np.float32))
+        if min(rect[1]) < float(min_len_px):
+            continue
+        candidates.append((area, [(int(round(p[0])), int(round(p[1]))) for p in cv2.boxPoints(rect)]))
+    candidates.sort(key=lambda x: -x[0])
+    if max_quads > 0:
+        candidates = candidates[:max_quads]
+    return [pts for _area, pts in candidates]
+
+
+def test_quads_from_mask_matches_reference():
+    rng = np.random.default_rng(4)
+    noise = (rng.random((300, 400)) > 0.6).astype(np.uint8) * 255
+    mask = cv2.morphologyEx(noise, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    cv2.rectangle(mask, (10, 10), (120, 40), 255, -1)
+    cv2.rectangle(mask, (200, 150), (230, 290), 255, -1)
+
+    for min_area, min_len, max_quads in [(4, 1.0, 0), (10, 3.0, 0), (10, 3.0, 5), (400, 20.0, 1), (1, 0.0, 3)]:
+        got = [q.points for q in _quads_from_mask(mask, min_area, min_len, max_quads)]
+        assert got == _reference_quads(mask, min_area, min_len, max_quads)
@@ -1,5 +1,47 @@
+import json
+import os
+
 import numpy as np
 
+from app.core.config import settings
+from app.services.aruco_detect import build_marker_detections, detect_aruco_markers
+from app.services.homography import _marker_corners_mm, compute_homography, inspection_roi_px, load_board_index
+
 def test_homography_cond_finite():
     H = np.eye(3)
     assert np.isfinite(np.linalg.cond(H))
+
+
+def test_board_index_matches_layout_and_reloads_on_mtime(tmp_path):
+    layout = {"markers": {"3": {"x_mm": 10.0, "y_mm": 20.0, "rotation_deg": 90.0}, "7": {"x_mm": 0.0, "y_mm": 0.0}}}
+    path = tmp_path / "layout.json"
+    path.write_text(json.dumps(layout))
+
+    index = load_board_index(str(path), 50.0)
+    assert index is load_board_index(str(path), 50.0)
+    assert index.rows(np.array([7, 3, 4, 99])).tolist() == [1, 0, -1, -1]
+    np.testing.assert_array_equal(index.corners_mm[0], _marker_corners_mm(10.0, 20.0, 50.0, 90.0))
+
+    layout["markers"]["4"] = {"x_mm": 5.0, "y_mm": 5.0}
+    path.write_text(json.dumps(layout))
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 1_000_000))
+    assert load_board_index(str(path), 50.0).rows(np.array([4])).tolist() == [1]
+
+
+def test_compute_homography_multi_marker(board_bgr):
+    gray, corners, ids = detect_aruco_markers(board_bgr, "DICT_4X4_50")
+    dets = build_marker_detections(gray, corners, ids, min_area=800.0, min_laplacian=40.0)
+    h, w = board_bgr.shape[:2]
+    hom = compute_homography(dets, settings.board_layout_path, 50.0, 40.0, 3.0, 1e7, 5.0, 1e9, w, h)
+    assert hom.mode_used == "multi_marker"
+    assert hom.total_corr == 4 * len(dets) == 32
+    assert hom.qa_pass and hom.reproj_rms_mm < 0.5
+    assert abs(hom.H_pix_to_mm[0, 0] / hom.H_pix_to_mm[2, 2] - 0.25) < 1e-3
+
+
+def test_inspection_roi_projects_board_rect():
+    # 4 px per mm, board origin at pixel (100, 50).
+    H_mm_to_pix = np.array([[4.0, 0.0, 100.0], [0.0, 4.0, 50.0], [0.0, 0.0, 1.0]])
+    assert inspection_roi_px(H_mm_to_pix, [0, 0, 100, 50], 10, 2000, 2000) == (90, 40, 511, 261)
+    assert inspection_roi_px(H_mm_to_pix, [0, 0, 1000, 1000], 0, 800, 600) == (100, 50, 800, 600)
+    assert inspection_roi_px(H_mm_to_pix, [-500, -500, -400, -400], 0, 800, 600) is None
@@ -0,0 +1,59 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.services.image_io import (
+    ImageTooLargeError,
+    decode_image,
+    decode_image_fast,
+    decode_image_upload,
+    read_image_header,
+)
+
+
+def _jpeg(arr_rgb: np.ndarray, orientation: int = 1) -> bytes:
+    im = Image.fromarray(arr_rgb)
+    exif = im.getexif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", exif=exif, quality=95)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_fast_decode_matches_pil_orientation(orientation):
+    rng = np.random.default_rng(orientation)
+    arr = cv2.GaussianBlur((rng.random((48, 80, 3)) * 255).astype(np.uint8), (0, 0), 2)
+    data = _jpeg(arr, orientation)
+
+    fast, scale = decode_image_fast(data)
+    assert scale == 1.0
+    np.testing.assert_array_equal(fast, decode_image_upload(data))
+
+
+def test_fast_decode_reduces_jpeg_and_guards_size():
+    data = _jpeg(np.full((800, 1200, 3), 128, dtype=np.uint8), orientation=6)
+
+    bgr, scale = decode_image_fast(data, max_dim=300)
+    assert scale == 0.25
+    assert bgr.shape[:2] == (300, 200)  # rotated and reduced by 4
+
+    with pytest.raises(ImageTooLargeError):
+        decode_image(data, decoder="fast", max_pixels=500_000)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(data, decoder="pil", max_pixels=500_000)
+    # A reduced decode only allocates the reduced buffer.
+    assert decode_image(data, decoder="fast", max_dim=300, max_pixels=500_000)[0].shape[:2] == (300, 200)
+
+
+def test_pixel_guard_beyond_pillow_bomb_limit(huge_png):
+    with pytest.raises(ImageTooLargeError, match="decompression bomb"):
+        read_image_header(huge_png)
+    for decoder in ("pil", "fast"):
+        for max_pixels in (100_000_000, 0):
+            with pytest.raises(ImageTooLargeError):
+                decode_image(huge_png, decoder=decoder, max_pixels=max_pixels)
+    assert Image.MAX_IMAGE_PIXELS is not None  # Pillow's own guard stays on
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import torch
+
+from app.services.gap_detection import NORMALIZE_MEAN, NORMALIZE_STD, tile_inference
+from app.services.inference_scheduler import BatchingScheduler, SchedulerClosedError
+
+
+def test_scheduler_batches_across_requests_and_preserves_results():
+    torch.manual_seed(0)
+    model = torch.nn.Conv2d(3, 1, kernel_size=3, padding=1).eval()
+    device = torch.device("cpu")
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, size=(60, 60, 3), dtype=np.uint8) for _ in range(4)]
+    expected = [tile_inference(model, img, 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD, device) for img in images]
+
+    sched = BatchingScheduler("test", model, device, max_batch=8, max_wait_ms=50.0)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(
+                lambda img: tile_inference(
+                    model, img, 32, 0.25, NORMALIZE_MEAN, NORMALIZE_STD, device, batch_tiles=0, runner=sched.run
+                ),
+                images,
+            ))
+    finally:
+        sched.close()
+
+    for got, want in zip(results, expected):
+        np.testing.assert_allclose(got, want, atol=1e-5)
+    assert sched.tiles_run == 4 * 9
+    assert sched.batches_run < sched.tiles_run
+
+
+def test_closed_scheduler_rejects_work():
+    model = torch.nn.Conv2d(3, 1, kernel_size=3, padding=1).eval()
+    sched = BatchingScheduler("test", model, torch.device("cpu"), max_batch=8, max_wait_ms=200.0)
+    queued = sched.submit(torch.zeros(3, 8, 8))
+    sched.close()
+    sched.close()
+
+    assert queued.result(timeout=1.0).shape == (8, 8)  # queued before close: still run
+    with pytest.raises(SchedulerClosedError):
+        sched.run([torch.zeros(3, 8, 8)])
@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.jobs import JobManager, JobQueueFullError
+
+
+def _wait(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not manager.get(job_id).done:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return manager.get(job_id)
+
+
+def test_measure_job_reports_stages_and_result(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/jobs/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={"mode": "2", "points_json": json.dumps(points), "annotate": "none"},
+        )
+        assert resp.status_code == 202, resp.text
+        job_id = resp.json()["id"]
+
+        events = client.get(f"/jobs/{job_id}/events")
+        assert events.headers["content-type"].startswith("text/event-stream")
+        stages = [line.split(": ", 1)[1] for line in events.text.splitlines() if line.startswith("event: ")]
+        assert stages == ["queued", "running", "decoded", "markers", "homography", "measured", "succeeded"]
+
+        status = client.get(f"/jobs/{job_id}").json()
+        assert status["status"] == "succeeded"
+        assert abs(status["result"]["measurement_mm"] - 25.0) < 0.1
+        assert client.get("/jobs/deadbeef").status_code == 404
+
+
+def test_measure_job_defers_annotation(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    monkeypatch.setattr(settings, "annotate_mode", "inline")
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/jobs/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={"mode": "2", "points_json": json.dumps(points)},
+        )
+        assert resp.status_code == 202, resp.text
+        client.get(f"/jobs/{resp.json()['id']}/events")
+        result = client.get(f"/jobs/{resp.json()['id']}").json()["result"]
+
+        assert result["annotated_image_base64_png"] == "" and result["annotation_id"]
+        annotation = client.get(f"/measure/{result['annotation_id']}/annotation")
+        assert annotation.status_code == 200
+        assert annotation.headers["content-type"].startswith("image/")
+
+
+def test_job_cancellation_and_queue_limit():
+    manager = JobManager(workers=1, max_queue=1, retain_s=60, max_retained=8)
+    started = threading.Event()
+
+    def slow(progress):
+        started.set()
+        for i in range(500):
+            progress("tiles", done=i, total=500)
+            time.sleep(0.01)
+        return "done"
+
+    running = manager.submit(slow)
+    queued = manager.submit(slow)
+    with pytest.raises(JobQueueFullError):
+        manager.submit(slow)
+
+    assert started.wait(5.0)
+    assert manager.cancel(queued.id).status == "cancelled"
+    manager.cancel(running.id)
+    job = _wait(manager, running.id)
+    assert job.status == "cancelled"
+    assert job.tiles_total == 500 and job.tiles_done < 500
+    assert manager.events_since(job, 0)[-1]["stage"] == "cancelled"
+    manager.shutdown()
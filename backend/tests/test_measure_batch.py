@@ -0,0 +1,57 @@
+import io
+import json
+import zipfile
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+_TWO_POINTS = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+
+
+def _lines(resp):
+    return sorted((json.loads(line) for line in resp.text.splitlines() if line), key=lambda r: r["index"])
+
+
+def test_batch_multipart_streams_one_line_per_image(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    items = [
+        {"mode": "2", "points": _TWO_POINTS},
+        {"file": "wide.png", "mode": "2", "points": [{"x": 100.0, "y": 100.0}, {"x": 300.0, "y": 100.0}], "annotate": "inline"},
+        {"mode": "4", "points": _TWO_POINTS},
+    ]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/measure/batch",
+            files=[
+                ("images", ("a.png", board_png, "image/png")),
+                ("images", ("wide.png", board_png, "image/png")),
+                ("images", ("bad.png", board_png, "image/png")),
+            ],
+            data={"items_json": json.dumps(items)},
+        )
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    first, wide, bad = _lines(resp)
+    assert first["status"] == 200 and abs(first["result"]["measurement_mm"] - 25.0) < 0.1
+    assert first["result"]["annotated_image_base64_png"] == ""
+    assert wide["status"] == 200 and abs(wide["result"]["measurement_mm"] - 50.0) < 0.1
+    assert wide["result"]["annotated_image_base64_png"]
+    assert bad["status"] == 400 and bad["filename"] == "bad.png"
+
+
+def test_batch_zip_with_manifest(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("manifest.json", json.dumps({"items": [{"file": f"{i}.png", "mode": "2", "points": _TWO_POINTS} for i in range(3)]}))
+        for i in range(3):
+            zf.writestr(f"{i}.png", board_png)
+        zf.writestr("notes.txt", "ignored")
+    with TestClient(app) as client:
+        resp = client.post("/measure/batch", files={"archive": ("shift.zip", buf.getvalue(), "application/zip")})
+    assert resp.status_code == 200, resp.text
+    lines = _lines(resp)
+    assert [line["filename"] for line in lines] == ["0.png", "1.png", "2.png"]
+    assert all(line["status"] == 200 for line in lines)
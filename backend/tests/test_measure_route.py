@@ -0,0 +1,209 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+
+def test_manual_measure_runs_off_event_loop(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    # Two points 100 px apart on a 4 px/mm board -> 25 mm.
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={"mode": "2", "points_json": json.dumps(points)},
+        )
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["confidence"] == "HIGH"
+    assert abs(body["measurement_mm"] - 25.0) < 0.1
+    assert body["process_peak_rss_mb"] > 0
+
+
+def test_measure_downscaled_jpeg_multipart(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={
+                "mode": "2",
+                "points_json": json.dumps(points),
+                "annotate_max_dim": "400",
+                "annotate_format": "jpeg",
+                "transport": "multipart",
+            },
+        )
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"].startswith("multipart/mixed")
+    boundary = resp.headers["content-type"].split("boundary=")[1].encode("ascii")
+    parts = [p for p in resp.content.split(b"--" + boundary) if p.strip(b"-\r\n")]
+    json_part, image_part = (p.split(b"\r\n\r\n", 1)[1][:-2] for p in parts)
+
+    body = json.loads(json_part)
+    assert body["annotated_image_base64_png"] == ""
+    assert body["annotated_image_media_type"] == "image/jpeg"
+    annotated = cv2.imdecode(np.frombuffer(image_part, np.uint8), cv2.IMREAD_COLOR)
+    assert max(annotated.shape[:2]) == 400
+
+
+def test_measure_deferred_annotation(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={"mode": "2", "points_json": json.dumps(points), "annotate": "deferred"},
+        )
+        assert resp.status_code == 200, resp.text
+        body = resp.json()
+        assert body["annotated_image_base64_png"] == ""
+        assert abs(body["measurement_mm"] - 25.0) < 0.1
+
+        img = client.get(f"/measure/{body['annotation_id']}/annotation", params={"max_dim": 300, "format": "jpeg"})
+        assert img.status_code == 200
+        assert img.headers["content-type"] == "image/jpeg"
+        annotated = cv2.imdecode(np.frombuffer(img.content, np.uint8), cv2.IMREAD_COLOR)
+        assert max(annotated.shape[:2]) == 300
+
+        assert client.get("/measure/deadbeef/annotation").status_code == 404
+
+
+def test_measure_rejects_oversized_image(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    monkeypatch.setattr(settings, "max_image_pixels", 10_000)
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        resp = client.post(
+            "/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={"mode": "2", "points_json": json.dumps(points)},
+        )
+    assert resp.status_code == 413
+
+
+def test_measure_rejects_image_over_pillow_bomb_limit(monkeypatch, huge_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    with TestClient(app) as client:
+        for decoder in ("pil", "fast"):
+            monkeypatch.setattr(settings, "image_decoder", decoder)
+            resp = client.post(
+                "/measure",
+                files={"image": ("huge.png", huge_png, "image/png")},
+                data={"mode": "2", "points_json": json.dumps(points)},
+            )
+            assert resp.status_code == 413, resp.text
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float16])  # float16: GM_GAP_STREAMING
+def test_rethreshold_reuses_stored_prob_map(monkeypatch, board_png, dtype):
+    from app.services import pipeline
+    from app.services.gap_detection import GapDetectionResult, quads_from_prob_map
+
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    prob = np.zeros((1188, 840), dtype=dtype)
+    prob[300:700, 400:424] = 0.9  # 6 mm at 4 px/mm
+    prob[300:700, 600:648] = 0.6  # 12 mm, below the initial threshold
+
+    def fake_detect_gaps(bgr, roi=None, progress=None):
+        quads = quads_from_prob_map(prob, 0.8, 5, 1, 400, 20.0, 0)
+        return GapDetectionResult(quads=quads, prob_map=prob, mask=(prob >= 0.8).astype(np.uint8))
+
+    monkeypatch.setattr(pipeline, "detect_gaps", fake_detect_gaps)
+    with TestClient(app) as client:
+        resp = client.post(
+            "/measure",
+            files={"image": ("board.png", board_png, "image/png")},
+            data={"mode": "auto", "annotate": "none", "keep_prob_map": "true"},
+        )
+        assert resp.status_code == 200, resp.text
+        body = resp.json()
+        assert len(body["measurements"]) == 1
+        assert abs(body["measurement_mm"] - 6.0) < 0.5
+
+        url = f"/measure/{body['prob_map_id']}/rethreshold"
+        lower = client.post(url, json={"thr": 0.5})
+        assert lower.status_code == 200, lower.text
+        assert len(lower.json()["measurements"]) == 2
+        float16_note = any("float16" in note for note in lower.json()["qa_notes"])
+        assert float16_note == (dtype == np.float16)
+        assert abs(lower.json()["measurement_mm"] - 12.0) < 0.5
+
+        assert client.post(url, json={"thr": 0.95}).status_code == 422
+        assert client.post("/measure/deadbeef/rethreshold", json={}).status_code == 404
+
+
+def test_measure_server_timing_and_metrics(monkeypatch, board_png):
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    points = [{"x": 100.0, "y": 100.0}, {"x": 200.0, "y": 100.0}]
+    request = dict(
+        files={"image": ("board.png", board_png, "image/png")},
+        data={"mode": "2", "points_json": json.dumps(points)},
+    )
+    with TestClient(app) as client:
+        resp = client.post("/measure", **request)
+        metrics = client.get("/metrics")
+
+        monkeypatch.setattr(settings, "metrics_enabled", False)
+        plain = client.post("/measure", **request)
+        disabled = client.get("/metrics")
+
+    assert resp.status_code == 200, resp.text
+    timing = dict(part.split(";dur=") for part in resp.headers["server-timing"].split(", "))
+    assert set(timing) == {"decode", "markers", "homography", "measure", "annotate", "pipeline", "queue", "total"}
+    assert float(timing["total"]) >= float(timing["pipeline"]) > 0
+
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = dict(line.rsplit(" ", 1) for line in metrics.text.splitlines() if not line.startswith("#"))
+    assert int(lines['gm_stage_duration_seconds_count{stage="markers",mode="2"}']) >= 1
+    assert int(lines['gm_stage_duration_seconds_bucket{stage="markers",mode="2",le="+Inf"}']) >= 1
+    assert float(lines["gm_markers_found_total"]) >= 8
+    assert float(lines['gm_measure_requests_total{mode="2",status="200"}']) >= 1
+
+    assert plain.status_code == 200 and "server-timing" not in plain.headers
+    assert disabled.status_code == 404
+
+
+def test_auto_roi_needs_board_homography(monkeypatch, board_bgr):
+    from app.services import pipeline
+    from app.services.gap_detection import GapDetectionResult, quads_from_prob_map
+
+    monkeypatch.setattr(settings, "gap_preload_models", False)
+    monkeypatch.setattr(settings, "gap_roi_mm", [0.0, 0.0, 40.0, 40.0])
+    rois = []
+
+    def fake_detect_gaps(bgr, roi=None, progress=None):
+        rois.append(roi)
+        prob = np.zeros(bgr.shape[:2], dtype=np.float32)
+        prob[300:700, 400:424] = 0.9
+        quads = quads_from_prob_map(prob, 0.8, 5, 1, 400, 20.0, 0)
+        return GapDetectionResult(quads=quads, prob_map=prob, mask=(prob >= 0.8).astype(np.uint8))
+
+    monkeypatch.setattr(pipeline, "detect_gaps", fake_detect_gaps)
+    # Keep only marker 0: compute_homography falls back to single_marker.
+    single = board_bgr.copy()
+    single[:, 400:] = 255
+    single[380:] = 255
+    with TestClient(app) as client:
+        for img in (board_bgr, single):
+            ok, buf = cv2.imencode(".png", img)
+            resp = client.post(
+                "/measure",
+                files={"image": ("board.png", buf.tobytes(), "image/png")},
+                data={"mode": "auto", "annotate": "none"},
+            )
+            assert resp.status_code == 200, resp.text
+
+    multi_roi, single_roi = rois
+    assert multi_roi is not None and multi_roi[:2] == (0, 0)
+    assert single_roi is None
@@ -0,0 +1,175 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from app.core.config import settings
+from app.services import gap_detection
+from app.services.gap_detection import (
+    NORMALIZE_MEAN,
+    NORMALIZE_STD,
+    ModelRegistry,
+    _forward_tiles,
+    build_model,
+    fused_tile_inference,
+    prepare_tiles,
+)
+from app.services.model_backends import OnnxSegModel, ensure_artifact, export_onnx, read_source
+from app.services.quant_eval import QuantEvalRow, evaluate_precision, list_images, summarize
+
+pytest.importorskip("onnxruntime")
+
+
+class _TinySeg(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 1, kernel_size=3, padding=1)
+
+    def forward(self, x):
+        return self.conv(x)
+
+
+def test_onnx_prob_map_matches_eager_unetpp(tmp_path):
+    torch.manual_seed(0)
+    model = build_model("unetpp", "timm-efficientnet-b1").eval()
+    session = OnnxSegModel(export_onnx(model, tmp_path / "unetpp.onnx", tile_size=64))
+
+    rng = np.random.default_rng(0)
+    img = (rng.random((100, 90, 3)) * 255).astype(np.uint8)
+    tiled = prepare_tiles(img, 64, 0.25, NORMALIZE_MEAN, NORMALIZE_STD)
+    cpu = torch.device("cpu")
+    eager = fused_tile_inference(tiled, [(partial(_forward_tiles, model, cpu), 1.0)], batch_tiles=3)
+    onnx = fused_tile_inference(tiled, [(partial(_forward_tiles, session, cpu), 1.0)], batch_tiles=3)
+
+    assert np.abs(eager - onnx).max() < 1e-4
+
+
+@pytest.fixture
+def tiny_eager(monkeypatch, tmp_path):
+    torch.manual_seed(0)
+    eager = _TinySeg().eval()
+    monkeypatch.setattr(gap_detection, "build_model", lambda name, encoder: eager)
+    monkeypatch.setattr(gap_detection, "load_checkpoint", lambda model, path, device: None)
+    monkeypatch.setattr(gap_detection, "_model_checkpoint", lambda name: Path(f"/tmp/{name}.pt"))
+    monkeypatch.setattr(settings, "gap_tile_size", 32)
+    monkeypatch.setattr(settings, "gap_device", "cpu")
+    monkeypatch.setattr(settings, "gap_export_dir", str(tmp_path / "export"))
+    monkeypatch.setattr(settings, "gap_auto_export", True)
+    return eager
+
+
+@pytest.mark.parametrize("backend", ["onnx", "torchscript"])
+def test_registry_exports_and_serves_backend(monkeypatch, tiny_eager, backend):
+    eager = tiny_eager
+    monkeypatch.setattr(settings, "gap_backend", backend)
+
+    registry = ModelRegistry()
+    entry = registry.get("unetpp")
+    assert entry.backend == backend and entry.ckpt_path.exists()
+
+    tiles = [torch.randn(3, 32, 32) for _ in range(2)]
+    expected = _forward_tiles(eager, torch.device("cpu"), tiles)
+    np.testing.assert_allclose(registry.runner("unetpp")(tiles), expected, atol=1e-5)
+
+
+def test_registry_reexports_artifacts_built_from_another_source(monkeypatch, tmp_path, tiny_eager):
+    ckpt = tmp_path / "unetpp.pt"
+    ckpt.write_bytes(b"v1")
+    monkeypatch.setattr(gap_detection, "_model_checkpoint", lambda name: ckpt)
+    monkeypatch.setattr(settings, "gap_backend", "onnx")
+
+    def loaded(precision="fp32"):
+        entry = ModelRegistry({"unetpp": precision}).get("unetpp")
+        return entry.ckpt_path, entry.ckpt_path.stat().st_mtime_ns, read_source(entry.ckpt_path)
+
+    path, mtime, source = loaded()
+    assert source["checkpoint_sha256"] == hashlib.sha256(b"v1").hexdigest()
+    assert loaded()[1] == mtime  # same source: reused
+
+    ckpt.write_bytes(b"v2-longer")
+    _path, mtime2, source2 = loaded()
+    assert mtime2 != mtime and source2["checkpoint_sha256"] == hashlib.sha256(b"v2-longer").hexdigest()
+    int8_path, _mtime, int8_source = loaded("int8_dynamic")
+    assert int8_source == source2
+
+    monkeypatch.setattr(settings, "gap_encoder", "resnet18")
+    monkeypatch.setattr(settings, "gap_auto_export", False)
+    for precision in ("fp32", "int8_dynamic"):
+        with pytest.raises(RuntimeError, match="export-models"):
+            loaded(precision)
+
+
+def test_concurrent_ensure_artifact_exports_once(tmp_path, tiny_eager):
+    dst = tmp_path / "export" / "unetpp.onnx"
+    builds = []
+
+    def build():
+        builds.append(1)
+        return tiny_eager
+
+    source = {"model": "unetpp", "encoder": "e", "checkpoint_sha256": "abc"}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(pool.map(lambda _: ensure_artifact("onnx", dst, 32, build, source), range(4)))
+
+    assert paths == [dst] * 4 and len(builds) == 1
+    assert read_source(dst) == source
+    assert sorted(p.name for p in dst.parent.iterdir()) == ["unetpp.onnx", "unetpp.onnx.lock", "unetpp.onnx.source.json"]
+    OnnxSegModel(dst)
+
+
+@pytest.mark.parametrize("precision", ["int8_dynamic", "int8_static"])
+def test_int8_registry_tracks_fp32(monkeypatch, tmp_path, tiny_eager, precision):
+    calib = tmp_path / "calib"
+    calib.mkdir()
+    rng = np.random.default_rng(1)
+    for i in range(3):
+        cv2.imwrite(str(calib / f"{i}.png"), (rng.random((40, 48, 3)) * 255).astype(np.uint8))
+    monkeypatch.setattr(settings, "gap_backend", "torch")
+    monkeypatch.setattr(settings, "gap_calibration_dir", str(calib))
+
+    registry = ModelRegistry({"unetpp": precision})
+    entry = registry.get("unetpp")
+    assert (entry.backend, entry.precision) == ("onnx", precision)
+    assert entry.ckpt_path.name == f"unetpp.{precision}.onnx"
+
+    tiles = [torch.randn(3, 32, 32) for _ in range(2)]
+    expected = _forward_tiles(tiny_eager, torch.device("cpu"), tiles)
+    err = np.abs(registry.runner("unetpp")(tiles) - expected)
+    assert err.mean() < 0.01 and err.max() < 0.1
+
+
+def test_bf16_falls_back_without_native_support(monkeypatch, tiny_eager):
+    monkeypatch.setattr(settings, "gap_backend", "torch")
+    monkeypatch.setattr(gap_detection, "cpu_supports_bf16", lambda: False)
+    assert ModelRegistry({"unetpp": "bf16"}).get("unetpp").precision == "fp32"
+
+    monkeypatch.setattr(gap_detection, "cpu_supports_bf16", lambda: True)
+    registry = ModelRegistry({"unetpp": "bf16"})
+    assert registry.get("unetpp").precision == "bf16"
+    tiles = [torch.randn(3, 32, 32)]
+    expected = _forward_tiles(tiny_eager, torch.device("cpu"), tiles)
+    np.testing.assert_allclose(registry.runner("unetpp")(tiles), expected, atol=0.05)
+
+
+def test_quant_eval_gate(monkeypatch, tmp_path, tiny_eager, board_png):
+    monkeypatch.setattr(settings, "gap_backend", "torch")
+    (tmp_path / "board.png").write_bytes(board_png)
+
+    rows = evaluate_precision(list_images(tmp_path), {"unetpp": "fp32", "deeplabv3plus": "fp32"})
+    assert len(rows) == 1 and rows[0].mask_iou == 1.0
+    assert rows[0].quads_ref == rows[0].quads_test
+    assert summarize(rows, min_iou=0.99, max_delta_mm=0.01).passed
+
+    off = QuantEvalRow("x.png", mask_iou=0.97, quads_ref=2, quads_test=2, gap_mm_ref=3.0, gap_mm_test=3.2)
+    summary = summarize(rows + [off], min_iou=0.95, max_delta_mm=0.1)
+    assert not summary.passed and summary.max_gap_mm_delta == pytest.approx(0.2)
+
+    dropped = QuantEvalRow("y.png", mask_iou=0.99, quads_ref=3, quads_test=2, gap_mm_ref=3.0, gap_mm_test=3.0)
+    summary = summarize(rows + [dropped], min_iou=0.95, max_delta_mm=0.1)
+    assert not summary.passed and summary.quad_count_mismatches == 1
+    assert summarize(rows + [dropped], min_iou=0.95, max_delta_mm=0.1, max_quad_mismatches=1).passed
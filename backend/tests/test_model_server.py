@@ -0,0 +1,101 @@
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from app.core.config import settings
+from app.services import gap_detection
+from app.services.gap_detection import ModelRegistry
+from app.services.model_server import ModelServer, ModelServerClient, model_server_client
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+class _TinySeg(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 1, kernel_size=3, padding=1)
+
+    def forward(self, x):
+        return self.conv(x)
+
+
+@pytest.fixture
+def served(monkeypatch, tmp_path):
+    torch.manual_seed(0)
+    model = _TinySeg().eval()
+    monkeypatch.setattr(gap_detection, "build_model", lambda name, encoder: model)
+    monkeypatch.setattr(gap_detection, "load_checkpoint", lambda model, path, device: None)
+    monkeypatch.setattr(gap_detection, "_model_checkpoint", lambda name: Path(f"/tmp/{name}.pt"))
+    monkeypatch.setattr(settings, "gap_tile_size", 32)
+    monkeypatch.setattr(settings, "gap_device", "cpu")
+    monkeypatch.setattr(settings, "gap_backend", "torch")
+    monkeypatch.setattr(settings, "gap_use_fusion", True)
+
+    registry = ModelRegistry()
+    server = ModelServer(str(tmp_path / "models.sock"), registry).start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "gap_server_socket", server.path)
+    client = model_server_client()
+    try:
+        yield registry, client
+    finally:
+        client.clear()
+        server.shutdown()
+        registry.clear()
+
+
+def test_detect_gaps_through_model_server_matches_local(monkeypatch, served):
+    registry, client = served
+    monkeypatch.setattr(settings, "gap_fusion_thr", 0.5)
+    monkeypatch.setattr(settings, "gap_min_length_px", 1.0)
+    assert gap_detection.default_registry() is client
+    client.load_all()
+    assert set(client.timings()) == {"unetpp", "deeplabv3plus"}
+
+    rng = np.random.default_rng(3)
+    images = [rng.integers(0, 256, size=(70, 90, 3), dtype=np.uint8) for _ in range(4)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        remote = list(pool.map(gap_detection.detect_gaps, images))
+
+    for img, got in zip(images, remote):
+        want = gap_detection.detect_gaps(img, registry=registry)
+        np.testing.assert_allclose(got.prob_map, want.prob_map, atol=1e-6)
+        assert len(got.quads) == len(want.quads)
+
+
+def test_model_server_reports_errors_and_keeps_serving(monkeypatch, served):
+    _registry, client = served
+    tiles = [torch.zeros(3, 32, 32)]
+    build = gap_detection.build_model
+
+    def build_or_fail(name, encoder):
+        if name == "no-such-model":
+            raise ValueError(f"Unknown model: {name}")
+        return build(name, encoder)
+
+    monkeypatch.setattr(gap_detection, "build_model", build_or_fail)
+
+    with pytest.raises(RuntimeError, match="model server"):
+        client.runner("no-such-model")(tiles)
+    assert client.runner("unetpp")(tiles).shape == (1, 32, 32)
+
+
+def test_server_start_guards_socket_path(served, tmp_path):
+    registry, client = served
+    with pytest.raises(RuntimeError, match="already listening"):
+        ModelServer(client.path, registry).start()
+
+    stale = tmp_path / "stale.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(stale))  # bound but never listening, like a crashed server's leftover
+    ModelServer(str(stale), registry).start().shutdown()
+    assert not stale.exists()
+
+    with pytest.raises(OSError):
+        ModelServerClient(str(tmp_path / "none.sock"), timeout_s=1.0).runner("unetpp")([torch.zeros(3, 32, 32)])
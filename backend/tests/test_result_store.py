@@ -0,0 +1,55 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.schemas.measure import Point
+from app.services import pipeline
+from app.services.result_store import ByteLRUCache
+
+
+def test_cache_single_flight_collapses_concurrent_misses():
+    cache = ByteLRUCache(max_bytes=1024, sizeof=lambda v: 1)
+    calls = []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return "value"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _i: cache.get_or_compute("k", compute), range(8)))
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache.get_or_compute("k", compute) == "value"
+    assert len(calls) == 1
+
+
+def test_cache_evicts_lru_by_bytes_and_does_not_cache_failures():
+    cache = ByteLRUCache(max_bytes=10, sizeof=len)
+    cache.get_or_compute("a", lambda: "x" * 4)
+    cache.get_or_compute("b", lambda: "y" * 4)
+    cache.get_or_compute("a", lambda: "never")  # refresh "a"
+    cache.get_or_compute("c", lambda: "z" * 4)  # evicts "b"
+    assert cache.nbytes == 8
+    assert cache.get_or_compute("b", lambda: "fresh") == "fresh"
+
+    def boom():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("d", boom)
+    assert cache.get_or_compute("d", lambda: "ok") == "ok"
+
+
+def test_resubmitted_upload_skips_marker_detection(monkeypatch, board_png):
+    calls = []
+    detect = pipeline.detect_aruco_markers
+    monkeypatch.setattr(pipeline, "detect_aruco_markers", lambda *a, **k: calls.append(1) or detect(*a, **k))
+
+    first = pipeline.run_measurement(board_png, "2", [Point(x=100, y=100), Point(x=200, y=100)], annotate="none")
+    second = pipeline.run_measurement(board_png, "2", [Point(x=100, y=100), Point(x=300, y=100)], annotate="none")
+    assert len(calls) == 1
+    assert abs(first.response.measurement_mm - 25.0) < 0.1
+    assert abs(second.response.measurement_mm - 50.0) < 0.1
@@ -71,8 +71,9 @@ export async function POST(req: Request): Promise<Response> {
         body: form
     });
 
+    // Pass the body through as bytes: multipart responses carry a raw image part.
     const contentType = res.headers.get("content-type") ?? "application/json";
-    const payload = await res.text();
+    const payload = await res.arrayBuffer();
 
     return new Response(payload, {
         status: res.status,
@@ -1,5 +1,5 @@
-export function AnnotatedImage({ base64Png }: { base64Png: string }) {
-    const src = `data:image/png;base64,${base64Png}`;
+export function AnnotatedImage({ base64Png, mediaType = "image/png" }: { base64Png: string; mediaType?: string }) {
+    const src = `data:${mediaType};base64,${base64Png}`;
     return (
         <div className="rounded-xl overflow-hidden border border-zinc-200 dark:border-zinc-800 bg-zinc-50 dark:bg-zinc-900">
             {/* eslint-disable-next-line @next/next/no-img-element */}
@@ -104,7 +104,10 @@ export function ResultsCard({
                 </div>
             </div>
 
-            <AnnotatedImage base64Png={result.annotated_image_base64_png} />
+            <AnnotatedImage
+                base64Png={result.annotated_image_base64_png}
+                mediaType={result.annotated_image_media_type}
+            />
         </div>
     );
 }
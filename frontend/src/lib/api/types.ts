@@ -10,10 +10,20 @@ export type GapMeasurement = {
     widths_mm?: number[];
 };
 
+export type GapDetectionStats = {
+    tiles_total: number;
+    tiles_skipped: number;
+};
+
 export type MeasureResponse = {
     measurement_mm: number;
     confidence: "HIGH" | "MEDIUM" | "LOW";
     qa_notes: string[];
     annotated_image_base64_png: string;
+    annotated_image_media_type?: string;
     measurements: GapMeasurement[];
+    detection_stats?: GapDetectionStats | null;
+    process_peak_rss_mb?: number | null;
+    annotation_id?: string | null;
+    prob_map_id?: string | null;
 };